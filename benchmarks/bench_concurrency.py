@@ -0,0 +1,203 @@
+"""Load-test the sync and async /email/ask/ views under concurrent users.
+
+    python -m benchmarks.bench_concurrency --users 50 --llm-latency 0.5
+
+Seeds one mailbox from the fake Gmail server, then fires `--users`
+simultaneous questions at the DRF view behind a single-threaded WSGI server
+(one sync gunicorn worker, the previous deployment) and at the async view
+behind uvicorn (one ASGI worker). OpenAI is replaced by fakes that sleep
+for `--llm-latency` per call, so the numbers show how many requests a
+single worker keeps in flight rather than model speed.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import socket
+import statistics
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")  # no Chroma telemetry calls
+
+import django
+
+django.setup()
+
+from django.conf import settings
+
+os.chdir(settings.BENCH_DIR)  # email_cache/ lives in the working directory
+
+from importlib import import_module
+
+import httpx
+import uvicorn
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import path
+from django.utils.crypto import get_random_string
+
+from config.clients import credentials_from_dict
+from config.credential_store import save_credentials
+from config.fetch_email import sync_mailbox
+from config.views import AsyncEmailAssistantView, EmailAssistantView
+
+from . import fakes
+from .fake_gmail import FakeGmail
+
+urlpatterns = [
+    path("sync/ask/", EmailAssistantView.as_view()),
+    path("async/ask/", AsyncEmailAssistantView.as_view()),
+]
+
+CREDENTIALS = {
+    "token": "fake-token",
+    "refresh_token": "fake-refresh",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "client_id": "fake-client",
+    "client_secret": "fake-secret",
+    "scopes": ["https://www.googleapis.com/auth/gmail.readonly"],
+}
+
+
+def seed(num_messages):
+    call_command("migrate", verbosity=0)
+    user, _ = User.objects.get_or_create(username="bench@example.com")
+    with FakeGmail(num_messages=num_messages) as gmail:
+        sync_mailbox(gmail.service(), str(user.id))
+    return user
+
+
+def session_cookies(user):
+    save_credentials(str(user.id), credentials_from_dict(CREDENTIALS))
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    csrf = get_random_string(32)
+    return {
+        settings.SESSION_COOKIE_NAME: session.session_key,
+        settings.CSRF_COOKIE_NAME: csrf,
+    }
+
+
+class BurstWSGIServer(WSGIServer):
+    request_queue_size = 1024  # queue the burst instead of refusing it
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_wsgi():
+    from config.wsgi import application
+
+    server = make_server(
+        "127.0.0.1",
+        0,
+        application,
+        server_class=BurstWSGIServer,
+        handler_class=QuietHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, f"http://127.0.0.1:{server.server_port}"
+
+
+def serve_asgi():
+    from config.asgi import application
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(
+            application,
+            host="127.0.0.1",
+            port=port,
+            log_level="warning",
+            lifespan="off",
+        )
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return lambda: setattr(server, "should_exit", True), f"http://127.0.0.1:{port}"
+
+
+def run(mode, serve, cookies, users):
+    stop, base_url = serve()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # the views print their sources
+            return mode, asyncio.run(load(f"{base_url}/{mode}/ask/", cookies, users))
+    finally:
+        stop()
+
+
+async def load(url, cookies, users):
+    headers = {"X-CSRFToken": cookies[settings.CSRF_COOKIE_NAME]}
+    limits = httpx.Limits(max_connections=users)
+    async with httpx.AsyncClient(
+        cookies=cookies, headers=headers, limits=limits, timeout=600
+    ) as client:
+
+        async def ask(i):
+            start = time.perf_counter()
+            response = await client.post(
+                url, json={"question": f"What did invoice {i} say?"}
+            )
+            assert response.status_code == 200, response.text[:500]
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(ask(i) for i in range(users)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": users,
+        "seconds": elapsed,
+        "rps": users / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent requests")
+    parser.add_argument("--messages", type=int, default=200, help="seeded mailbox size")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="seconds per LLM call"
+    )
+    parser.add_argument(
+        "--embed-latency", type=float, default=0.02, help="seconds per embed call"
+    )
+    args = parser.parse_args()
+
+    fakes.install(embed_latency=args.embed_latency, llm_latency=args.llm_latency)
+    user = seed(args.messages)
+    cookies = session_cookies(user)
+    settings.ROOT_URLCONF = __name__
+    rows = [
+        run("sync", serve_wsgi, cookies, args.users),
+        run("async", serve_asgi, cookies, args.users),
+    ]
+
+    print(
+        f"{'view':<8}{'requests':>9}{'wall (s)':>10}{'req/s':>8}{'p50 (s)':>9}{'p95 (s)':>9}"
+    )
+    for mode, row in rows:
+        print(
+            f"{mode:<8}{row['requests']:>9}{row['seconds']:>10.2f}{row['rps']:>8.1f}"
+            f"{row['p50']:>9.2f}{row['p95']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
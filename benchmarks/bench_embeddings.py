@@ -0,0 +1,111 @@
+"""Compare the remote (OpenAI) and local (ONNX) embedding backends.
+
+    python -m benchmarks.bench_embeddings --chunks 2000 --queries 50
+    python -m benchmarks.bench_embeddings --model-dir ./models/all-MiniLM-L6-v2
+
+Embeds `--chunks` synthetic email chunks in ingest-sized calls (chunks/sec)
+and `--queries` single questions one at a time (query latency). The remote
+backend is the real OpenAI API when OPENAI_API_KEY is set; otherwise it is
+modelled by the fake embeddings sleeping `--remote-latency` per API call.
+The local backend loads ONNX_EMBEDDING_MODEL (or `--model-dir`).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from langchain_openai import OpenAIEmbeddings
+
+from config.onnx_embeddings import OnnxEmbeddings, resolve_model_dir
+
+from .fake_gmail import WORDS
+from .fakes import FakeEmbeddings
+
+
+def make_texts(count, words, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(count)]
+
+
+def run(name, embeddings, chunks, queries, ingest_batch):
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), ingest_batch):
+        embeddings.embed_documents(chunks[offset : offset + ingest_batch])
+    indexing = time.perf_counter() - start
+
+    latencies = []
+    for question in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "backend": name,
+        "chunks_per_sec": len(chunks) / indexing,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument(
+        "--chunk-words", type=int, default=150, help="about 1000 characters"
+    )
+    parser.add_argument(
+        "--ingest-batch", type=int, default=200, help="chunks per embed call"
+    )
+    parser.add_argument(
+        "--remote-latency", type=float, default=0.3, help="fake API seconds per call"
+    )
+    parser.add_argument("--model-dir", default=settings.ONNX_EMBEDDING_DIR or None)
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.ONNX_EMBEDDING_BATCH_SIZE
+    )
+    parser.add_argument("--threads", type=int, default=settings.ONNX_EMBEDDING_THREADS)
+    args = parser.parse_args()
+
+    chunks = make_texts(args.chunks, args.chunk_words, seed=0)
+    queries = make_texts(args.queries, 10, seed=1)
+
+    if os.getenv("OPENAI_API_KEY"):
+        remote, remote_name = OpenAIEmbeddings(), "openai"
+    else:
+        remote = FakeEmbeddings(size=1536, latency=args.remote_latency)
+        remote_name = f"remote (fake, {args.remote_latency}s/call)"
+    model_dir = resolve_model_dir(settings.ONNX_EMBEDDING_MODEL, args.model_dir)
+    local = OnnxEmbeddings(
+        settings.ONNX_EMBEDDING_MODEL,
+        model_dir,
+        batch_size=args.batch_size,
+        threads=args.threads,
+    )
+
+    rows = [
+        run(remote_name, remote, chunks, queries, args.ingest_batch),
+        run(
+            f"onnx ({args.threads} threads)", local, chunks, queries, args.ingest_batch
+        ),
+    ]
+    print(f"{'backend':<34}{'chunks/s':>10}{'query p50 ms':>14}{'query p95 ms':>14}")
+    for row in rows:
+        print(
+            f"{row['backend']:<34}{row['chunks_per_sec']:>10.1f}"
+            f"{row['query_p50_ms']:>14.1f}{row['query_p95_ms']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
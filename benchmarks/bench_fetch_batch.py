@@ -0,0 +1,75 @@
+"""Compare serial vs batched Gmail fetches against the local stand-in server.
+
+    python -m benchmarks.bench_fetch_batch --messages 100 --latency 0.02 --format raw
+
+Reports HTTP round trips, response bytes and wall time for
+`build_documents_from_messages` with one `messages.get` per request (the old
+behaviour) and with batching.
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django
+
+django.setup()
+
+from django.test import override_settings
+
+from config.fetch_email import build_documents_from_messages, get_message_ids
+
+from .fake_gmail import FakeGmail
+
+
+def run(gmail, batch_size):
+    service = gmail.service()
+    message_ids = get_message_ids(service, max_results=len(gmail.messages))
+    gmail.reset_counters()
+    start = time.perf_counter()
+    documents = build_documents_from_messages(
+        service, message_ids, batch_size=batch_size
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "documents": len(documents),
+        "round_trips": gmail.round_trips,
+        "api_calls": gmail.api_calls,
+        "bytes": gmail.bytes_sent,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per round trip"
+    )
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--bad", type=int, default=1, help="messages that return 404")
+    parser.add_argument("--format", default="full", choices=["full", "raw"])
+    args = parser.parse_args()
+
+    with FakeGmail(
+        num_messages=args.messages, latency=args.latency
+    ) as gmail, override_settings(GMAIL_FETCH_FORMAT=args.format):
+        gmail.fail_ids = {m["id"] for m in gmail.messages[: args.bad]}
+        rows = [run(gmail, 1), run(gmail, args.batch_size)]
+
+    print(
+        f"{'mode':<10}{'docs':>6}{'round trips':>13}{'api calls':>11}{'KiB':>9}{'wall (s)':>10}"
+    )
+    for row in rows:
+        mode = "serial" if row["batch_size"] == 1 else f"batch={row['batch_size']}"
+        print(
+            f"{mode:<10}{row['documents']:>6}{row['round_trips']:>13}"
+            f"{row['api_calls']:>11}{row['bytes'] / 1024:>9.1f}{row['seconds']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Time the whole ingest and QA path offline, stage by stage, at several mailbox sizes.
+
+    python -m benchmarks.bench_pipeline --sizes 100,1000,10000 --output run.json
+    python -m benchmarks.bench_pipeline --sizes 100,1000 --baseline run.json
+    python -m benchmarks.bench_pipeline --mailbox recorded.jsonl --sizes 500
+
+For each size the fake Gmail server (in this process) serves a synthetic
+mailbox, or the first N messages of a recorded one (`load_mailbox`), and a
+fresh subprocess with its own database and Chroma directory:
+
+1. POSTs to `/gmail/fetch/` and waits for the sync job
+2. POSTs `--questions` questions to `/email/ask/`
+
+Both go through `config.urls`, so they hit the async views it routes to.
+
+OpenAI is replaced by the deterministic fakes. The subprocess reports the
+time spent in each stage (list, fetch, parse, split, embed, upsert,
+retrieve, llm), its peak RSS and the Gmail, embedding and LLM request
+counts. Results are printed as a table and, with `--output`, saved as JSON;
+`--baseline` prints each stage against an earlier JSON run. Sizes up to
+100000 work; the largest ones take minutes.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from .fake_gmail import FakeGmail, load_mailbox
+
+STAGES = ["list", "fetch", "parse", "split", "embed", "upsert", "retrieve", "llm"]
+
+
+class StageTimes:
+    """Thread-safe seconds and call counts per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def as_dict(self):
+        return {
+            stage: {
+                "seconds": round(self.seconds[stage], 4),
+                "calls": self.calls[stage],
+            }
+            for stage in STAGES
+        }
+
+    def timed(self, stage, func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    def timed_stage(self, stage, func):
+        """Wrap a generator stage, excluding the time spent pulling from upstream."""
+
+        @functools.wraps(func)
+        def wrapper(batches, *args, **kwargs):
+            upstream = [0.0]
+
+            def pull():
+                iterator = iter(batches)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        batch = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        upstream[0] += time.perf_counter() - start
+                    yield batch
+
+            output = func(pull(), *args, **kwargs)
+            while True:
+                start, pulled = time.perf_counter(), upstream[0]
+                try:
+                    batch = next(output)
+                except StopIteration:
+                    return
+                finally:
+                    self.add(
+                        stage, time.perf_counter() - start - (upstream[0] - pulled)
+                    )
+                yield batch
+
+        return wrapper
+
+
+def instrument(times):
+    """Patch the app's stage functions and the fakes so each call is timed."""
+    from langchain_core.retrievers import BaseRetriever
+
+    from config import fetch_email, fetch_email_async
+    from config.gmail_async import AsyncGmail
+
+    from .fakes import FakeChatModel, FakeEmbeddings
+
+    AsyncGmail.list_messages = times.timed("list", AsyncGmail.list_messages)
+    AsyncGmail.get_messages = times.timed("fetch", AsyncGmail.get_messages)
+    stages = {
+        "parse_stage": times.timed_stage("parse", fetch_email.parse_stage),
+        "split_stage": times.timed_stage("split", fetch_email.split_stage),
+        "upsert_stage": times.timed_stage("upsert", fetch_email.upsert_stage),
+    }
+    # the async path imports them by name
+    for module in (fetch_email, fetch_email_async):
+        for name, wrapper in stages.items():
+            setattr(module, name, wrapper)
+    FakeEmbeddings.embed_documents = times.timed(
+        "embed", FakeEmbeddings.embed_documents
+    )
+    FakeEmbeddings.aembed_documents = times.timed(
+        "embed", FakeEmbeddings.aembed_documents
+    )
+    BaseRetriever.invoke = times.timed("retrieve", BaseRetriever.invoke)
+    BaseRetriever.ainvoke = times.timed("retrieve", BaseRetriever.ainvoke)
+    FakeChatModel._generate = times.timed("llm", FakeChatModel._generate)
+    FakeChatModel._agenerate = times.timed("llm", FakeChatModel._agenerate)
+
+
+def wait_for_job(client, status_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(f"Sync job did not finish in {timeout}s")
+
+
+def child(args):
+    """Run one size inside this (fresh) process and write its results to `args.child`."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+
+    os.chdir(settings.BENCH_DIR)  # email_cache/ lives in the working directory
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from django.urls import reverse
+
+    from . import fakes
+    from .bench_concurrency import session_cookies
+
+    embeddings, chat = fakes.install(
+        embed_latency=args.embed_latency, llm_latency=args.llm_latency
+    )
+    times = StageTimes()
+    instrument(times)
+    call_command("migrate", verbosity=0)
+    user = User.objects.create(username="bench@example.com")
+    client = Client()
+    for key, value in session_cookies(user).items():
+        client.cookies[key] = value
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        response = client.post(reverse("fetch_gmail"))
+        job = wait_for_job(client, response.json()["status_url"], args.timeout)
+        sync_seconds = time.perf_counter() - start
+
+        latencies = []
+        for i in range(args.questions):
+            start = time.perf_counter()
+            answer = client.post(
+                reverse("email_assistant"),
+                {"question": f"What did the invoice {i} email say about the budget?"},
+                content_type="application/json",
+            )
+            latencies.append(time.perf_counter() - start)
+            assert answer.status_code == 200, answer.content[:500]
+
+    latencies.sort()
+    result = {
+        "sync_status": job["status"],
+        "sync_error": job["error"],
+        "sync_seconds": round(sync_seconds, 3),
+        "documents": job["documents_stored"],
+        "chunks": job["chunks_embedded"],
+        "stages": times.as_dict(),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "embedding_calls": embeddings.calls,
+        "embedded_texts": embeddings.texts,
+        "llm_calls": chat.calls,
+        "ask_p50": round(statistics.median(latencies), 4) if latencies else None,
+        "ask_p95": (
+            round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4)
+            if latencies
+            else None
+        ),
+    }
+    with open(args.child, "w") as f:
+        json.dump(result, f)
+
+
+def run_size(args, size, recorded):
+    """Serve a mailbox of `size` messages and benchmark it in a subprocess."""
+    messages = recorded[:size] if recorded is not None else None
+    with FakeGmail(
+        num_messages=size,
+        latency=args.gmail_latency,
+        messages=messages,
+        units_per_second=args.gmail_quota,
+        error_rate=args.gmail_error_rate,
+    ) as gmail:
+        with tempfile.TemporaryDirectory(prefix="email-assistant-bench-") as bench_dir:
+            output = os.path.join(bench_dir, "result.json")
+            env = {"PYTHONWARNINGS": "ignore", **os.environ}
+            env.update(BENCH_DIR=bench_dir, GMAIL_API_ROOT=gmail.root_url)
+            command = [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_pipeline",
+                "--child",
+                output,
+            ]
+            for option in ("questions", "embed_latency", "llm_latency", "timeout"):
+                command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+            subprocess.run(command, env=env, check=True)
+            with open(output) as f:
+                result = json.load(f)
+        result.update(
+            messages=len(gmail.messages),
+            gmail_round_trips=gmail.round_trips,
+            gmail_api_calls=gmail.api_calls,
+            gmail_bytes=gmail.bytes_sent,
+            gmail_throttled=gmail.throttled,
+            gmail_errors=gmail.errors,
+        )
+    return result
+
+
+def print_runs(runs):
+    print(
+        f"{'messages':>9}{'chunks':>8}{'sync (s)':>10}"
+        + "".join(f"{stage:>9}" for stage in STAGES)
+        + f"{'RSS MiB':>9}{'gmail':>7}{'embed':>7}{'llm':>6}{'ask p50':>9}"
+    )
+    for run in runs:
+        print(
+            f"{run['messages']:>9}{run['chunks']:>8}{run['sync_seconds']:>10.2f}"
+            + "".join(f"{run['stages'][stage]['seconds']:>9.2f}" for stage in STAGES)
+            + f"{run['peak_rss_mb']:>9.0f}{run['gmail_round_trips']:>7}"
+            f"{run['embedding_calls']:>7}{run['llm_calls']:>6}{run['ask_p50'] or 0:>9.3f}"
+        )
+
+
+def print_comparison(runs, baseline):
+    """Per-stage seconds against a baseline run, for the sizes both contain."""
+    base_runs = {run["messages"]: run for run in baseline["runs"]}
+    print(f"\nvs baseline {baseline['created']}")
+    print(f"{'messages':>9}{'stage':>10}{'base (s)':>10}{'now (s)':>10}{'change':>9}")
+    for run in runs:
+        base = base_runs.get(run["messages"])
+        if not base:
+            continue
+        rows = [
+            (stage, base["stages"][stage]["seconds"], run["stages"][stage]["seconds"])
+            for stage in STAGES
+        ]
+        rows += [("sync", base["sync_seconds"], run["sync_seconds"])]
+        rows += [("RSS MiB", base["peak_rss_mb"], run["peak_rss_mb"])]
+        for name, before, now in rows:
+            change = f"{(now - before) / before:+.0%}" if before else "-"
+            print(
+                f"{run['messages']:>9}{name:>10}{before:>10.2f}{now:>10.2f}{change:>9}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", default="100,1000,10000", help="comma-separated mailbox sizes"
+    )
+    parser.add_argument(
+        "--mailbox", help="recorded mailbox (JSON lines of format=full messages)"
+    )
+    parser.add_argument(
+        "--questions", type=int, default=20, help="questions asked per size"
+    )
+    parser.add_argument(
+        "--gmail-latency", type=float, default=0.0, help="seconds per Gmail round trip"
+    )
+    parser.add_argument(
+        "--gmail-quota",
+        type=float,
+        default=0,
+        help="quota units/s the fake Gmail allows (0: no limit)",
+    )
+    parser.add_argument(
+        "--gmail-error-rate",
+        type=float,
+        default=0.0,
+        help="share of Gmail calls failing with 503",
+    )
+    parser.add_argument(
+        "--embed-latency", type=float, default=0.0, help="seconds per embed call"
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="seconds per LLM call"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=3600, help="seconds to wait for a sync"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against an earlier --output file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    recorded = load_mailbox(args.mailbox, limit=max(sizes)) if args.mailbox else None
+    runs = [run_size(args, size, recorded) for size in sizes]
+    print_runs(runs)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "mailbox": args.mailbox or "synthetic",
+        "settings": {
+            "gmail_latency": args.gmail_latency,
+            "gmail_quota": args.gmail_quota,
+            "gmail_error_rate": args.gmail_error_rate,
+            "embed_latency": args.embed_latency,
+            "llm_latency": args.llm_latency,
+            "questions": args.questions,
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(runs, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""Local stand-in for the parts of the Gmail REST API the app uses.
+
+The server holds a synthetic (or recorded, see `load_mailbox`) mailbox in
+memory, adds a fixed delay to every
+HTTP round trip to mimic network latency, and counts round trips and API
+calls so benchmarks can report them. It can also enforce a quota (429s
+once more units per second are used than allowed) and fail a share of
+calls with 503s, to exercise the retry and pacing in `gmail_quota`. `messages.get` honours `format`
+(full, raw, metadata) and top-level `fields` masks, and the bytes of every
+response are counted.
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from email.message import EmailMessage
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+API_PREFIX = "/gmail/v1/users/me"
+BATCH_PATH = "/batch"
+
+WORDS = (
+    "invoice meeting budget project update schedule report review deadline "
+    "travel receipt shipment order payment contract team lunch agenda notes"
+).split()
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def make_message(index, rng):
+    msg_id = f"{index:016x}"
+    thread_id = f"{index - index % 3:016x}"
+    subject = " ".join(rng.choice(WORDS) for _ in range(4)).capitalize()
+    sender = f"Sender {index % 40} <sender{index % 40}@example.com>"
+    body = "\n\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        for _ in range(rng.randint(1, 6))
+    )
+    return {
+        "id": msg_id,
+        "threadId": thread_id,
+        "labelIds": ["INBOX", "CATEGORY_PERSONAL"],
+        "snippet": body[:100],
+        "internalDate": str(1_700_000_000_000 + index * 60_000),
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "From", "value": sender},
+                {"name": "To", "value": "me@example.com"},
+                {"name": "Subject", "value": subject},
+            ],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"data": _b64(body)}},
+                {"mimeType": "text/html", "body": {"data": _b64(f"<p>{body}</p>")}},
+            ],
+        },
+    }
+
+
+def load_mailbox(path, limit=None):
+    """Recorded messages: one `messages.get?format=full` resource per line of JSON."""
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                messages.append(json.loads(line))
+            if limit and len(messages) >= limit:
+                break
+    return messages
+
+
+def _raw_part(part):
+    """Rebuild a MIME part (and its children) from a `format=full` payload."""
+    mime = EmailMessage()
+    content_type = part["mimeType"]
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            content_type = header["value"]
+        else:
+            mime[header["name"]] = header["value"]
+    maintype, subtype = part["mimeType"].split("/", 1)
+    if maintype == "multipart":
+        if subtype == "mixed":
+            mime.make_mixed()
+        else:
+            mime.make_alternative()
+        for child in part.get("parts", []):
+            mime.attach(_raw_part(child))
+    else:
+        match = re.search(r"charset=([\w-]+)", content_type)
+        charset = match.group(1) if match else "utf-8"
+        data = base64.urlsafe_b64decode(part.get("body", {}).get("data", ""))
+        mime.set_content(data.decode(charset), subtype=subtype, charset=charset)
+    return mime
+
+
+def raw_message(message):
+    """The `format=raw` form of a message built by `make_message`."""
+    return base64.urlsafe_b64encode(_raw_part(message["payload"]).as_bytes()).decode(
+        "ascii"
+    )
+
+
+def _apply_format(message, query):
+    fmt = query.get("format", ["full"])[0]
+    body = dict(message)
+    if fmt == "raw":
+        del body["payload"]
+        body["raw"] = raw_message(message)
+    elif fmt == "metadata":
+        wanted = {h.lower() for h in query.get("metadataHeaders", [])}
+        headers = message["payload"]["headers"]
+        body["payload"] = {
+            "mimeType": message["payload"]["mimeType"],
+            "headers": [
+                h for h in headers if not wanted or h["name"].lower() in wanted
+            ],
+        }
+    fields = query.get("fields")
+    if fields:
+        keep = {f.split("(")[0].split("/")[0] for f in fields[0].split(",")}
+        body = {k: v for k, v in body.items() if k in keep}
+    return body
+
+
+class FakeGmail:
+    """In-memory mailbox served over HTTP on 127.0.0.1."""
+
+    def __init__(
+        self,
+        num_messages=100,
+        latency=0.02,
+        fail_ids=(),
+        seed=0,
+        messages=None,
+        units_per_second=0,
+        error_rate=0.0,
+    ):
+        rng = random.Random(seed)
+        if messages is None:
+            messages = [make_message(i, rng) for i in range(num_messages, 0, -1)]
+        # Newest first, like messages.list
+        self.messages = sorted(messages, key=lambda m: -int(m.get("internalDate", 0)))
+        num_messages = len(self.messages)
+        self.by_id = {m["id"]: m for m in self.messages}
+        self._rng = rng
+        self._next_index = num_messages + 1
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id  # older start IDs get a 404
+        self.history = []
+        self.latency = latency
+        self.fail_ids = set(fail_ids)
+        self.units_per_second = units_per_second  # 0: no quota
+        self.error_rate = error_rate  # share of calls answered with a 503
+        self._units = units_per_second
+        self._units_at = time.monotonic()
+        self.round_trips = 0
+        self.api_calls = 0
+        self.bytes_sent = 0
+        self.throttled = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    # ---- lifecycle -------------------------------------------------------
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        gmail = self
+
+        class Handler(_Handler):
+            server_state = gmail
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def root_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.api_calls = 0
+            self.bytes_sent = 0
+            self.throttled = 0
+            self.errors = 0
+
+    def service(self):
+        """A googleapiclient Gmail service whose base and batch URLs hit this server."""
+        doc = json.loads(get_static_doc("gmail", "v1"))
+        doc["rootUrl"] = self.root_url
+        return build_from_document(doc, http=httplib2.Http())
+
+    # ---- mailbox changes (recorded in history) ----------------------------
+    def _record(self, key, message):
+        self.history_id += 1
+        stub = {
+            "id": message["id"],
+            "threadId": message["threadId"],
+            "labelIds": list(message["labelIds"]),
+        }
+        self.history.append({"id": str(self.history_id), key: [{"message": stub}]})
+
+    def add_message(self):
+        with self._lock:
+            message = make_message(self._next_index, self._rng)
+            self._next_index += 1
+            self.messages.insert(0, message)
+            self.by_id[message["id"]] = message
+            self._record("messagesAdded", message)
+            return message
+
+    def delete_message(self, msg_id):
+        with self._lock:
+            message = self.by_id.pop(msg_id)
+            self.messages.remove(message)
+            self._record("messagesDeleted", message)
+
+    def relabel(self, msg_id, add=(), remove=()):
+        with self._lock:
+            message = self.by_id[msg_id]
+            labels = (set(message["labelIds"]) | set(add)) - set(remove)
+            message["labelIds"] = sorted(labels)
+            self._record("labelsAdded" if add else "labelsRemoved", message)
+
+    def expire_history(self):
+        self.oldest_history_id = self.history_id + 1
+
+    # ---- API -------------------------------------------------------------
+    def _over_quota(self, units):
+        """Take `units` from the per-second allowance; True if there are not enough."""
+        if not self.units_per_second:
+            return False
+        now = time.monotonic()
+        self._units = min(
+            self.units_per_second,
+            self._units + (now - self._units_at) * self.units_per_second,
+        )
+        self._units_at = now
+        if self._units < units:
+            return True
+        self._units -= units
+        return False
+
+    def handle(self, method, path, query):
+        """Return (status, body dict) for a single API call."""
+        route = path[len(API_PREFIX) :].strip("/").split("/")
+        units = {"profile": 1, "labels": 1, "history": 2}.get(route[0], 5)
+        with self._lock:
+            self.api_calls += 1
+            if self._over_quota(units):
+                self.throttled += 1
+                return 429, {
+                    "error": {
+                        "code": 429,
+                        "message": "User-rate limit exceeded.",
+                        "errors": [{"reason": "rateLimitExceeded"}],
+                    }
+                }
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                message = "The service is currently unavailable."
+                return 503, {"error": {"code": 503, "message": message}}
+        if not path.startswith(API_PREFIX):
+            return 404, {"error": {"code": 404, "message": "Not found"}}
+
+        if route == ["profile"]:
+            return 200, {
+                "emailAddress": "me@example.com",
+                "messagesTotal": len(self.messages),
+                "historyId": str(self.history_id),
+            }
+        if len(route) == 2 and route[0] == "labels":
+            label_id = unquote(route[1])
+            total = sum(label_id in m["labelIds"] for m in self.messages)
+            return 200, {"id": label_id, "messagesTotal": total}
+        if route == ["history"]:
+            return self._list_history(query)
+        if route == ["messages"]:
+            return 200, self._list_messages(query)
+        if len(route) == 2 and route[0] == "messages":
+            msg_id = unquote(route[1])
+            if msg_id in self.fail_ids or msg_id not in self.by_id:
+                return 404, {
+                    "error": {"code": 404, "message": "Requested entity was not found."}
+                }
+            return 200, _apply_format(self.by_id[msg_id], query)
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+    def _list_history(self, query):
+        start = int(query["startHistoryId"][0])
+        if start < self.oldest_history_id:
+            return 404, {
+                "error": {"code": 404, "message": "Requested entity was not found."}
+            }
+        max_results = int(query.get("maxResults", ["100"])[0])
+        records = [r for r in self.history if int(r["id"]) > start]
+        offset = int(query.get("pageToken", ["0"])[0])
+        body = {
+            "history": records[offset : offset + max_results],
+            "historyId": str(self.history_id),
+        }
+        if offset + max_results < len(records):
+            body["nextPageToken"] = str(offset + max_results)
+        return 200, body
+
+    def _list_messages(self, query):
+        max_results = int(query.get("maxResults", ["100"])[0])
+        start = int(query.get("pageToken", ["0"])[0])
+        page = self.messages[start : start + max_results]
+        body = {
+            "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+            "resultSizeEstimate": len(self.messages),
+        }
+        if start + max_results < len(self.messages):
+            body["nextPageToken"] = str(start + max_results)
+        return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state = None  # set on the per-server subclass
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _round_trip(self):
+        gmail = self.server_state
+        with gmail._lock:
+            gmail.round_trips += 1
+        if gmail.latency:
+            time.sleep(gmail.latency)
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        with self.server_state._lock:
+            self.server_state.bytes_sent += len(data)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._round_trip()
+        url = urlparse(self.path)
+        status, body = self.server_state.handle("GET", url.path, parse_qs(url.query))
+        self._send(status, body)
+
+    def do_POST(self):
+        self._round_trip()
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length).decode("utf-8")
+        url = urlparse(self.path)
+        if url.path != BATCH_PATH:
+            status, body = self.server_state.handle(
+                "POST", url.path, parse_qs(url.query)
+            )
+            return self._send(status, body)
+        self._send_batch(payload)
+
+    def _send_batch(self, payload):
+        container = Parser().parsestr(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n{payload}"
+        )
+        boundary = "batch_fake_gmail"
+        chunks = []
+        for part in container.get_payload():
+            request_line = part.get_payload().lstrip().split("\n", 1)[0]
+            method, target = request_line.split()[:2]
+            url = urlparse(target)
+            status, body = self.server_state.handle(
+                method, url.path, parse_qs(url.query)
+            )
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(body)}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        self._send(
+            200,
+            "".join(chunks).encode("utf-8"),
+            content_type=f"multipart/mixed; boundary={boundary}",
+        )
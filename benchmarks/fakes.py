@@ -0,0 +1,98 @@
+"""Deterministic stand-ins for the OpenAI embedding and chat models.
+
+Both sleep for a configurable latency per call (blocking in the sync path,
+awaiting in the async path) so benchmarks keep the shape of remote calls
+without the network, cost or nondeterminism.
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeEmbeddings(Embeddings):
+    model = "fake-embedding"
+
+    def __init__(self, size=64, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0, 1) for _ in range(self.size)]
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    answer: str = "This is a stand-in answer built from the retrieved emails."
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def get_num_tokens(self, text):
+        return len(text) // 4 + 1
+
+    def _result(self):
+        self.calls += 1
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.answer))]
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=word if i == 0 else f" {word}")
+            )
+
+
+def install(embed_latency=0.0, llm_latency=0.0):
+    """Make the app build fakes wherever it would build OpenAI clients."""
+    import config.clients
+    import config.embeddings
+
+    embeddings = FakeEmbeddings(latency=embed_latency)
+    chat = FakeChatModel(latency=llm_latency)
+    config.embeddings.OpenAIEmbeddings = lambda **kwargs: embeddings
+    config.clients.ChatOpenAI = lambda **kwargs: chat
+    return embeddings, chat
@@ -0,0 +1,32 @@
+"""Django settings for benchmarks: the app's settings with all state in a temp dir."""
+
+import os
+import tempfile
+
+from config.settings import *  # noqa: F401,F403
+
+BENCH_DIR = os.environ.get("BENCH_DIR") or tempfile.mkdtemp(
+    prefix="email-assistant-bench-"
+)
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BENCH_DIR, "db.sqlite3"),
+    }
+}
+CHROMA_DIR = os.path.join(BENCH_DIR, "chroma_db")
+EMBEDDING_CACHE_PATH = os.path.join(BENCH_DIR, "email_cache", "embeddings.sqlite3")
+SYNC_STATE_PATH = os.path.join(BENCH_DIR, "email_cache", "sync_state.sqlite3")
+FULLTEXT_INDEX_PATH = os.path.join(BENCH_DIR, "email_cache", "fulltext.sqlite3")
+EMBEDDING_CACHE_ENABLED = (
+    os.getenv("EMBEDDING_CACHE_ENABLED", "false").lower() == "true"
+)
+# No client-side pacing: the fake Gmail server only enforces a quota with --gmail-quota
+GMAIL_USER_UNITS_PER_SECOND = float(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "0"))
+
+ALLOWED_HOSTS = ["*"]
+SESSION_COOKIE_DOMAIN = None
+SESSION_COOKIE_SECURE = False
+CSRF_COOKIE_SECURE = False
+LOGGING["loggers"]["config"]["level"] = os.getenv("LOG_LEVEL", "WARNING")  # noqa: F405
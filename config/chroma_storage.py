@@ -0,0 +1,444 @@
+"""Where users' Chroma collections live, and keeping them small.
+
+Each user's chunks are one collection (`chroma_collection_name`) in one of
+CHROMA_SHARDS data directories: shard 0 is CHROMA_DIR itself, so existing
+data stays put, and shard N is CHROMA_DIR/shard-NN. A user's shard is
+recorded in `ChromaCollection` when first used and never changes, so
+raising CHROMA_SHARDS only spreads new users.
+
+Each shard directory is opened as its own PersistentClient. Chroma keeps
+the HNSW indexes of a client's collections in memory until the client is
+closed and has no per-collection unload, so a shard nobody in this process
+used for CHROMA_IDLE_UNLOAD_SECONDS is closed and reopened on next use.
+
+Deleted chunks stay in the HNSW index files. Once a user has deleted
+CHROMA_COMPACT_MIN_DELETED chunks and at least CHROMA_COMPACT_DELETED_RATIO
+of what is left, the next sync copies the live chunks into a fresh
+collection (no re-embedding) and removes the old index files.
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import closing, contextmanager
+
+import chromadb
+from chromadb.api.shared_system_client import SharedSystemClient
+from chromadb.errors import NotFoundError
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .email_cache import chroma_collection_name
+from .models import ChromaCollection
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_PREFIX = "gmail_emails_user_"
+COMPACTING_SUFFIX = "_compacting"  # the copy being built by `compact`
+PAGE_SIZE = 1000  # chunks read per page while compacting
+ACCESS_WRITE_SECONDS = 60  # how often a user's last_accessed_at is written
+
+_lock = threading.RLock()
+_clients = {}  # shard -> [client, last used (monotonic), callers holding it]
+_user_shards = {}  # user_id -> shard
+_access_written = {}  # user_id -> monotonic time last_accessed_at was saved
+_recovered = set()  # collection names checked for an interrupted compaction
+
+
+# ---- Shards -------------------------------------------------------------------
+
+
+def shard_path(shard: int) -> str:
+    if shard == 0:
+        return settings.CHROMA_DIR
+    return os.path.join(settings.CHROMA_DIR, f"shard-{shard:02d}")
+
+
+def shard_paths() -> dict:
+    """Every shard directory that exists on disk (shard -> path)."""
+    paths = {0: settings.CHROMA_DIR}
+    if os.path.isdir(settings.CHROMA_DIR):
+        for name in os.listdir(settings.CHROMA_DIR):
+            if name.startswith("shard-") and name[6:].isdigit():
+                paths[int(name[6:])] = os.path.join(settings.CHROMA_DIR, name)
+    return dict(sorted(paths.items()))
+
+
+def _assign_shard(user_id: str) -> int:
+    shard = zlib.crc32(user_id.encode()) % max(settings.CHROMA_SHARDS, 1)
+    if shard != 0:
+        # A collection stored before sharding was enabled stays in CHROMA_DIR
+        with shard_client(0) as client:
+            if _has_collection(client, chroma_collection_name(user_id)):
+                shard = 0
+    return shard
+
+
+def user_shard(user_id: str) -> int:
+    with _lock:
+        shard = _user_shards.get(user_id)
+    if shard is None:
+        entry = ChromaCollection.objects.filter(user_id=user_id).only("shard").first()
+        if entry is None:
+            entry, _ = ChromaCollection.objects.get_or_create(
+                user_id=user_id, defaults={"shard": _assign_shard(user_id)}
+            )
+        shard = entry.shard
+        with _lock:
+            _user_shards[user_id] = shard
+    return shard
+
+
+def _acquire(shard: int) -> list:
+    unload_idle()
+    with _lock:
+        entry = _clients.get(shard)
+        if entry is None:
+            path = shard_path(shard)
+            os.makedirs(path, exist_ok=True)
+            entry = _clients[shard] = [chromadb.PersistentClient(path=path), 0.0, 0]
+        entry[1] = time.monotonic()
+        entry[2] += 1
+    return entry
+
+
+def _release(entry: list) -> None:
+    with _lock:
+        entry[1] = time.monotonic()
+        entry[2] -= 1
+
+
+@contextmanager
+def shard_client(shard: int):
+    """The shard's PersistentClient, kept open (not unloaded) inside the block."""
+    entry = _acquire(shard)
+    try:
+        yield entry[0]
+    finally:
+        _release(entry)
+
+
+def user_client(user_id: str):
+    """The client holding the user's collection; the access counts as use.
+
+    The client may be closed as idle once returned, so hold `in_use` (or
+    `hold`) for as long as it or anything built on it is in use.
+    """
+    shard = user_shard(user_id)
+    _record_access(user_id)
+    with shard_client(shard) as client:
+        _recover_compaction(client, chroma_collection_name(user_id))
+        return client
+
+
+@contextmanager
+def in_use(user_id: str):
+    """Keep the user's shard loaded for the whole block (e.g. a sync)."""
+    with shard_client(user_shard(user_id)):
+        yield
+
+
+def hold(user_id: str):
+    """Keep the user's shard loaded until the returned function is called.
+
+    For uses that span awaits, where `in_use` cannot be entered from the
+    event loop (it may query the database).
+    """
+    entry = _acquire(user_shard(user_id))
+    released = threading.Event()
+
+    def release():
+        if not released.is_set():
+            released.set()
+            _release(entry)
+
+    return release
+
+
+def _record_access(user_id: str) -> None:
+    now = time.monotonic()
+    with _lock:
+        if (
+            now - _access_written.get(user_id, -ACCESS_WRITE_SECONDS)
+            < ACCESS_WRITE_SECONDS
+        ):
+            return
+        _access_written[user_id] = now
+    ChromaCollection.objects.filter(user_id=user_id).update(
+        last_accessed_at=timezone.now()
+    )
+
+
+def _close(client) -> None:
+    # chromadb caches one System per directory and has no public way to close
+    # a single one; stopping it frees the loaded indexes
+    client._system.stop()
+    SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+
+
+def unload_idle(now: float | None = None) -> list[int]:
+    """Close the clients of shards unused for CHROMA_IDLE_UNLOAD_SECONDS."""
+    now = time.monotonic() if now is None else now
+    cutoff = now - settings.CHROMA_IDLE_UNLOAD_SECONDS
+    with _lock:
+        idle = [
+            shard
+            for shard, (_, used, holders) in _clients.items()
+            if not holders and used < cutoff
+        ]
+        if not idle:
+            return []
+        closed = [(shard, _clients.pop(shard)[0]) for shard in idle]
+        users = [user_id for user_id, shard in _user_shards.items() if shard in idle]
+        # registry imports this module (via email_assistant)
+        from .registry import drop_chains
+
+        # Their retrievers hold collections of the closed clients; drop them
+        # before a caller can reopen the shard and pick up a stale chain
+        drop_chains(users)
+    for shard, client in closed:
+        _close(client)
+        logger.info("💤 Unloaded idle Chroma shard %s", shard)
+    return idle
+
+
+# ---- Collections --------------------------------------------------------------
+
+
+def _recover_compaction(client, name: str) -> None:
+    """Finish a compaction that stopped between dropping the old collection and renaming."""
+    with _lock:
+        if name in _recovered:
+            return
+        _recovered.add(name)
+    if _has_collection(client, name) or not _has_collection(
+        client, name + COMPACTING_SUFFIX
+    ):
+        return
+    client.get_collection(name + COMPACTING_SUFFIX, embedding_function=None).modify(
+        name=name
+    )
+    logger.warning("Recovered %s from an interrupted compaction", name)
+
+
+def _has_collection(client, name: str) -> bool:
+    try:
+        client.get_collection(name, embedding_function=None)
+    except NotFoundError:
+        return False
+    return True
+
+
+def user_collection(user_id: str):
+    """The user's raw Chroma collection, or None if they have no chunks yet."""
+    try:
+        return user_client(user_id).get_collection(
+            chroma_collection_name(user_id), embedding_function=None
+        )
+    except NotFoundError:
+        return None
+
+
+def named_collections(names=None):
+    """`(client, collection)` for every collection in every shard, or for `names`."""
+    for shard in shard_paths():
+        with shard_client(shard) as client:
+            for collection in client.list_collections():
+                if collection.name.endswith(COMPACTING_SUFFIX):
+                    continue
+                if names is None or collection.name in names:
+                    yield client, client.get_collection(
+                        collection.name, embedding_function=None
+                    )
+
+
+def record_deletes(user_id: str, count: int) -> None:
+    if count:
+        ChromaCollection.objects.filter(user_id=user_id).update(
+            deleted_chunks=F("deleted_chunks") + count
+        )
+
+
+# ---- Compaction ---------------------------------------------------------------
+
+
+def needs_compaction(entry: ChromaCollection) -> bool:
+    return (
+        entry.deleted_chunks >= settings.CHROMA_COMPACT_MIN_DELETED
+        and entry.deleted_chunks >= settings.CHROMA_COMPACT_DELETED_RATIO * entry.chunks
+    )
+
+
+def update_stats(user_id: str, compact_if_needed: bool = True) -> ChromaCollection:
+    """Record the collection's chunk count (after a sync); compact it if due."""
+    collection = user_collection(user_id)
+    chunks = collection.count() if collection is not None else 0
+    ChromaCollection.objects.filter(user_id=user_id).update(chunks=chunks)
+    entry = ChromaCollection.objects.get(user_id=user_id)
+    if compact_if_needed and collection is not None and needs_compaction(entry):
+        compact(user_id)
+        entry.refresh_from_db()
+    return entry
+
+
+def compact(user_id: str) -> int:
+    """Rebuild the user's collection from its live chunks; returns bytes freed.
+
+    The copy keeps the stored embeddings, so nothing is re-embedded. Run it
+    while no sync is writing to the collection.
+    """
+    name = chroma_collection_name(user_id)
+    temp = name + COMPACTING_SUFFIX
+    shard = user_shard(user_id)
+    with shard_client(shard) as client:
+        try:
+            old = client.get_collection(name, embedding_function=None)
+        except NotFoundError:
+            return 0
+        if _has_collection(client, temp):
+            client.delete_collection(temp)  # left over from an interrupted run
+        new = client.create_collection(
+            temp, metadata=old.metadata or None, embedding_function=None
+        )
+        for offset in range(0, old.count(), PAGE_SIZE):
+            page = old.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=PAGE_SIZE,
+                offset=offset,
+            )
+            if page["ids"]:
+                new.add(
+                    ids=page["ids"],
+                    embeddings=page["embeddings"],
+                    documents=page["documents"],
+                    metadatas=page["metadatas"],
+                )
+        client.delete_collection(name)
+        new.modify(name=name)
+        chunks = new.count()
+    freed = remove_orphaned_segments(shard)
+    ChromaCollection.objects.filter(user_id=user_id).update(
+        chunks=chunks, deleted_chunks=0, compacted_at=timezone.now()
+    )
+    # registry imports this module (via email_assistant)
+    from .registry import invalidate_user
+
+    invalidate_user(user_id)  # cached retrievers point at the dropped collection
+    logger.info("🧹 Compacted %s: %d chunks, %d bytes freed", name, chunks, freed)
+    return freed
+
+
+def _vector_segments(path: str) -> dict:
+    """Collection name -> ID of its vector segment (the HNSW directory name)."""
+    db_path = os.path.join(path, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return {}
+    with closing(
+        sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    ) as conn:
+        rows = conn.execute(
+            "SELECT c.name, s.id FROM segments s JOIN collections c ON c.id = s.collection "
+            "WHERE s.scope = 'VECTOR'"
+        ).fetchall()
+    return dict(rows)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _segment_dirs(path: str) -> list[str]:
+    names = []
+    for name in os.listdir(path) if os.path.isdir(path) else []:
+        try:
+            uuid.UUID(name)
+        except ValueError:
+            continue  # chroma.sqlite3, shard-NN
+        names.append(name)
+    return names
+
+
+def orphaned_segments(path: str) -> list[str]:
+    """HNSW directories of deleted collections; Chroma leaves them on disk."""
+    live = set(_vector_segments(path).values())
+    return [name for name in _segment_dirs(path) if name not in live]
+
+
+def remove_orphaned_segments(shard: int) -> int:
+    path = shard_path(shard)
+    freed = 0
+    for name in orphaned_segments(path):
+        segment = os.path.join(path, name)
+        freed += _dir_bytes(segment)
+        shutil.rmtree(segment, ignore_errors=True)
+    return freed
+
+
+def vacuum(shard: int) -> int:
+    """VACUUM the shard's chroma.sqlite3 (needs a moment with no writers); returns bytes freed."""
+    db_path = os.path.join(shard_path(shard), "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return 0
+    before = os.path.getsize(db_path)
+    with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+        conn.execute("VACUUM")
+    return before - os.path.getsize(db_path)
+
+
+# ---- Reporting ----------------------------------------------------------------
+
+
+def footprint() -> dict:
+    """On-disk size per shard and per user collection, with chunk counts and tracked stats."""
+    entries = {str(e.user_id): e for e in ChromaCollection.objects.all()}
+    shards, users = [], []
+    for shard, path in shard_paths().items():
+        db_path = os.path.join(path, "chroma.sqlite3")
+        segments = _vector_segments(path)
+        orphaned = orphaned_segments(path)
+        with shard_client(shard) as client:
+            counts = {
+                collection.name: collection.count()
+                for collection in client.list_collections()
+            }
+        shards.append(
+            {
+                "shard": shard,
+                "path": os.path.abspath(path),
+                "sqlite_bytes": (
+                    os.path.getsize(db_path) if os.path.exists(db_path) else 0
+                ),
+                "orphaned_bytes": sum(
+                    _dir_bytes(os.path.join(path, n)) for n in orphaned
+                ),
+            }
+        )
+        for name, segment in sorted(segments.items()):
+            if not name.startswith(COLLECTION_PREFIX) or name.endswith(
+                COMPACTING_SUFFIX
+            ):
+                continue
+            user_id = name.removeprefix(COLLECTION_PREFIX)
+            entry = entries.get(user_id)
+            users.append(
+                {
+                    "user_id": user_id,
+                    "shard": shard,
+                    "index_bytes": _dir_bytes(os.path.join(path, segment)),
+                    "chunks": counts.get(name, 0),
+                    "deleted_chunks": entry.deleted_chunks if entry else None,
+                    "last_accessed_at": entry.last_accessed_at if entry else None,
+                    "compacted_at": entry.compacted_at if entry else None,
+                }
+            )
+    return {"shards": shards, "users": users}
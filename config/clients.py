@@ -0,0 +1,231 @@
+"""Process-wide clients shared by every request.
+
+Opening the OpenAI and Gmail HTTP connections is expensive, so each pool
+is created once per process and reused (Chroma clients are managed by
+`chroma_storage`). Gmail
+credentials and discovery-based Gmail services are cached per user, so a
+refreshed access token is reused by the user's next sync instead of being
+refreshed again.
+"""
+
+import asyncio
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import httpx
+import requests
+from django.conf import settings
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from langchain_openai import ChatOpenAI
+
+CREDENTIAL_FIELDS = (
+    "token",
+    "refresh_token",
+    "token_uri",
+    "client_id",
+    "client_secret",
+    "scopes",
+)
+
+_lock = threading.RLock()
+_http_client = None
+_chat_models = {}
+_async_http_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+_gmail_credentials = OrderedDict()  # user_id -> Credentials, least recently used first
+_gmail_services = OrderedDict()  # user_id -> (Credentials, Gmail service)
+_gmail_discovery = None
+_refresh_locks = weakref.WeakKeyDictionary()  # Credentials -> Lock
+# Credentials -> user_id, for token write-back
+_credential_users = weakref.WeakKeyDictionary()
+_token_session = None
+
+
+def openai_http_client():
+    """Keep-alive connection pool shared by the OpenAI chat and embedding clients."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+        return _http_client
+
+
+def async_http_client():
+    """Connection pool for async Gmail calls, one per event loop.
+
+    httpx async connections are bound to the loop that opened them, so a
+    process serving one uvicorn loop shares a single pool.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.GMAIL_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GMAIL_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+            _async_http_clients[loop] = client
+        return client
+
+
+def chat_model(model="gpt-3.5-turbo", temperature=0):
+    key = (model, temperature)
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(
+                model=model, temperature=temperature, http_client=openai_http_client()
+            )
+        return _chat_models[key]
+
+
+# ---- Gmail -------------------------------------------------------------------
+
+
+def credentials_to_dict(credentials) -> dict:
+    data = {field: getattr(credentials, field) for field in CREDENTIAL_FIELDS}
+    data["expiry"] = credentials.expiry.isoformat() if credentials.expiry else None
+    return data
+
+
+def credentials_from_dict(data: dict) -> Credentials:
+    expiry = data.get("expiry")
+    return Credentials(
+        **{field: data.get(field) for field in CREDENTIAL_FIELDS},
+        # naive UTC, as google-auth uses
+        expiry=datetime.fromisoformat(expiry) if expiry else None,
+    )
+
+
+def _cache_put(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > settings.GMAIL_CLIENT_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def gmail_credentials(user_id: str, credentials_data: dict) -> Credentials:
+    """The user's cached Credentials, built from `credentials_data` on first use.
+
+    Stored data with a different refresh token (the user logged in again)
+    replaces the cached credentials; a newer access token (refreshed by
+    another process) is adopted.
+    """
+    with _lock:
+        credentials = _gmail_credentials.get(user_id)
+        if credentials is None or credentials.refresh_token != credentials_data.get(
+            "refresh_token"
+        ):
+            credentials = credentials_from_dict(credentials_data)
+            _credential_users[credentials] = user_id
+        else:
+            stored = credentials_from_dict(credentials_data)
+            if stored.expiry and (
+                credentials.expiry is None or stored.expiry > credentials.expiry
+            ):
+                credentials.token, credentials.expiry = stored.token, stored.expiry
+        _cache_put(_gmail_credentials, user_id, credentials)
+        return credentials
+
+
+def cached_gmail_credentials(user_id: str):
+    with _lock:
+        return _gmail_credentials.get(user_id)
+
+
+def forget_gmail_user(user_id: str) -> None:
+    with _lock:
+        _gmail_credentials.pop(user_id, None)
+        _gmail_services.pop(user_id, None)
+
+
+def _token_request() -> Request:
+    """Token refreshes over one keep-alive requests session."""
+    global _token_session
+    with _lock:
+        if _token_session is None:
+            _token_session = requests.Session()
+        return Request(session=_token_session)
+
+
+def needs_refresh(credentials) -> bool:
+    """True when the access token is missing or expires within GMAIL_TOKEN_REFRESH_MARGIN."""
+    if not credentials.token:
+        return True
+    if credentials.expiry is None:
+        return False  # unknown lifetime: refreshed when Gmail answers 401
+    margin = timedelta(seconds=settings.GMAIL_TOKEN_REFRESH_MARGIN)
+    return credentials.expiry - margin <= datetime.now(timezone.utc).replace(
+        tzinfo=None
+    )
+
+
+def refresh_credentials(credentials, rejected_token=None) -> None:
+    """Refresh `credentials` in place; concurrent callers wait for one refresh.
+
+    Refreshes when the token is about to expire or, given `rejected_token`
+    (one Gmail answered 401 to), while the credentials still hold it. A token
+    another thread has just refreshed is not refreshed again. The new token
+    is saved to the credential store for the user's other processes.
+    """
+    with _lock:
+        lock = _refresh_locks.setdefault(credentials, threading.Lock())
+    with lock:
+        if rejected_token is not None:
+            if credentials.token != rejected_token:
+                return
+        elif not needs_refresh(credentials):
+            return
+        credentials.refresh(_token_request())
+        user_id = _credential_users.get(credentials)
+    if user_id is not None:
+        # credential_store imports this module
+        from .credential_store import save_refreshed_token
+
+        save_refreshed_token(user_id, credentials)
+
+
+def _gmail_discovery_doc() -> dict:
+    """The Gmail v1 discovery document bundled with googleapiclient, parsed once."""
+    global _gmail_discovery
+    with _lock:
+        if _gmail_discovery is None:
+            _gmail_discovery = json.loads(get_static_doc("gmail", "v1"))
+        return _gmail_discovery
+
+
+def gmail_service(user_id: str, credentials_data: dict):
+    """A googleapiclient Gmail service for the user, reused while the credentials are.
+
+    Built from the preloaded discovery document on a keep-alive httplib2
+    connection. httplib2 is not thread-safe; a user has at most one sync
+    running at a time.
+    """
+    credentials = gmail_credentials(user_id, credentials_data)
+    refresh_credentials(credentials)  # only if it is about to expire
+    with _lock:
+        cached = _gmail_services.get(user_id)
+        if cached is not None and cached[0] is credentials:
+            _gmail_services.move_to_end(user_id)
+            return cached[1]
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=60))
+    doc = {**_gmail_discovery_doc(), "rootUrl": settings.GMAIL_API_ROOT}
+    service = build_from_document(doc, http=http)
+    with _lock:
+        _cache_put(_gmail_services, user_id, (credentials, service))
+    return service
@@ -0,0 +1,91 @@
+"""Gmail OAuth credentials, stored server-side per user.
+
+The OAuth callback saves a user's tokens in the `GmailCredential` table
+instead of the session, so the session cookie only carries an ID and the
+tokens never reach the browser. Reads go through the per-process cache in
+`clients`, and a refreshed access token is written back to the row, so
+other processes and later syncs pick it up instead of refreshing again.
+"""
+
+import os
+from datetime import timezone as dt_timezone
+
+from dotenv import load_dotenv
+from django.utils import timezone
+
+from .clients import cached_gmail_credentials, forget_gmail_user, gmail_credentials
+from .models import GmailCredential
+
+load_dotenv()
+
+
+def _credentials_data(row) -> dict:
+    expiry = (
+        row.expiry.astimezone(dt_timezone.utc).replace(tzinfo=None)
+        if row.expiry
+        else None
+    )
+    return {
+        "token": row.token,
+        "refresh_token": row.refresh_token,
+        "token_uri": row.token_uri,
+        "client_id": row.client_id,
+        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+        "scopes": row.scopes,
+        "expiry": expiry.isoformat() if expiry else None,
+    }
+
+
+def _aware(expiry):
+    """google-auth keeps expiry as naive UTC; the database column is aware."""
+    return timezone.make_aware(expiry, dt_timezone.utc) if expiry else None
+
+
+def save_credentials(user_id: str, credentials) -> None:
+    """Store a user's credentials (after login) and make them the cached ones."""
+    GmailCredential.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            "token": credentials.token or "",
+            "refresh_token": credentials.refresh_token or "",
+            "token_uri": credentials.token_uri,
+            "client_id": credentials.client_id,
+            "scopes": list(credentials.scopes or []),
+            "expiry": _aware(credentials.expiry),
+        },
+    )
+    forget_gmail_user(user_id)
+
+
+def save_refreshed_token(user_id: str, credentials) -> None:
+    GmailCredential.objects.filter(
+        user_id=user_id, refresh_token=credentials.refresh_token
+    ).update(
+        token=credentials.token,
+        expiry=_aware(credentials.expiry),
+        updated_at=timezone.now(),
+    )
+
+
+def load_credentials(user_id: str, reload: bool = False):
+    """The user's Gmail `Credentials`, or None if they never connected Gmail.
+
+    Served from the process cache; `reload` rereads the row first (sync jobs
+    do, to pick up a new login or a token refreshed by another process).
+    """
+    if not reload and (cached := cached_gmail_credentials(user_id)) is not None:
+        return cached
+    row = GmailCredential.objects.filter(user_id=user_id).first()
+    if row is None:
+        forget_gmail_user(user_id)
+        return None
+    return gmail_credentials(user_id, _credentials_data(row))
+
+
+def has_credentials(user_id: str) -> bool:
+    return load_credentials(user_id) is not None
+
+
+def delete_credentials(user_id: str) -> None:
+    GmailCredential.objects.filter(user_id=user_id).delete()
+    forget_gmail_user(user_id)
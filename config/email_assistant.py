@@ -1,18 +1,29 @@
-import os, base64, re, html
+import os, base64, re, html, logging
 from dotenv import load_dotenv
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.vectorstores import Chroma
+from langchain_community.vectorstores import Chroma
 from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
 from django.http import JsonResponse
 from google_auth_oauthlib.flow import Flow
 from django.shortcuts import redirect
 from django.conf import settings
+from . import fulltext
 from .email_cache import chroma_collection_name
+from .chroma_storage import user_client
+from .clients import chat_model, credentials_to_dict, gmail_service
+from .gmail_quota import QUOTA_UNITS, execute, service_key
+from .embeddings import check_collection_model, get_embeddings
+from .metrics import span, start_span
+from .retrieval import HybridRetriever
+from .tokens import count_tokens
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 # Utility: decode base64 Gmail message parts
 def extract_text_from_payload(payload):
@@ -25,46 +36,224 @@ def extract_text_from_payload(payload):
     return ""
 
 
-CHROMA_DB_DIR = "./chroma_db"  # Path must match your previous write location
+QA_STRATEGIES = ("packed", "map_reduce")
+PROMPT_OVERHEAD_TOKENS = 200  # stuff prompt template + instructions
+MAX_CHUNK_OVERLAP = 400  # chars; the splitter overlaps chunks by up to 200
 
 
-def build_email_qa_chain_from_chroma(user_id: str):
-    embeddings = OpenAIEmbeddings()
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts (and times, as the `llm` stage) LLM calls made while answering one question."""
+
+    run_inline = True  # time the calls on the event loop, not from a callback thread
+
+    def __init__(self):
+        self.calls = 0
+        self._running = {}  # run_id -> finish()
+
+    def on_llm_start(self, *args, run_id=None, **kwargs):
+        self.calls += 1
+        self._running[run_id] = start_span("llm")
+
+    def on_chat_model_start(self, *args, run_id=None, **kwargs):
+        self.calls += 1
+        self._running[run_id] = start_span("llm")
+
+    def on_llm_end(self, *args, run_id=None, **kwargs):
+        if finish := self._running.pop(run_id, None):
+            finish()
+
+    def on_llm_error(self, error, *args, run_id=None, **kwargs):
+        if finish := self._running.pop(run_id, None):
+            finish(error)
+
+
+def _merge_overlap(first: str, second: str, min_overlap: int = 20):
+    """Join `second` onto `first` when the end of one repeats the start of the other."""
+    if second in first:
+        return first
+    for size in range(
+        min(len(first), len(second), MAX_CHUNK_OVERLAP), min_overlap - 1, -1
+    ):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def dedupe_chunks(docs):
+    """Drop repeated chunks and merge overlapping chunks of the same message."""
+    merged = []
+    for doc in docs:
+        message_id = doc.metadata.get("message_id")
+        for i, kept in enumerate(merged):
+            if message_id:
+                if kept.metadata.get("message_id") != message_id:
+                    continue
+                text = _merge_overlap(
+                    kept.page_content, doc.page_content
+                ) or _merge_overlap(doc.page_content, kept.page_content)
+            else:
+                text = (
+                    kept.page_content if kept.page_content == doc.page_content else None
+                )
+            if text is not None:
+                merged[i] = Document(page_content=text, metadata=kept.metadata)
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def fits_token_budget(docs, question: str, budget: int) -> bool:
+    used = PROMPT_OVERHEAD_TOKENS + count_tokens(question)
+    for doc in docs:
+        used += count_tokens(doc.page_content)
+        if used > budget:
+            return False
+    return True
+
+
+class EmailQA:
+    """Answers questions over one user's collection.
+
+    The "packed" strategy puts every retrieved chunk into a single stuff
+    prompt when they fit EMAIL_QA_TOKEN_BUDGET, and only falls back to
+    map_reduce (one LLM call per chunk plus one to combine) when they do not.
+    """
+
+    def __init__(self, retriever, llm):
+        self.retriever = retriever
+        self.llm = llm
+        self.stuff_chain = load_qa_chain(llm, chain_type="stuff")
+        self.map_reduce_chain = load_qa_chain(llm, chain_type="map_reduce")
+
+    def _plan(self, question: str, docs, strategy: str | None):
+        """Pick the chain for this question; returns `(strategy, docs)`."""
+        if (strategy or settings.EMAIL_QA_STRATEGY) == "packed":
+            packed = dedupe_chunks(docs)
+            if fits_token_budget(packed, question, settings.EMAIL_QA_TOKEN_BUDGET):
+                return "packed", packed
+        return "map_reduce", docs
+
+    def answer(self, question: str, strategy: str | None = None) -> dict:
+        with span("retrieve"):
+            docs = self.retriever.invoke(question)
+        used_strategy, docs = self._plan(question, docs, strategy)
+        chain = self.stuff_chain if used_strategy == "packed" else self.map_reduce_chain
+
+        counter = LLMCallCounter()
+        result = chain.invoke(
+            {"input_documents": docs, "question": question},
+            config={"callbacks": [counter]},
+        )
+        return self._result(result, docs, used_strategy, counter)
+
+    async def aanswer(self, question: str, strategy: str | None = None) -> dict:
+        with span("retrieve"):
+            docs = await self.retriever.ainvoke(question)
+        used_strategy, docs = self._plan(question, docs, strategy)
+        chain = self.stuff_chain if used_strategy == "packed" else self.map_reduce_chain
+
+        counter = LLMCallCounter()
+        result = await chain.ainvoke(
+            {"input_documents": docs, "question": question},
+            config={"callbacks": [counter]},
+        )
+        return self._result(result, docs, used_strategy, counter)
+
+    @staticmethod
+    def _result(result, docs, used_strategy, counter) -> dict:
+        return {
+            "answer": result.get("output_text") or "No answer.",
+            "source_documents": docs,
+            "strategy": used_strategy,
+            "llm_calls": counter.calls,
+        }
+
+    async def astream_answer(self, question: str, strategy: str | None = None):
+        """Yield `("sources", docs)`, then `("token", text)` chunks, then `("done", info)`.
+
+        Packed answers stream token by token. A map_reduce fallback can only
+        stream once its map steps finish, so its answer arrives as one chunk.
+        """
+        with span("retrieve"):
+            docs = await self.retriever.ainvoke(question)
+        used_strategy, docs = self._plan(question, docs, strategy)
+        yield "sources", docs
+
+        counter = LLMCallCounter()
+        config = {"callbacks": [counter]}
+        if used_strategy == "packed":
+            prompt = self.stuff_chain.llm_chain.prompt.format_prompt(
+                context=self.stuff_chain.document_separator.join(
+                    doc.page_content for doc in docs
+                ),
+                question=question,
+            )
+            async for chunk in self.llm.astream(prompt, config=config):
+                if chunk.content:
+                    yield "token", chunk.content
+        else:
+            result = await self.map_reduce_chain.ainvoke(
+                {"input_documents": docs, "question": question}, config=config
+            )
+            yield "token", result.get("output_text") or "No answer."
+
+        yield "done", {"strategy": used_strategy, "llm_calls": counter.calls}
+
+
+def build_email_qa_chain_from_chroma(user_id: str) -> EmailQA:
+    """Build a QA helper over the user's collection using the shared clients.
+
+    Callers answering requests should go through `registry.hold_qa_chain`,
+    which reuses these between requests.
+    """
+    embeddings = get_embeddings()
 
     vectorstore = Chroma(
+        client=user_client(user_id),
         embedding_function=embeddings,
-        persist_directory=CHROMA_DB_DIR,
         collection_name=chroma_collection_name(user_id),
     )
+    check_collection_model(vectorstore._collection, embeddings.model)
 
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 5})
+    k = settings.QA_RETRIEVAL_K
+    if settings.QA_RETRIEVER == "hybrid":
+        fulltext.backfill_from_chroma(user_id, vectorstore._collection)
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            user_id=user_id,
+            k=k,
+            fetch_k=settings.QA_RETRIEVAL_CANDIDATES,
+        )
+    else:
+        retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": k})
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=ChatOpenAI(model="gpt-3.5-turbo", temperature=0),
-        retriever=retriever,
-        chain_type="map_reduce",  # ✅ avoids stuffing too many tokens
-        return_source_documents=True,  # Optional: helpful for debugging
-    )
-
-    return qa_chain
+    return EmailQA(retriever, llm=chat_model("gpt-3.5-turbo", temperature=0))
 
 
 # Step 1: Get and clean email content
-def get_emails_from_gmail(session_credentials):
-    creds = Credentials(**session_credentials)
-    service = build("gmail", "v1", credentials=creds)
+def get_emails_from_gmail(session_credentials, user_id: str):
+    service = gmail_service(user_id, session_credentials)
+    key = service_key(service)
 
-    results = (
+    results = execute(
+        key,
         service.users()
         .messages()
-        .list(userId="me", maxResults=100, q="category:primary")
-        .execute()
+        .list(userId="me", maxResults=100, q="category:primary"),
+        QUOTA_UNITS["messages.list"],
+        "gmail.messages",
     )
     message_ids = results.get("messages", [])
 
     emails = []
     for msg in message_ids:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
+        msg_data = execute(
+            key,
+            service.users().messages().get(userId="me", id=msg["id"]),
+            QUOTA_UNITS["messages.get"],
+            "gmail.messages",
+        )
         payload = msg_data.get("payload", {})
         body = extract_text_from_payload(payload) or msg_data.get("snippet", "")
         cleaned = html.unescape(re.sub(r"[\u034f\u200c\ufeff]+", "", body)).strip()
@@ -107,18 +296,7 @@ def oauth2callback(request):
 
 def email_assistant_view(request):
     creds = request.session.get("credentials")
-    print(f"{request}")
+    logger.debug("email_assistant_view: %s", request)
     if not creds:
         return JsonResponse({"error": "Not authenticated"}, status=401)
     # ... fetch emails and answer question ...
-
-
-def credentials_to_dict(credentials):
-    return {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes,
-    }
@@ -1,25 +1,287 @@
-import os, json
+"""Per-user sync state: processed message IDs, history checkpoints, resume cursors.
+
+Everything lives in one SQLite database in WAL mode, so gunicorn workers and
+sync threads can read while one of them writes, and every write is an atomic
+transaction. `transaction()` lets a sync commit a batch's message IDs and its
+page cursor together, right after the batch's chunks are upserted.
+Old per-user JSON files in CACHE_DIR are imported the first time the
+database is opened. `mailbox_lock` keeps two syncs of one mailbox from
+running at once, across threads and worker processes.
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
 
 CACHE_DIR = "email_cache"
 os.makedirs(CACHE_DIR, exist_ok=True)  # one-time directory creation
 
+STORED = "stored"  # chunks are in the vector store
+EMPTY = "empty"  # fetched, but had no text to embed
+FAILED = "failed"  # fetch failed; retried on the next sync
+DONE_STATES = (STORED, EMPTY)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_messages (
+    user_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    user_id TEXT PRIMARY KEY,
+    history_id TEXT,
+    cursor TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+_SQL_VARS = 500  # IDs per IN (...) lookup
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """This thread's connection to the sync-state database."""
+    conn = getattr(_local, "conn", None)
+    # never reuse a connection across fork()
+    if conn is None or _local.pid != os.getpid():
+        path = settings.SYNC_STATE_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.pid = conn, os.getpid()
+        _import_json_files(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """Run the enclosed writes as one atomic commit; nested uses join the outer one."""
+    conn = _connect()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+# ---- Processed message IDs ----------------------------------------------------
+
+
+def processed_among(user_id: str, message_ids) -> set[str]:
+    """The subset of `message_ids` that is already synced (indexed lookups)."""
+    message_ids = list(message_ids)
+    conn = _connect()
+    found = set()
+    for start in range(0, len(message_ids), _SQL_VARS):
+        chunk = message_ids[start : start + _SQL_VARS]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT message_id FROM processed_messages WHERE user_id = ? "
+            f"AND message_id IN ({marks}) AND state IN (?, ?)",
+            [user_id, *chunk, *DONE_STATES],
+        )
+        found.update(message_id for (message_id,) in rows)
+    return found
+
+
+def count_processed(user_id: str) -> int:
+    (count,) = (
+        _connect()
+        .execute(
+            "SELECT COUNT(*) FROM processed_messages WHERE user_id = ? AND state IN (?, ?)",
+            [user_id, *DONE_STATES],
+        )
+        .fetchone()
+    )
+    return count
+
+
+def mark_messages(user_id: str, states: dict[str, str]) -> None:
+    """Record the sync state of each message ID (one batched insert)."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO processed_messages (user_id, message_id, state, updated_at) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (user_id, message_id) "
+            "DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            [(user_id, message_id, state, now) for message_id, state in states.items()],
+        )
+
+
+def forget_messages(user_id: str, message_ids) -> None:
+    with transaction() as conn:
+        conn.executemany(
+            "DELETE FROM processed_messages WHERE user_id = ? AND message_id = ?",
+            [(user_id, message_id) for message_id in message_ids],
+        )
+
+
+# ---- Checkpoints ------------------------------------------------------------------
+
+
+def _load_checkpoint(user_id: str, column: str):
+    row = (
+        _connect()
+        .execute(f"SELECT {column} FROM sync_checkpoints WHERE user_id = ?", [user_id])
+        .fetchone()
+    )
+    return row[0] if row else None
+
+
+def _save_checkpoint(user_id: str, column: str, value) -> None:
+    with transaction() as conn:
+        conn.execute(
+            f"INSERT INTO sync_checkpoints (user_id, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT (user_id) DO UPDATE SET {column} = excluded.{column}, "
+            "updated_at = excluded.updated_at",
+            [user_id, value, time.time()],
+        )
+
+
+def load_history_id(user_id: str) -> str | None:
+    """Return the Gmail historyId recorded after the user's last sync, if any."""
+    return _load_checkpoint(user_id, "history_id")
+
+
+def save_history_id(user_id: str, history_id: str) -> None:
+    _save_checkpoint(user_id, "history_id", str(history_id))
+
+
+def load_sync_cursor(user_id: str) -> dict | None:
+    """Return the resume point of an unfinished full sync, if any."""
+    cursor = _load_checkpoint(user_id, "cursor")
+    return json.loads(cursor) if cursor else None
+
+
+def save_sync_cursor(user_id: str, cursor: dict | None) -> None:
+    """Record the resume point of a full sync, or clear it once the sync completes."""
+    _save_checkpoint(user_id, "cursor", json.dumps(cursor) if cursor else None)
+
+
+# ---- Import of the old JSON cache files ---------------------------------------------
+
+
+def _import_json_files(conn) -> None:
+    """Move `<user>_message_ids.json` / `_history.json` / `_sync_cursor.json` into the database.
+
+    Imported files are renamed to `*.imported`. Rows already in the database
+    win, so a worker that imports late cannot roll anything back.
+    """
+    suffixes = ("_message_ids.json", "_history.json", "_sync_cursor.json")
+    paths = [
+        p
+        for suffix in suffixes
+        for p in glob.glob(os.path.join(CACHE_DIR, f"*{suffix}"))
+    ]
+    if not paths:
+        return
+    now = time.time()
+    with transaction():
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # renamed by another worker, or unreadable
+            name = os.path.basename(path)
+            if name.endswith("_message_ids.json"):
+                user_id = name.removesuffix("_message_ids.json")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO processed_messages VALUES (?, ?, ?, ?)",
+                    [(user_id, message_id, STORED, now) for message_id in data],
+                )
+            elif name.endswith("_history.json"):
+                user_id = name.removesuffix("_history.json")
+                conn.execute(
+                    "INSERT INTO sync_checkpoints (user_id, history_id, updated_at) "
+                    "VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET history_id = "
+                    "COALESCE(sync_checkpoints.history_id, excluded.history_id)",
+                    [user_id, data.get("history_id"), now],
+                )
+            else:
+                user_id = name.removesuffix("_sync_cursor.json")
+                conn.execute(
+                    "INSERT INTO sync_checkpoints (user_id, cursor, updated_at) "
+                    "VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET cursor = "
+                    "COALESCE(sync_checkpoints.cursor, excluded.cursor)",
+                    [user_id, json.dumps(data), now],
+                )
+    for path in paths:
+        try:
+            os.replace(path, f"{path}.imported")
+        except FileNotFoundError:
+            pass
+    logger.info(
+        "📦 Imported %d JSON cache files into %s", len(paths), settings.SYNC_STATE_PATH
+    )
+
+
+# ---- Mailbox lock ------------------------------------------------------------
+
+
+@contextmanager
+def mailbox_lock(user_id: str, on_wait=None, poll_seconds: float = 1.0):
+    """Hold the user's sync lock for the block, waiting while another sync has it.
+
+    The lock is an flock on a file next to the sync-state database, so it
+    works across gunicorn workers and is released if the process dies.
+    `on_wait` is called on every poll while waiting.
+    """
+    directory = os.path.join(os.path.dirname(settings.SYNC_STATE_PATH) or ".", "locks")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{user_id}.lock"), "a") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if on_wait is not None:
+                    on_wait()
+                time.sleep(poll_seconds)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# ---- Collection bookkeeping ----------------------------------------------------
+
 
-def _cache_path(user_id: str) -> str:
-    """Return the per-user cache path."""
-    return os.path.join(CACHE_DIR, f"{user_id}_message_ids.json")
+def _version_path(user_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{user_id}_collection.version")
 
 
-def load_processed_ids(user_id: str) -> set[str]:
-    path = _cache_path(user_id)
-    if not os.path.exists(path):
-        return set()
-    with open(path, "r") as f:
-        return set(json.load(f))
+def collection_version(user_id: str) -> int:
+    """Changes whenever the user's Chroma collection is written (shared across workers)."""
+    try:
+        return os.stat(_version_path(user_id)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
 
 
-def save_processed_ids(user_id: str, ids: set[str]) -> None:
-    with open(_cache_path(user_id), "w") as f:
-        json.dump(list(ids), f)
+def bump_collection_version(user_id: str) -> None:
+    path = _version_path(user_id)
+    with open(path, "a"):
+        pass
+    os.utime(path)
 
 
 def chroma_collection_name(user_id: str) -> str:
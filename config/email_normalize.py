@@ -0,0 +1,177 @@
+"""Email-aware cleanup of message bodies before they are embedded.
+
+Replies carry the whole quoted history of the thread, and most mail ends in
+a signature, a disclaimer or an unsubscribe footer. Embedding all of that
+again for every message makes cost and index size grow with thread length,
+so only the text a message adds is kept. The quoted part is usually the
+earlier messages of the thread, indexed on their own (the chunk metadata
+keeps `thread_id` and `in_reply_to`); a quote of mail that is not in the
+mailbox is dropped with it. Forwarded mail is kept: only the forward
+header lines are removed, since the forwarded text is often indexed
+nowhere else.
+"""
+
+import hashlib
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .tokens import count_tokens
+
+# Everything from the first of these lines on is quoted history
+QUOTE_HEADERS = [
+    re.compile(r"^On\b[^\n]*(?:\n[^\n]*)?\bwrote:[ \t]*$", re.M),
+    re.compile(r"^Le\b[^\n]*(?:\n[^\n]*)?\ba écrit ?:[ \t]*$", re.M),
+    re.compile(r"^Am\b[^\n]*(?:\n[^\n]*)?\bschrieb[^\n]*:[ \t]*$", re.M),
+    re.compile(r"^El\b[^\n]*(?:\n[^\n]*)?\bescribió:[ \t]*$", re.M),
+    re.compile(r"^-{2,}[ \t]*Original Message[ \t]*-{2,}[ \t]*$", re.M | re.I),
+]
+# Outlook puts the same header block above quoted history and forwarded mail,
+# so these only start a quote in replies (see `is_forward`)
+OUTLOOK_HEADERS = [
+    re.compile(r"^_{10,}[ \t]*\n(?=From:)", re.M),
+    # "From:" followed closely by "Sent:"
+    re.compile(r"^From:[^\n]*\n(?:[^\n]*\n){0,3}?Sent:[^\n]*$", re.M),
+]
+OUTLOOK_FORWARD_HEADER = re.compile(
+    r"^(?:_{10,}[ \t]*\n)?From:[^\n]*\n(?:(?:To|Cc|Date|Subject):[^\n]*\n){0,3}?"
+    r"Sent:[^\n]*\n(?:(?:To|Cc|Bcc|Date|Subject|Importance):[^\n]*\n)*",
+    re.M,
+)
+FORWARD_SUBJECT = re.compile(r"^\s*fwd?\s*:", re.I)
+QUOTED_LINE = re.compile(r"^[ \t]*>[^\n]*\n?", re.M)
+FORWARD_MARKER = re.compile(
+    r"^(?:-{3,}[ \t]*Forwarded message[ \t]*-{3,}|Begin forwarded message:)[ \t]*\n"
+    r"(?:(?:From|Date|Sent|Subject|To|Cc):[^\n]*\n)*",
+    re.M | re.I,
+)
+SIGNATURE_DELIMITER = re.compile(r"^--[ \t]?$", re.M)
+MOBILE_SIGNOFF = re.compile(
+    r"^(?:Sent from my [^\n]{1,40}|Get Outlook for [^\n]{1,20}|Sent from Mail for Windows)[ \t]*$",
+    re.M | re.I,
+)
+BOILERPLATE = re.compile(
+    r"unsubscribe|manage (?:your )?(?:email )?(?:preferences|subscriptions)"
+    r"|view (?:this email )?in (?:your )?browser"
+    r"|(?:e-?mail|message)(?: and any attachments)? (?:is|are|may be|contains?) (?:strictly )?confidential"
+    r"|intended (?:solely |only )?for the (?:use of the )?(?:individual|addressee|named recipient)"
+    r"|if you (?:are not the intended recipient|have received this (?:e-?mail|message) in error)",
+    re.I,
+)
+BOILERPLATE_MAX_CHARS = 600  # longer paragraphs are content that happens to match
+FOOTER_PARAGRAPHS = 3  # trailing paragraphs checked for repeated footers
+# messages a trailing paragraph must appear in to count as a footer
+REPEATED_FOOTER_MIN = 3
+
+
+@dataclass
+class NormalizedBody:
+    text: str
+    stripped: list = field(default_factory=list)  # kinds of content removed
+    tokens_saved: int = 0
+
+
+def is_forward(headers) -> bool:
+    """A forward (FW:/Fwd: subject) rather than a reply to the thread."""
+    if headers.get("In-Reply-To"):
+        return False
+    return bool(FORWARD_SUBJECT.match(headers.get("Subject", "")))
+
+
+def _paragraphs(text: str) -> list[str]:
+    return [p for p in re.split(r"\n[ \t]*\n", text) if p.strip()]
+
+
+def _footer_key(paragraph: str) -> str:
+    # Ignore dates, counts and spacing so per-message variants match
+    canonical = re.sub(r"\d+", "0", " ".join(paragraph.lower().split()))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class EmailNormalizer:
+    """Strips quotes, signatures and footers; remembers footers across messages.
+
+    Call `observe` with the bodies of a batch first, so footers repeated
+    within the batch are caught on their first appearance.
+    """
+
+    def __init__(self):
+        self._footer_counts = Counter()
+        self._seen = set()
+
+    def observe(self, text: str) -> None:
+        if not text:
+            return
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        if digest in self._seen:  # the same message twice must not make a footer
+            return
+        self._seen.add(digest)
+        trailing = _paragraphs(text)[-FOOTER_PARAGRAPHS:]
+        self._footer_counts.update({_footer_key(p) for p in trailing})
+
+    def normalize(self, text: str, forward: bool = False) -> NormalizedBody:
+        """Clean one body; with `forward`, Outlook header blocks are not quotes."""
+        if not text:
+            return NormalizedBody(text)
+        original = text = text.replace("\r\n", "\n")
+        stripped = []
+
+        quote_headers = QUOTE_HEADERS if forward else QUOTE_HEADERS + OUTLOOK_HEADERS
+        cut = min(
+            (m.start() for p in quote_headers if (m := p.search(text))), default=None
+        )
+        if cut is not None:
+            text = text[:cut]
+            stripped.append("quote")
+        text, quoted_lines = QUOTED_LINE.subn("", text)
+        if quoted_lines and "quote" not in stripped:
+            stripped.append("quote")
+
+        text, forwards = FORWARD_MARKER.subn("", text)
+        if forward:
+            text, outlook_forwards = OUTLOOK_FORWARD_HEADER.subn("", text)
+            forwards += outlook_forwards
+        if forwards:
+            stripped.append("forward_header")
+
+        signature = SIGNATURE_DELIMITER.search(text)
+        if signature:
+            text = text[: signature.start()]
+        text, signoffs = MOBILE_SIGNOFF.subn("", text)
+        if signature or signoffs:
+            stripped.append("signature")
+
+        kept, footers = self._strip_footers(_paragraphs(text))
+        if footers:
+            stripped.append("footer")
+        text = "\n\n".join(p.strip("\n") for p in kept).strip()
+
+        if not text:
+            # Nothing of its own (e.g. a bare "+1" lost to the rules); keep the message
+            return NormalizedBody(original.strip())
+        if not stripped:
+            return NormalizedBody(text)
+        saved = count_tokens(original) - count_tokens(text)
+        return NormalizedBody(text, stripped, max(saved, 0))
+
+    def _strip_footers(self, paragraphs):
+        kept, removed = [], 0
+        tail_start = len(paragraphs) - FOOTER_PARAGRAPHS
+        for i, paragraph in enumerate(paragraphs):
+            boilerplate = len(
+                paragraph
+            ) <= BOILERPLATE_MAX_CHARS and BOILERPLATE.search(paragraph)
+            repeated = (
+                i >= tail_start
+                and self._footer_counts[_footer_key(paragraph)] >= REPEATED_FOOTER_MIN
+            )
+            if boilerplate or repeated:
+                removed += 1
+            else:
+                kept.append(paragraph)
+        return kept, removed
+
+
+def normalize_body(text: str, forward: bool = False) -> NormalizedBody:
+    """Normalize a single message with no cross-message footer memory."""
+    return EmailNormalizer().normalize(text, forward)
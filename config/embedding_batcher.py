@@ -0,0 +1,162 @@
+"""One embedding queue per process, shared by every sync and question.
+
+Each sync embeds its own chunks and each question embeds one query, so
+under load the provider sees many small calls. `BatchedEmbeddings` queues
+the texts of every caller and sends them together: a batch goes out once
+it holds EMBEDDING_BATCH_MAX_INPUTS texts or EMBEDDING_BATCH_MAX_TOKENS
+tokens, or EMBEDDING_BATCH_WAIT_MS after its oldest text was queued. Up to
+EMBEDDING_BATCH_CONCURRENCY batches are in flight at once. A caller's
+texts may be split over several batches; it gets its vectors back, in
+order, once all of them are done. A failed batch fails every caller with
+texts in it.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from .metrics import span
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """One caller's texts; `future` resolves to their vectors."""
+
+    def __init__(self, count: int):
+        self.future = Future()
+        self.vectors = [None] * count
+        self.remaining = count
+        self.lock = threading.Lock()
+
+    def fill(self, index: int, vector) -> None:
+        with self.lock:
+            self.vectors[index] = vector
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done and not self.future.done():
+            self.future.set_result(self.vectors)
+
+    def fail(self, error: BaseException) -> None:
+        with self.lock:
+            if self.future.done():
+                return
+            self.future.set_exception(error)
+
+
+class BatchedEmbeddings(Embeddings):
+    """Wrap `embeddings` so concurrent calls share provider requests."""
+
+    def __init__(
+        self,
+        embeddings,
+        model: str,
+        max_inputs: int,
+        max_tokens: int,
+        wait_seconds: float,
+        concurrency: int,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_inputs = max(1, max_inputs)
+        self.max_tokens = max_tokens
+        self.wait_seconds = wait_seconds
+        self.batches = 0
+        self.texts = 0
+        self._pending = deque()  # (request, index, text, tokens, queued at)
+        self._pending_tokens = 0
+        self._slots = threading.Semaphore(max(1, concurrency))
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(
+            max(1, concurrency), thread_name_prefix="embed-batch"
+        )
+        threading.Thread(
+            target=self._flush_loop, name="embed-batcher", daemon=True
+        ).start()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._submit(texts).result() if texts else []
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(self._submit(texts)) if texts else []
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    def _submit(self, texts: list[str]) -> Future:
+        request = _Request(len(texts))
+        sizes = [count_tokens(text, self.model) for text in texts]
+        now = time.monotonic()
+        with self._cond:
+            for index, (text, tokens) in enumerate(zip(texts, sizes)):
+                self._pending.append((request, index, text, tokens, now))
+                self._pending_tokens += tokens
+            self._cond.notify()
+        return request.future
+
+    def _full(self) -> bool:
+        return (
+            len(self._pending) >= self.max_inputs
+            or self._pending_tokens >= self.max_tokens
+        )
+
+    def _take_batch(self) -> list:
+        """Pop the oldest texts that fit one provider request (at least one text)."""
+        batch, tokens = [], 0
+        while self._pending and len(batch) < self.max_inputs:
+            size = self._pending[0][3]
+            if batch and tokens + size > self.max_tokens:
+                break
+            batch.append(self._pending.popleft())
+            tokens += size
+        self._pending_tokens -= tokens
+        return batch
+
+    def _flush_loop(self):
+        while True:
+            self._slots.acquire()  # wait for a free slot before picking the batch
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while not self._full():
+                    left = self._pending[0][4] + self.wait_seconds - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._take_batch()
+            self._pool.submit(self._send, batch)
+
+    def _send(self, batch: list) -> None:
+        try:
+            with span("embed.batch", texts=len(batch)):
+                vectors = self.embeddings.embed_documents([item[2] for item in batch])
+        except Exception as exc:
+            logger.warning("❌ Embedding batch of %d texts failed: %s", len(batch), exc)
+            for request in {id(item[0]): item[0] for item in batch}.values():
+                request.fail(exc)
+        else:
+            for (request, index, *_), vector in zip(batch, vectors):
+                request.fill(index, vector)
+            with self._cond:
+                self.batches += 1
+                self.texts += len(batch)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch": round(self.texts / self.batches, 1) if self.batches else 0,
+                "pending": len(self._pending),
+            }
@@ -0,0 +1,178 @@
+"""Content-addressed, on-disk cache in front of an embeddings model.
+
+Vectors are keyed by (model, hash of the normalized text) in a SQLite file,
+so identical text (repeated newsletters, re-syncs after a lost ID cache) is
+embedded once. The least recently used entries are evicted when the file
+grows past its size limit.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+_SQL_VARS = 500  # keys per IN (...) lookup
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap `embeddings` with a persistent LRU cache stored at `path`."""
+
+    def __init__(self, embeddings, model: str, path: str, max_bytes: int):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        # Running total of `size`, so a store does not have to scan the table
+        (self._size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, missing = self._partition(texts)
+        vectors = (
+            self.embeddings.embed_documents(list(missing.values())) if missing else []
+        )
+        return self._merge(keys, found, missing, vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        keys, found, missing = self._partition([text])
+        vectors = [self.embeddings.embed_query(text)] if missing else []
+        return self._merge(keys, found, missing, vectors)[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, missing = await asyncio.to_thread(self._partition, texts)
+        vectors = []
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+        return await asyncio.to_thread(self._merge, keys, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        keys, found, missing = await asyncio.to_thread(self._partition, [text])
+        vectors = [await self.embeddings.aembed_query(text)] if missing else []
+        return (await asyncio.to_thread(self._merge, keys, found, missing, vectors))[0]
+
+    def _partition(self, texts):
+        """Return `(keys, cached vectors, missing key -> text)`, one miss per distinct text."""
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self._lookup(set(keys))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, vectors):
+        if missing:
+            fresh = dict(zip(missing, vectors))
+            self._store(fresh)
+            found.update(fresh)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+            }
+
+    def _lookup(self, keys) -> dict:
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_VARS):
+                chunk = keys[start : start + _SQL_VARS]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._db.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})",
+                        [now, *chunk],
+                    )
+        return found
+
+    def _store(self, vectors: dict) -> None:
+        now = time.time()
+        rows = []
+        for key, vector in vectors.items():
+            blob = array("f", vector).tobytes()
+            rows.append((key, blob, len(blob) + len(key), now))
+        added = 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            for row in rows:
+                # A key another process stored meanwhile holds the same vector
+                inserted = self._db.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    row,
+                ).rowcount
+                added += row[2] if inserted else 0
+            self._db.execute("COMMIT")
+            self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes sharing the file add and evict too; recount before trimming
+        (size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+        self._size = size
+        if size <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so we do not evict on every insert
+        target = size - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, entry_size in self._db.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_used"
+        ):
+            doomed.append((key,))
+            freed += entry_size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._size = size - freed
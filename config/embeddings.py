@@ -0,0 +1,127 @@
+import os
+import threading
+
+from django.conf import settings
+from langchain_openai import OpenAIEmbeddings
+
+from .clients import openai_http_client
+from .embedding_batcher import BatchedEmbeddings
+from .embedding_cache import CachedEmbeddings
+
+EMBEDDING_PROVIDERS = ("openai", "onnx")
+# Collections indexed before the model was recorded were built with OpenAI's default
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+_cached = None
+_batched = None
+_local_model = None
+_lock = threading.Lock()
+
+
+class EmbeddingModelMismatch(Exception):
+    """A collection was indexed with a different embedding model than the configured one."""
+
+
+def _local_embeddings():
+    """The process-wide ONNX model (loading it takes seconds, so it is built once)."""
+    global _local_model
+    if _local_model is None:
+        from .onnx_embeddings import OnnxEmbeddings, resolve_model_dir
+
+        model_dir = resolve_model_dir(
+            settings.ONNX_EMBEDDING_MODEL, settings.ONNX_EMBEDDING_DIR or None
+        )
+        _local_model = OnnxEmbeddings(
+            settings.ONNX_EMBEDDING_MODEL,
+            model_dir,
+            batch_size=settings.ONNX_EMBEDDING_BATCH_SIZE,
+            threads=settings.ONNX_EMBEDDING_THREADS,
+        )
+    return _local_model
+
+
+def _base_embeddings():
+    provider = settings.EMBEDDING_PROVIDER
+    if provider == "onnx":
+        return _local_embeddings()
+    if provider == "openai":
+        return OpenAIEmbeddings(http_client=openai_http_client())
+    raise ValueError(
+        f"EMBEDDING_PROVIDER must be one of {', '.join(EMBEDDING_PROVIDERS)}, not {provider!r}"
+    )
+
+
+def _batched_embeddings():
+    """The provider behind the process-wide batch queue, when batching is on."""
+    global _batched
+    if not settings.EMBEDDING_BATCHING:
+        return _base_embeddings()
+    if _batched is None:
+        embeddings = _base_embeddings()
+        _batched = BatchedEmbeddings(
+            embeddings,
+            model=embeddings.model,
+            max_inputs=settings.EMBEDDING_BATCH_MAX_INPUTS,
+            max_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS,
+            wait_seconds=settings.EMBEDDING_BATCH_WAIT_MS / 1000,
+            concurrency=settings.EMBEDDING_BATCH_CONCURRENCY,
+        )
+    return _batched
+
+
+def get_embeddings():
+    """Return the embeddings model used for indexing and retrieval.
+
+    EMBEDDING_PROVIDER picks the OpenAI API or a local ONNX model. With
+    EMBEDDING_BATCHING, calls from every user go through one batch queue
+    (see `embedding_batcher`), and with EMBEDDING_CACHE_ENABLED the model
+    is wrapped in a process-wide on-disk cache shared by every user, so
+    only cache misses are queued.
+    """
+    global _cached
+    with _lock:
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return _batched_embeddings()
+        if _cached is None:
+            embeddings = _batched_embeddings()
+            os.makedirs(os.path.dirname(settings.EMBEDDING_CACHE_PATH), exist_ok=True)
+            _cached = CachedEmbeddings(
+                embeddings,
+                model=embeddings.model,
+                path=settings.EMBEDDING_CACHE_PATH,
+                max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            )
+    return _cached
+
+
+def embedding_cache_stats():
+    """Hit/miss counters and size of the embedding cache, or None when disabled."""
+    return _cached.stats() if _cached else None
+
+
+def embedding_batch_stats():
+    """Batch counts of the shared embedding queue, or None when batching is off."""
+    return _batched.stats() if _batched else None
+
+
+def check_collection_model(collection, model: str) -> None:
+    """Record `model` on an empty collection; refuse one indexed with another model.
+
+    Vectors from different models are not comparable, so a collection must
+    be rebuilt (delete it and resync) after EMBEDDING_PROVIDER or the model
+    changes.
+    """
+    metadata = collection.metadata or {}
+    recorded = metadata.get("embedding_model")
+    if recorded == model:
+        return
+    if collection.count():
+        recorded = recorded or LEGACY_EMBEDDING_MODEL
+        if recorded != model:
+            raise EmbeddingModelMismatch(
+                f"Collection {collection.name} was indexed with {recorded}, not {model}; "
+                "delete it and resync to switch models."
+            )
+    # The distance function cannot be changed, so it is left out of the update
+    kept = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+    collection.modify(metadata={**kept, "embedding_model": model})
@@ -1,23 +1,103 @@
 import os
 import re
 import html
-import base64
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import hashlib
+import logging
+import time
+from googleapiclient.errors import HttpError
+from django.conf import settings
 from django.http import JsonResponse
-from django.utils.html import escape
+from django.urls import reverse
 from collections import defaultdict
+from dataclasses import dataclass, field
 
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
-from .email_cache import load_processed_ids, save_processed_ids, chroma_collection_name
-import traceback
+from .email_cache import (
+    EMPTY,
+    FAILED,
+    STORED,
+    count_processed,
+    forget_messages,
+    mark_messages,
+    processed_among,
+    transaction,
+    load_history_id,
+    save_history_id,
+    load_sync_cursor,
+    save_sync_cursor,
+    chroma_collection_name,
+    mailbox_lock,
+)
+from . import fulltext
+from .chroma_storage import in_use, record_deletes, shard_path, user_client, user_shard
+from .credential_store import load_credentials
+from .email_normalize import EmailNormalizer, is_forward, normalize_body
+from .embeddings import (
+    check_collection_model,
+    embedding_batch_stats,
+    embedding_cache_stats,
+    get_embeddings,
+)
+from .gmail_quota import (
+    QUOTA_UNITS,
+    backoff_delay,
+    execute,
+    is_retryable,
+    report_throttled,
+    service_key,
+)
+from .metrics import span
+from .mime import FETCH_FIELDS, METADATA_HEADERS, parse_message
+from .pipeline import run_pipeline
+from .query_filters import label_flags, relabelled_metadata, sender_address
+from .registry import invalidate_user
+from .thread_index import (
+    THREADS_PER_PAGE,
+    backfill_from_chroma,
+    index_entry,
+    index_messages,
+    list_threads,
+    remove_messages,
+    update_labels,
+)
 
 # from django.contrib.auth.decorators import login_required
 
-CHROMA_DIR = "./chroma_db"
+logger = logging.getLogger(__name__)
+
+GMAIL_MAX_BATCH_SIZE = 100  # Gmail rejects batches with more than 100 calls
+SYNC_LABEL = "CATEGORY_PERSONAL"  # the label behind `category:primary`
+EXCLUDED_LABELS = {"TRASH", "SPAM"}
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+
+class HistoryExpired(Exception):
+    """The stored historyId is too old for `users.history.list`."""
+
+
+@dataclass
+class IngestBatch:
+    """One page of messages moving through the ingest pipeline."""
+
+    message_ids: list
+    # where listing resumes once this page is committed
+    next_page_token: str | None = None
+    pending: list = field(default_factory=list)  # IDs in this page not synced yet
+    message_states: dict = field(default_factory=dict)  # message ID -> STORED / EMPTY
+    messages: list = field(default_factory=list)
+    documents: list = field(default_factory=list)
+    chunks: list = field(default_factory=list)
+    # stored chunks of changed messages
+    replaced_chunk_ids: list = field(default_factory=list)
+    embeddings: list = field(default_factory=list)
+    # thread index rows, written on commit
+    index_entries: list = field(default_factory=list)
+    num_documents: int = 0
+    num_unchanged: int = 0
+    num_chunks: int = 0
+    tokens_saved: int = 0  # tokens of quotes, signatures and footers left out
 
 
 def clean_text(text):
@@ -26,189 +106,645 @@ def clean_text(text):
     return text.strip()
 
 
-def extract_email_body(payload):
-    """Recursively extract plain text from the email payload."""
-    if payload.get("mimeType") == "text/plain":
-        body_data = payload.get("body", {}).get("data")
-        if body_data:
-            return clean_text(
-                base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
-            )
-    elif payload.get("mimeType", "").startswith("multipart/"):
-        parts = payload.get("parts", [])
-        for part in parts:
-            result = extract_email_body(part)
-            if result:
-                return result
-    return ""
+def parse_message_text(msg_data):
+    """`ParsedMessage` of a raw, full or metadata message resource, body cleaned."""
+    parsed = parse_message(msg_data)
+    return parsed._replace(body=clean_text(parsed.body))
 
 
 def get_credentials(request):
-    user_id = str(request.user.id)
-    credentials_by_user = request.session.get("credentials_by_user")
+    """The logged-in user's Gmail `Credentials` from the credential store, or None."""
+    return load_credentials(str(request.user.id))
 
-    if not credentials_by_user:
-        return None
 
-    credentials_data = credentials_by_user.get(user_id)
-    return Credentials(**credentials_data) if credentials_data else None
+def list_message_pages(
+    service, query="category:primary", page_size=None, page_token=None
+):
+    """Yield `(message_ids, next_page_token)` for every page of `messages.list`."""
+    page_size = page_size or settings.GMAIL_PAGE_SIZE
+    while True:
+        request = (
+            service.users()
+            .messages()
+            .list(userId="me", maxResults=page_size, q=query, pageToken=page_token)
+        )
+        with span("gmail.messages"):
+            results = execute(
+                service_key(service),
+                request,
+                QUOTA_UNITS["messages.list"],
+                "gmail.messages",
+            )
+        page_token = results.get("nextPageToken")
+        yield results.get("messages", []), page_token
+        if not page_token:
+            return
 
 
 def get_message_ids(service, max_results=100, query="category:primary"):
-    results = (
+    message_ids = []
+    for page, _ in list_message_pages(service, query, page_size=min(max_results, 500)):
+        message_ids.extend(page)
+        if len(message_ids) >= max_results:
+            break
+    return message_ids[:max_results]
+
+
+def message_get_request(service, msg_id, fmt):
+    """A `messages.get` call that asks only for the fields the sync reads."""
+    extra = {"metadataHeaders": METADATA_HEADERS} if fmt == "metadata" else {}
+    return (
         service.users()
         .messages()
-        .list(userId="me", maxResults=max_results, q=query)
-        .execute()
+        .get(userId="me", id=msg_id, format=fmt, fields=FETCH_FIELDS[fmt], **extra)
     )
-    return results.get("messages", [])
 
 
-def build_documents_from_messages(service, message_ids):
+def fetch_messages(service, message_ids, batch_size=None, fmt=None):
+    """Fetch message resources, grouping `messages.get` calls into Gmail batch requests.
+
+    Messages that fail are skipped (and reported) instead of failing the whole
+    sync; calls Gmail throttles inside a batch are retried in a later batch.
+    A `batch_size` of 1 falls back to one HTTP round trip per message.
+    `fmt` defaults to GMAIL_FETCH_FORMAT.
+    """
+    fmt = fmt or settings.GMAIL_FETCH_FORMAT
+    batch_size = min(batch_size or settings.GMAIL_BATCH_SIZE, GMAIL_MAX_BATCH_SIZE)
+    ids = [msg["id"] for msg in message_ids]
+    key = service_key(service)
+    units = QUOTA_UNITS["messages.get"]
+    fetched, throttled = {}, []
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            if isinstance(exception, HttpError) and is_retryable(
+                exception.resp.status, exception.content.decode("utf-8", "replace")
+            ):
+                throttled.append(request_id)
+                return
+            logger.warning("⚠️ Skipping message %s: %s", request_id, exception)
+            return
+        fetched[request_id] = response
+
+    if batch_size <= 1:
+        for msg_id in ids:
+            request = message_get_request(service, msg_id, fmt)
+            try:
+                with span("gmail.messages"):
+                    response = execute(key, request, units, "gmail.messages")
+            except HttpError as exc:
+                logger.warning("⚠️ Skipping message %s: %s", msg_id, exc)
+            else:
+                on_response(msg_id, response, None)
+        return [fetched[msg_id] for msg_id in ids if msg_id in fetched]
+
+    pending = ids
+    for attempt in range(settings.GMAIL_MAX_RETRIES + 1):
+        for start in range(0, len(pending), batch_size):
+            batch = service.new_batch_http_request(callback=on_response)
+            chunk = pending[start : start + batch_size]
+            for msg_id in chunk:
+                batch.add(message_get_request(service, msg_id, fmt), request_id=msg_id)
+            with span("gmail.batch"):
+                execute(key, batch, units * len(chunk), "gmail.batch")
+        pending, throttled = throttled, []
+        if not pending or attempt == settings.GMAIL_MAX_RETRIES:
+            break
+        report_throttled(key)
+        time.sleep(backoff_delay(attempt))
+    if pending:
+        logger.warning("⚠️ Skipping %d messages Gmail kept throttling", len(pending))
+    return [fetched[msg_id] for msg_id in ids if msg_id in fetched]
+
+
+def message_to_document(msg_data, parsed=None, normalized=None):
+    """Turn a message resource into a Document, or None if it has no body.
+
+    The body is embedded as normalized by `email_normalize`. Pass `parsed`
+    (from `parse_message_text`) and `normalized` to reuse earlier results,
+    e.g. from a batch-aware EmailNormalizer.
+
+    `content_hash` is taken over the message before normalization: which
+    footers are stripped depends on the other messages seen in the same
+    run, and an unchanged message must keep its hash.
+    """
+    headers, raw_body, attachments = parsed or parse_message_text(msg_data)
+    if normalized is None:
+        normalized = normalize_body(raw_body, is_forward(headers))
+    body = normalized.text
+    if not body:
+        return None
+
+    subject = headers.get("Subject", "")
+    sender = headers.get("From", "")
+    thread_id = msg_data.get("threadId", "")
+    label_ids = msg_data.get("labelIds", [])
+
+    combined_content = f"From: {sender}\nSubject: {subject}\n\n{body}"
+    return Document(
+        page_content=combined_content,
+        metadata={
+            "content_hash": content_hash(
+                f"From: {sender}\nSubject: {subject}\n\n{raw_body}"
+            ),
+            "subject": subject,
+            "from": sender,
+            "thread_id": thread_id,
+            "message_id": msg_data["id"],
+            "labels": ",".join(sorted(label_ids)),
+            "date": int(msg_data.get("internalDate", 0)),
+            "in_reply_to": headers.get("In-Reply-To", ""),
+            "stripped": ",".join(normalized.stripped),
+            # Filterable fields, see query_filters
+            "from_address": sender_address(sender),
+            "to": headers.get("To", ""),
+            "cc": headers.get("Cc", ""),
+            "has_attachment": bool(attachments),
+            **label_flags(label_ids),
+        },
+    )
+
+
+def build_documents_from_messages(service, message_ids, batch_size=None):
     documents = []
-    print(f"build_documents_from_messages")
-    for msg in message_ids:
-        msg_data = (
-            service.users()
-            .messages()
-            .get(userId="me", id=msg["id"], format="full")
-            .execute()
-        )
+    for msg_data in fetch_messages(service, message_ids, batch_size=batch_size):
+        document = message_to_document(msg_data)
+        if document:
+            documents.append(document)
+    return documents
 
-        payload = msg_data.get("payload", {})
-        body = extract_email_body(payload)
-        if not body:
-            continue
-
-        headers = {h["name"]: h["value"] for h in payload.get("headers", [])}
-        subject = headers.get("Subject", "")
-        sender = headers.get("From", "")
-        thread_id = msg_data.get("threadId", "")
-
-        combined_content = f"From: {sender}\nSubject: {subject}\n\n{body}"
-        documents.append(
-            Document(
-                page_content=combined_content,
-                metadata={"subject": subject, "from": sender, "thread_id": thread_id},
+
+def get_history_changes(service, start_history_id):
+    """Collect mailbox changes since `start_history_id`.
+
+    Returns `(labels_by_id, deleted_ids, history_id)`: the latest label set of
+    every added or relabelled message, the deleted message IDs and the
+    mailbox historyId to resume from next time.
+    """
+    labels_by_id, deleted_ids = {}, set()
+    page_token = None
+    while True:
+        request = (
+            service.users()
+            .history()
+            .list(
+                userId="me",
+                startHistoryId=start_history_id,
+                historyTypes=HISTORY_TYPES,
+                maxResults=500,
+                pageToken=page_token,
             )
         )
+        try:
+            with span("gmail.history"):
+                response = execute(
+                    service_key(service),
+                    request,
+                    QUOTA_UNITS["history.list"],
+                    "gmail.history",
+                )
+        except HttpError as exc:
+            if exc.resp.status == 404:
+                raise HistoryExpired(start_history_id) from exc
+            raise
+
+        apply_history_records(response.get("history", []), labels_by_id, deleted_ids)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return (
+                labels_by_id,
+                deleted_ids,
+                response.get("historyId", start_history_id),
+            )
 
-    return documents
 
+def apply_history_records(records, labels_by_id, deleted_ids):
+    """Fold one page of `history.list` records into the running change sets."""
+    for record in records:
+        for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+            for change in record.get(key, []):
+                message = change["message"]
+                labels_by_id[message["id"]] = set(message.get("labelIds", []))
+                deleted_ids.discard(message["id"])
+        for change in record.get("messagesDeleted", []):
+            deleted_ids.add(change["message"]["id"])
+            labels_by_id.pop(change["message"]["id"], None)
+
+
+def plan_history_changes(labels_by_id, deleted_ids, cached_ids):
+    """Split history changes into `(new_message_ids, removed_ids, relabelled)`."""
+    in_scope = {
+        msg_id: labels
+        for msg_id, labels in labels_by_id.items()
+        if SYNC_LABEL in labels and not labels & EXCLUDED_LABELS
+    }
+    removed_ids = (deleted_ids | (labels_by_id.keys() - in_scope.keys())) & cached_ids
+    new_message_ids = [
+        {"id": msg_id} for msg_id in in_scope if msg_id not in cached_ids
+    ]
+    relabelled = {
+        msg_id: labels for msg_id, labels in in_scope.items() if msg_id in cached_ids
+    }
+    return new_message_ids, removed_ids, relabelled
 
-def store_documents_in_vector_db(documents, user_id: str):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    split_docs = splitter.split_documents(documents)
 
-    print(f"🔍 Total split documents: {len(split_docs)}")
-    Chroma.from_documents(
-        documents=split_docs,
-        embedding=OpenAIEmbeddings(),
-        persist_directory=CHROMA_DIR,
+def get_user_vectorstore(user_id: str):
+    embeddings = get_embeddings()
+    vectorstore = Chroma(
+        client=user_client(user_id),
+        embedding_function=embeddings,
         collection_name=chroma_collection_name(user_id),
     )
+    check_collection_model(vectorstore._collection, embeddings.model)
+    return vectorstore
 
 
-def group_documents_by_thread(documents):
-    thread_map = defaultdict(list)
-
-    for doc in documents:
-        metadata = doc.metadata or {}
-
-        thread_id = metadata.get("thread_id")
-        if not thread_id:
-            continue  # Skip if missing thread_id
-
-        thread_map[thread_id].append(
-            {
-                "subject": metadata.get("subject", ""),
-                "from": metadata.get("from", ""),
-                "snippet": escape(doc.page_content[:300]).replace("\n", "<br>"),
-                "full_body": escape(doc.page_content).replace("\n", "<br>"),
-            }
+def delete_messages_from_vector_db(user_id: str, message_ids):
+    vectorstore = get_user_vectorstore(user_id)
+    with span("chroma.delete"):
+        found = vectorstore.get(
+            where={"message_id": {"$in": list(message_ids)}}, include=[]
         )
-
-    return [
-        {"thread_id": thread_id, "emails": sorted(emails, key=lambda x: x["subject"])}
-        for thread_id, emails in thread_map.items()
+        if found["ids"]:
+            vectorstore.delete(ids=found["ids"])
+    if found["ids"]:
+        record_deletes(user_id, len(found["ids"]))
+        invalidate_user(user_id)
+    remove_messages(user_id, message_ids)
+    fulltext.remove_messages(user_id, message_ids)
+
+
+def update_message_labels(user_id: str, labels_by_id):
+    update_labels(user_id, labels_by_id)
+    vectorstore = get_user_vectorstore(user_id)
+    found = vectorstore.get(
+        where={"message_id": {"$in": list(labels_by_id)}}, include=["metadatas"]
+    )
+    if not found["ids"]:
+        return
+    metadatas = [
+        relabelled_metadata(meta, labels_by_id[meta["message_id"]])
+        for meta in found["metadatas"]
     ]
+    vectorstore._collection.update(ids=found["ids"], metadatas=metadatas)
+    invalidate_user(user_id)
+
+
+# ---- Streaming ingest stages ------------------------------------------------
+# Each stage consumes and yields IngestBatch objects and drops the data the
+# next stage no longer needs, so only a few pages are ever held in memory.
+
+
+def page_batches(pages):
+    for message_ids, next_page_token in pages:
+        yield IngestBatch(message_ids=message_ids, next_page_token=next_page_token)
+
+
+def pending_messages(user_id: str, message_ids):
+    done = processed_among(user_id, [msg["id"] for msg in message_ids])
+    return [msg for msg in message_ids if msg["id"] not in done]
+
+
+def fetch_stage(service, batches, user_id: str):
+    for batch in batches:
+        batch.pending = pending_messages(user_id, batch.message_ids)
+        if batch.pending:
+            batch.messages = fetch_messages(service, batch.pending)
+        yield batch
+
+
+def parse_stage(batches, normalizer=None):
+    """Build Documents from fetched messages, with quotes and footers stripped.
+
+    Every body of a batch is shown to the normalizer before any is cleaned,
+    so a footer repeated across the batch is recognised on its first use.
+    """
+    normalizer = normalizer or EmailNormalizer()
+    for batch in batches:
+        with span("parse", messages=len(batch.messages)):
+            batch.documents, batch.index_entries = [], []
+            parsed = [parse_message_text(msg) for msg in batch.messages]
+            for message in parsed:
+                normalizer.observe(message.body)
+            for msg, message in zip(batch.messages, parsed):
+                normalized = normalizer.normalize(
+                    message.body, is_forward(message.headers)
+                )
+                batch.tokens_saved += normalized.tokens_saved
+                doc = message_to_document(msg, message, normalized)
+                batch.message_states[msg["id"]] = STORED if doc else EMPTY
+                if doc:
+                    batch.documents.append(doc)
+                    snippet = html.unescape(msg.get("snippet", ""))
+                    batch.index_entries.append(index_entry(doc, snippet))
+            batch.num_documents = len(batch.documents)
+            batch.messages = []
+        yield batch
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(message_id: str, ordinal: int) -> str:
+    """Stable Chroma ID, so re-ingesting a message overwrites its chunks."""
+    return f"{message_id}:{ordinal}"
+
+
+def skip_unchanged_stage(batches, collection):
+    """Drop documents whose stored chunks already have the same content hash.
+
+    The hash is set by `message_to_document`.
+
+    One metadata lookup per batch. For messages that did change, the IDs of
+    their stored chunks are kept so that stale ones can be deleted on upsert.
+    """
+    for batch in batches:
+        if batch.documents:
+            message_ids = [doc.metadata["message_id"] for doc in batch.documents]
+            with span("chroma.get"):
+                found = collection.get(
+                    where={"message_id": {"$in": message_ids}}, include=["metadatas"]
+                )
+            stored_hashes, stored_ids = defaultdict(set), defaultdict(list)
+            for stored_id, meta in zip(found["ids"], found["metadatas"]):
+                stored_hashes[meta["message_id"]].add(meta.get("content_hash"))
+                stored_ids[meta["message_id"]].append(stored_id)
+
+            changed = []
+            for doc in batch.documents:
+                message_id = doc.metadata["message_id"]
+                if stored_hashes[message_id] == {doc.metadata["content_hash"]}:
+                    batch.num_unchanged += 1
+                    continue
+                batch.replaced_chunk_ids.extend(stored_ids[message_id])
+                changed.append(doc)
+            batch.documents = changed
+        yield batch
+
+
+def split_stage(batches):
+    # start_index lets thread_index put a message's chunks back together
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200, add_start_index=True
+    )
+    for batch in batches:
+        with span("split", documents=len(batch.documents)):
+            batch.chunks = splitter.split_documents(batch.documents)
+        ordinals = defaultdict(int)
+        for chunk in batch.chunks:
+            message_id = chunk.metadata["message_id"]
+            chunk.metadata["chunk"] = ordinals[message_id]
+            ordinals[message_id] += 1
+        batch.num_chunks = len(batch.chunks)
+        batch.documents = []
+        yield batch
+
+
+def embed_stage(batches, embeddings):
+    for batch in batches:
+        if batch.chunks:
+            with span("embed", chunks=len(batch.chunks)):
+                batch.embeddings = embeddings.embed_documents(
+                    [chunk.page_content for chunk in batch.chunks]
+                )
+        yield batch
+
+
+def upsert_stage(batches, collection, user_id: str):
+    """Write each batch's chunks to Chroma and to the user's full-text index."""
+    for batch in batches:
+        ids = [
+            chunk_id(c.metadata["message_id"], c.metadata["chunk"])
+            for c in batch.chunks
+        ]
+        # Chunks a changed message no longer has (or pre-deterministic-ID copies)
+        stale = set(batch.replaced_chunk_ids) - set(ids)
+        batch.replaced_chunk_ids = []
+        with span("chroma.upsert", chunks=len(ids)):
+            if stale:
+                collection.delete(ids=list(stale))
+            if batch.chunks:
+                collection.upsert(
+                    ids=ids,
+                    embeddings=batch.embeddings,
+                    documents=[chunk.page_content for chunk in batch.chunks],
+                    metadatas=[chunk.metadata for chunk in batch.chunks],
+                )
+        if batch.chunks or stale:
+            with span("fulltext.index", chunks=len(ids)):
+                fulltext.index_chunks(user_id, ids, batch.chunks, removed_ids=stale)
+        batch.chunks, batch.embeddings = [], []
+        yield batch
+
+
+def ingest_batches(service, user_id: str, batches, on_commit=None, progress=None):
+    """Stream batches through fetch → parse → split → embed → upsert.
+
+    Listing and fetching share the Gmail HTTP connection, which is not
+    thread-safe, so they run on the same pipeline thread. Each batch's message
+    IDs are committed to the processed-ID cache once its chunks are stored,
+    then `on_commit(batch)` runs and `progress` sees the running totals.
+    Returns counts for the whole run.
+    """
+    vectorstore = get_user_vectorstore(user_id)
+    stats = new_ingest_stats()
+
+    for batch in run_pipeline(
+        fetch_stage(service, batches, user_id),
+        parse_stage,
+        lambda batches: skip_unchanged_stage(batches, vectorstore._collection),
+        split_stage,
+        lambda batches: embed_stage(batches, vectorstore.embeddings),
+        lambda batches: upsert_stage(batches, vectorstore._collection, user_id),
+        queue_size=settings.INGEST_QUEUE_SIZE,
+    ):
+        commit_batch(user_id, batch, stats, on_commit, progress)
+
+    logger.info("🔍 Ingested %s", stats)
+    return stats
+
+
+def new_ingest_stats():
+    return {
+        "messages": 0,
+        "documents": 0,
+        "unchanged": 0,
+        "chunks": 0,
+        "tokens_saved": 0,
+    }
+
+
+def commit_batch(user_id: str, batch, stats, on_commit=None, progress=None):
+    """Record a stored batch: message states, cache invalidation, stats, `on_commit`.
+
+    The batch's message states and whatever `on_commit` saves (the resume
+    cursor) are written in one sync-state transaction.
+    """
+    if batch.num_chunks:
+        invalidate_user(user_id)
+    index_messages(user_id, batch.index_entries)
+    states = {
+        msg["id"]: batch.message_states.get(msg["id"], FAILED) for msg in batch.pending
+    }
+    with transaction():
+        if states:
+            mark_messages(user_id, states)
+        if on_commit:
+            on_commit(batch)
+    stats["messages"] += len(states)
+    stats["documents"] += batch.num_documents
+    stats["unchanged"] += batch.num_unchanged
+    stats["chunks"] += batch.num_chunks
+    stats["tokens_saved"] += batch.tokens_saved
+    if progress:
+        progress.update(stats)
+
+
+def list_existing_threads(user_id: str, cursor=None, limit=THREADS_PER_PAGE):
+    """A page of the user's threads from the thread index (no vector search)."""
+    backfill_from_chroma(user_id)
+    page = list_threads(user_id, cursor, limit)
+    return {
+        "stored": page["stored"],
+        "collection": chroma_collection_name(user_id),
+        "vector_db_path": os.path.abspath(shard_path(user_shard(user_id))),
+        "threads": page["threads"],
+        "next_cursor": page["next_cursor"],
+    }
 
 
 def load_existing_threads_from_chroma(user_id: str):
-    vectorstore = Chroma(
-        embedding_function=OpenAIEmbeddings(),
-        persist_directory=CHROMA_DIR,
-        collection_name=chroma_collection_name(user_id),
-    )
-    docs = vectorstore.similarity_search("inbox", k=200)  # dummy query
-    threads = group_documents_by_thread(docs)
-    return JsonResponse(
-        {
-            "stored": len(docs),
-            "collection": chroma_collection_name(user_id),
-            "vector_db_path": os.path.abspath(CHROMA_DIR),
-            "threads": threads,
-        }
+    return JsonResponse(list_existing_threads(user_id))
+
+
+def expected_new_messages(label, processed_count: int):
+    """Rough number of messages a full sync still has to fetch."""
+    return max(label.get("messagesTotal", 0) - processed_count, 0)
+
+
+def sync_full(service, user_id: str, progress=None):
+    """Page through every primary message and embed the ones not seen before.
+
+    Progress is committed per page, so an interrupted sync resumes from the
+    last committed page instead of starting over.
+    """
+    cursor = load_sync_cursor(user_id) or {}
+    # Read the checkpoint first so changes made while we list are replayed next time
+    key = service_key(service)
+    history_id = cursor.get("history_id") or (
+        execute(
+            key,
+            service.users().getProfile(userId="me"),
+            QUOTA_UNITS["getProfile"],
+            "gmail.profile",
+        ).get("historyId")
     )
 
+    def commit(batch):
+        if batch.next_page_token:
+            save_sync_cursor(
+                user_id,
+                {"page_token": batch.next_page_token, "history_id": history_id},
+            )
 
-def load_gmail_threads_to_chroma(request):
-    try:
-        # # 1️⃣  Make sure the caller is logged in to **your** app
-        if not request.user.is_authenticated:
-            return JsonResponse({"error": "Unauthenticated"}, status=401)
+    if progress:
+        label = execute(
+            key,
+            service.users().labels().get(userId="me", id=SYNC_LABEL),
+            QUOTA_UNITS["labels.get"],
+            "gmail.labels",
+        )
+        progress.expect(expected_new_messages(label, count_processed(user_id)))
 
-        user_id = str(request.user.id)
+    pages = list_message_pages(service, page_token=cursor.get("page_token"))
+    stats = ingest_batches(
+        service, user_id, page_batches(pages), on_commit=commit, progress=progress
+    )
 
-        # 2️⃣  Pull the Gmail OAuth token tied to this user
-        creds = get_credentials(request)
-        if not creds:
-            return JsonResponse({"error": "No Gmail credentials found"}, status=401)
+    save_sync_cursor(user_id, None)
+    if history_id:
+        save_history_id(user_id, history_id)
+    return stats, set()
 
-        # 3️⃣  Build the Gmail service
-        gmail_service = build("gmail", "v1", credentials=creds)
 
-        # profile = gmail_service.users().getProfile(userId="me").execute()
+def sync_incremental(service, user_id: str, start_history_id: str, progress=None):
+    """Apply the mailbox changes recorded since `start_history_id`."""
+    labels_by_id, deleted_ids, history_id = get_history_changes(
+        service, start_history_id
+    )
+    new_message_ids, removed_ids, relabelled = plan_history_changes(
+        labels_by_id,
+        deleted_ids,
+        processed_among(user_id, labels_by_id.keys() | deleted_ids),
+    )
 
-        # 4️⃣  Fetch message IDs from Primary tab
-        all_message_ids = get_message_ids(gmail_service)  # <- unchanged helper
-        if not all_message_ids:
-            return load_existing_threads_from_chroma(user_id)  # <- unchanged helper
+    if progress:
+        progress.expect(len(new_message_ids))
+    stats = ingest_batches(
+        service, user_id, id_batches(new_message_ids), progress=progress
+    )
+    apply_removals_and_labels(user_id, removed_ids, relabelled)
+
+    save_history_id(user_id, history_id)
+    return stats, removed_ids
+
+
+def id_batches(message_ids):
+    page_size = settings.GMAIL_PAGE_SIZE
+    for start in range(0, len(message_ids), page_size):
+        yield IngestBatch(message_ids=message_ids[start : start + page_size])
+
+
+def apply_removals_and_labels(user_id: str, removed_ids, relabelled):
+    if removed_ids:
+        delete_messages_from_vector_db(user_id, removed_ids)
+        forget_messages(user_id, removed_ids)
+    if relabelled:
+        update_message_labels(user_id, relabelled)
+
+
+def sync_mailbox(service, user_id: str, progress=None):
+    """Run an incremental sync when a history checkpoint exists, else a full one.
+
+    `progress`, if given, gets `expect(total_messages)` once the amount of
+    work is known and `update(stats)` after every committed batch.
+    Returns `(mode, stats, removed_ids)`. Holds the user's `mailbox_lock`,
+    so a concurrent sync of the same mailbox waits for this one.
+    """
+    with mailbox_lock(user_id), in_use(user_id):
+        history_id = None
+        if settings.GMAIL_SYNC_MODE == "history" and not load_sync_cursor(user_id):
+            history_id = load_history_id(user_id)
+        if history_id:
+            try:
+                return (
+                    "incremental",
+                    *sync_incremental(service, user_id, history_id, progress),
+                )
+            except HistoryExpired:
+                logger.warning(
+                    "History checkpoint %s expired; running a full resync", history_id
+                )
+        return ("full", *sync_full(service, user_id, progress))
+
+
+def sync_job_response(job, created):
+    return JsonResponse(
+        {
+            "job": job.as_dict(),
+            "created": created,
+            "status_url": reverse("sync_job_status", args=[job.pk]),
+        },
+        status=202,
+    )
 
-        # 5️⃣  Deduplicate against the local cache
-        cached_ids = load_processed_ids(user_id)
-        new_message_ids = [
-            msg for msg in all_message_ids if msg["id"] not in cached_ids
-        ]
-        print(f"running line 183")
-        if new_message_ids:
-            documents = build_documents_from_messages(  # <- unchanged helper
-                gmail_service, new_message_ids
-            )
-            if not documents:
-                return JsonResponse({"message": "No valid content to embed."})
 
-            print(f"check num {len(documents)}")
-            store_documents_in_vector_db(documents, user_id)  # <- unchanged helper
-            save_processed_ids(
-                user_id, cached_ids.union({msg["id"] for msg in new_message_ids})
-            )
-            threads = group_documents_by_thread(documents)  # <- unchanged helper
-            print(f"len documents: {documents}")
-            return JsonResponse(
-                {
-                    "stored": len(documents),
-                    "collection": "gmail_emails",
-                    "vector_db_path": os.path.abspath(CHROMA_DIR),
-                    "threads": threads,
-                }
-            )
-        print(f"running line 206")
-        return load_existing_threads_from_chroma(user_id)  # <- unchanged helper
-
-    except Exception:
-        traceback.print_exc()
-        return JsonResponse(
-            {"error": "Internal server error while syncing Gmail"},
-            status=500,
-        )
+def sync_job_result(job):
+    """Status payload for a job; finished jobs also list the user's threads."""
+    data = job.as_dict()
+    if job.status == job.SUCCEEDED:
+        data.update(list_existing_threads(str(job.user_id)))
+        data["embedding_cache"] = embedding_cache_stats()
+        data["embedding_batches"] = embedding_batch_stats()
+    return data
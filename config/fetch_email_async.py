@@ -0,0 +1,253 @@
+"""Async twin of the Gmail → Chroma sync in `fetch_email`.
+
+Gmail and OpenAI calls are awaited on the shared connection pools; CPU work
+(MIME parsing, splitting) and Chroma/SQLite writes run in worker threads.
+The page-at-a-time batching and per-batch commits match `ingest_batches`.
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from .email_cache import (
+    load_history_id,
+    count_processed,
+    processed_among,
+    load_sync_cursor,
+    save_history_id,
+    save_sync_cursor,
+)
+from .email_normalize import EmailNormalizer
+from .fetch_email import (
+    HISTORY_TYPES,
+    SYNC_LABEL,
+    HistoryExpired,
+    IngestBatch,
+    apply_history_records,
+    apply_removals_and_labels,
+    commit_batch,
+    expected_new_messages,
+    pending_messages,
+    get_credentials,
+    get_user_vectorstore,
+    id_batches,
+    new_ingest_stats,
+    parse_stage,
+    plan_history_changes,
+    skip_unchanged_stage,
+    split_stage,
+    sync_job_response,
+    sync_job_result,
+    upsert_stage,
+)
+from .gmail_async import GmailAPIError
+from .metrics import span
+from .models import SyncJob
+
+logger = logging.getLogger(__name__)
+
+
+async def alist_message_batches(gmail, query="category:primary", page_token=None):
+    while True:
+        results = await gmail.list_messages(
+            query=query, page_token=page_token, max_results=settings.GMAIL_PAGE_SIZE
+        )
+        page_token = results.get("nextPageToken")
+        yield IngestBatch(
+            message_ids=results.get("messages", []), next_page_token=page_token
+        )
+        if not page_token:
+            return
+
+
+async def _aiter(batches):
+    for batch in batches:
+        yield batch
+
+
+def _parse_and_split(batch, collection, normalizer):
+    parsed = parse_stage([batch], normalizer)
+    return next(split_stage(skip_unchanged_stage(parsed, collection)))
+
+
+async def aingest_batches(gmail, user_id: str, batches, on_commit=None, progress=None):
+    """Fetch the next page while the current one is parsed, embedded and stored."""
+    vectorstore = await asyncio.to_thread(get_user_vectorstore, user_id)
+    stats = new_ingest_stats()
+    normalizer = EmailNormalizer()  # footer counts carry across the run's batches
+    queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+
+    async def produce():
+        try:
+            async for batch in batches:
+                batch.pending = await asyncio.to_thread(
+                    pending_messages, user_id, batch.message_ids
+                )
+                if batch.pending:
+                    batch.messages = await gmail.get_messages(batch.pending)
+                await queue.put(batch)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (batch := await queue.get()) is not None:
+            batch = await asyncio.to_thread(
+                _parse_and_split, batch, vectorstore._collection, normalizer
+            )
+            if batch.chunks:
+                with span("embed", chunks=len(batch.chunks)):
+                    batch.embeddings = await vectorstore.embeddings.aembed_documents(
+                        [chunk.page_content for chunk in batch.chunks]
+                    )
+            await asyncio.to_thread(
+                lambda: next(upsert_stage([batch], vectorstore._collection, user_id))
+            )
+            await asyncio.to_thread(
+                commit_batch, user_id, batch, stats, on_commit, progress
+            )
+        await producer  # re-raise a fetch error
+    finally:
+        producer.cancel()
+
+    logger.info("🔍 Ingested %s", stats)
+    return stats
+
+
+async def aget_history_changes(gmail, start_history_id):
+    labels_by_id, deleted_ids = {}, set()
+    page_token = None
+    while True:
+        try:
+            response = await gmail.list_history(
+                start_history_id, HISTORY_TYPES, page_token=page_token
+            )
+        except GmailAPIError as exc:
+            if exc.status == 404:
+                raise HistoryExpired(start_history_id) from exc
+            raise
+        apply_history_records(response.get("history", []), labels_by_id, deleted_ids)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return (
+                labels_by_id,
+                deleted_ids,
+                response.get("historyId", start_history_id),
+            )
+
+
+async def async_sync_full(gmail, user_id: str, progress=None):
+    cursor = await asyncio.to_thread(load_sync_cursor, user_id) or {}
+    history_id = cursor.get("history_id") or (await gmail.get_profile()).get(
+        "historyId"
+    )
+
+    def commit(batch):
+        if batch.next_page_token:
+            save_sync_cursor(
+                user_id,
+                {"page_token": batch.next_page_token, "history_id": history_id},
+            )
+
+    if progress:
+        label = await gmail.get_label(SYNC_LABEL)
+        processed_count = await asyncio.to_thread(count_processed, user_id)
+        await asyncio.to_thread(
+            progress.expect, expected_new_messages(label, processed_count)
+        )
+
+    batches = alist_message_batches(gmail, page_token=cursor.get("page_token"))
+    stats = await aingest_batches(
+        gmail, user_id, batches, on_commit=commit, progress=progress
+    )
+
+    await asyncio.to_thread(save_sync_cursor, user_id, None)
+    if history_id:
+        await asyncio.to_thread(save_history_id, user_id, history_id)
+    return stats, set()
+
+
+async def async_sync_incremental(
+    gmail, user_id: str, start_history_id: str, progress=None
+):
+    labels_by_id, deleted_ids, history_id = await aget_history_changes(
+        gmail, start_history_id
+    )
+    cached_ids = await asyncio.to_thread(
+        processed_among, user_id, labels_by_id.keys() | deleted_ids
+    )
+    new_message_ids, removed_ids, relabelled = plan_history_changes(
+        labels_by_id, deleted_ids, cached_ids
+    )
+
+    if progress:
+        await asyncio.to_thread(progress.expect, len(new_message_ids))
+    stats = await aingest_batches(
+        gmail, user_id, _aiter(id_batches(new_message_ids)), progress=progress
+    )
+    await asyncio.to_thread(apply_removals_and_labels, user_id, removed_ids, relabelled)
+    await asyncio.to_thread(save_history_id, user_id, history_id)
+    return stats, removed_ids
+
+
+async def async_sync_mailbox(gmail, user_id: str, progress=None):
+    """Async `sync_mailbox`: returns `(mode, stats, removed_ids)`."""
+    history_id = None
+    if settings.GMAIL_SYNC_MODE == "history" and not await asyncio.to_thread(
+        load_sync_cursor, user_id
+    ):
+        history_id = await asyncio.to_thread(load_history_id, user_id)
+    if history_id:
+        try:
+            return (
+                "incremental",
+                *await async_sync_incremental(gmail, user_id, history_id, progress),
+            )
+        except HistoryExpired:
+            logger.warning(
+                "History checkpoint %s expired; running a full resync", history_id
+            )
+    return ("full", *await async_sync_full(gmail, user_id, progress))
+
+
+async def aload_gmail_threads_to_chroma(request):
+    """Queue a background sync (or reuse the user's active or fresh one); poll its status_url."""
+    from .sync_jobs import enqueue_sync  # sync_jobs imports this module
+
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"error": "Unauthenticated"}, status=401)
+
+        if await sync_to_async(get_credentials)(request) is None:
+            return JsonResponse({"error": "No Gmail credentials found"}, status=401)
+
+        job, created = await sync_to_async(enqueue_sync)(user)
+        return sync_job_response(job, created)
+
+    except Exception:
+        logger.exception("Could not queue a Gmail sync")
+        return JsonResponse(
+            {"error": "Internal server error while syncing Gmail"},
+            status=500,
+        )
+
+
+async def sync_job_status(request, job_id: int):
+    """Progress of one of the caller's sync jobs, with an ETA while it runs."""
+    from .sync_jobs import ensure_workers
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Unauthenticated"}, status=401)
+
+    job = await SyncJob.objects.filter(pk=job_id, user=user).afirst()
+    if job is None:
+        return JsonResponse({"error": "Sync job not found"}, status=404)
+    if job.status == SyncJob.QUEUED:
+        # Queued jobs outlive restarts; make sure this process is working on them
+        await sync_to_async(ensure_workers)()
+    return JsonResponse(await asyncio.to_thread(sync_job_result, job))
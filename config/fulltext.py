@@ -0,0 +1,212 @@
+"""Per-user SQLite FTS5 index over stored chunks, for exact-term retrieval.
+
+Invoice numbers, names and other rare tokens are where embeddings are weak,
+so ingest writes every chunk to a full-text index next to Chroma and the
+QA retriever fuses its BM25 ranking with the vector ranking.
+
+Each user gets an FTS5 table (`subject`, `sender`, `body`) plus a plain
+table mapping chunk IDs to FTS rowids, so replacing or deleting a message's
+chunks is an indexed lookup rather than a scan of the FTS table.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+from langchain.schema import Document
+
+BM25_WEIGHTS = (2.0, 2.0, 1.0)  # subject, sender, body
+STOPWORDS = set(
+    "a about after all am an and any are as at be been before but by can could did do does "
+    "for from had has have how i if in into is it its me my no not of on or our say said "
+    "should so than that the their them then there these they this to up was we were what "
+    "when where which who whom why will with would you your".split()
+)
+_SQL_VARS = 500
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    # never reuse a connection across fork()
+    if conn is None or _local.pid != os.getpid():
+        path = settings.FULLTEXT_INDEX_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _tables(user_id: str):
+    if not re.fullmatch(r"\w+", user_id):
+        raise ValueError(f"Invalid user ID for the full-text index: {user_id!r}")
+    return f"fts_{user_id}", f"fts_{user_id}_chunks"
+
+
+def _ensure_tables(conn, user_id: str):
+    fts, chunks = _tables(user_id)
+    conn.executescript(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            subject, sender, body, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TABLE IF NOT EXISTS {chunks} (
+            rowid INTEGER PRIMARY KEY,
+            chunk_id TEXT NOT NULL UNIQUE,
+            message_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS {chunks}_message ON {chunks} (message_id);
+        """
+    )
+    return fts, chunks
+
+
+def has_index(user_id: str) -> bool:
+    _, chunks = _tables(user_id)
+    row = (
+        _connect()
+        .execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [chunks]
+        )
+        .fetchone()
+    )
+    return row is not None
+
+
+def _delete_rowids(conn, fts: str, chunks: str, column: str, values) -> None:
+    values = list(values)
+    for start in range(0, len(values), _SQL_VARS):
+        part = values[start : start + _SQL_VARS]
+        marks = ",".join("?" * len(part))
+        rowids = [
+            (rowid,)
+            for (rowid,) in conn.execute(
+                f"SELECT rowid FROM {chunks} WHERE {column} IN ({marks})", part
+            )
+        ]
+        conn.executemany(f"DELETE FROM {fts} WHERE rowid = ?", rowids)
+        conn.executemany(f"DELETE FROM {chunks} WHERE rowid = ?", rowids)
+
+
+def index_chunks(user_id: str, ids, chunks, removed_ids=()) -> None:
+    """Write `chunks` (Documents) under their chunk `ids`, replacing older rows.
+
+    `removed_ids` are chunk IDs deleted from Chroma in the same upsert.
+    """
+    conn = _connect()
+    fts, table = _ensure_tables(conn, user_id)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete_rowids(conn, fts, table, "chunk_id", set(ids) | set(removed_ids))
+        for chunk_id, chunk in zip(ids, chunks):
+            meta = chunk.metadata
+            rowid = conn.execute(
+                f"INSERT INTO {table} (chunk_id, message_id) VALUES (?, ?)",
+                [chunk_id, meta.get("message_id", "")],
+            ).lastrowid
+            conn.execute(
+                f"INSERT INTO {fts} (rowid, subject, sender, body) VALUES (?, ?, ?, ?)",
+                [
+                    rowid,
+                    meta.get("subject", ""),
+                    meta.get("from", ""),
+                    chunk.page_content,
+                ],
+            )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _remove(user_id: str, column: str, values) -> None:
+    if not has_index(user_id):
+        return
+    conn = _connect()
+    fts, table = _tables(user_id)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete_rowids(conn, fts, table, column, values)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def remove_messages(user_id: str, message_ids) -> None:
+    _remove(user_id, "message_id", message_ids)
+
+
+def remove_chunks(user_id: str, chunk_ids) -> None:
+    _remove(user_id, "chunk_id", chunk_ids)
+
+
+def match_query(text: str) -> str | None:
+    """An FTS5 query matching any significant word of `text`, or None if there is none.
+
+    Every term is quoted, so user input cannot inject FTS5 syntax.
+    """
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if (
+            word not in STOPWORDS
+            and (len(word) > 1 or word.isdigit())
+            and word not in terms
+        ):
+            terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms) or None
+
+
+def search(user_id: str, text: str, limit: int = 20) -> list[str]:
+    """Chunk IDs ranked by BM25 for `text`, best first."""
+    query = match_query(text)
+    if query is None or not has_index(user_id):
+        return []
+    fts, table = _tables(user_id)
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    rows = _connect().execute(
+        f"SELECT c.chunk_id FROM {fts} JOIN {table} c ON c.rowid = {fts}.rowid "
+        f"WHERE {fts} MATCH ? ORDER BY bm25({fts}, {weights}) LIMIT ?",
+        [query, limit],
+    )
+    return [chunk_id for (chunk_id,) in rows]
+
+
+def indexed_count(user_id: str) -> int:
+    if not has_index(user_id):
+        return 0
+    _, table = _tables(user_id)
+    return _connect().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def backfill_from_chroma(user_id: str, collection, page_size: int = 1000) -> int:
+    """Index chunks stored before the full-text index existed.
+
+    Runs whenever the index holds fewer chunks than the collection (a sync
+    may have created it for new mail only); re-indexing a chunk replaces it.
+    """
+    total = collection.count()
+    if indexed_count(user_id) >= total:
+        return 0
+    indexed = 0
+    for offset in range(0, total, page_size):
+        page = collection.get(
+            include=["documents", "metadatas"], limit=page_size, offset=offset
+        )
+        chunks = [
+            Document(page_content=text or "", metadata=meta or {})
+            for text, meta in zip(page["documents"], page["metadatas"])
+        ]
+        index_chunks(user_id, page["ids"], chunks)
+        indexed += len(chunks)
+    logger.info(
+        "🔎 Backfilled %d chunks into the full-text index for user %s", indexed, user_id
+    )
+    return indexed
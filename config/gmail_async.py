@@ -0,0 +1,180 @@
+"""Minimal async client for the Gmail REST endpoints the sync uses.
+
+Requests go through a shared httpx connection pool (one per event loop), so
+an async view waiting on Gmail does not hold a worker thread. Every call is
+paced, concurrency-limited and retried by `gmail_quota`.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from email.parser import BytesParser
+from urllib.parse import quote, unquote, urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import gmail_quota
+from .clients import async_http_client, needs_refresh, refresh_credentials
+from .gmail_quota import QUOTA_UNITS
+from .metrics import span
+from .mime import FETCH_FIELDS, METADATA_HEADERS
+
+logger = logging.getLogger(__name__)
+
+USER_PATH = "gmail/v1/users/me"
+GMAIL_MAX_BATCH_SIZE = 100
+
+
+class GmailAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Gmail API error {status}: {message}")
+        self.status = status
+
+
+class AsyncGmail:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.root = settings.GMAIL_API_ROOT.rstrip("/")
+
+    async def _request(
+        self, method: str, path: str, units: int, headers=None, **kwargs
+    ):
+        stage = "gmail." + path.removeprefix(f"{USER_PATH}/").split("/")[0]
+        # refresh ahead of expiry rather than on a 401
+        if needs_refresh(self.credentials):
+            await sync_to_async(refresh_credentials, thread_sensitive=False)(
+                self.credentials
+            )
+
+        async def send():
+            for attempt in range(2):
+                token = self.credentials.token
+                auth = {"Authorization": f"Bearer {token}"}
+                with span(stage):
+                    response = await async_http_client().request(
+                        method,
+                        f"{self.root}/{path}",
+                        headers={**auth, **(headers or {})},
+                        **kwargs,
+                    )
+                # Credentials stored without an expiry are refreshed on the first 401
+                if (
+                    response.status_code != 401
+                    or attempt
+                    or not self.credentials.refresh_token
+                ):
+                    return response
+                await sync_to_async(refresh_credentials, thread_sensitive=False)(
+                    self.credentials, rejected_token=token
+                )
+
+        response = await gmail_quota.acall(self.credentials, stage, units, send)
+        if response.status_code >= 400:
+            raise GmailAPIError(response.status_code, response.text)
+        return response
+
+    async def _get(self, path: str, units: int, **params):
+        params = {k: v for k, v in params.items() if v is not None}
+        return (
+            await self._request("GET", f"{USER_PATH}/{path}", units, params=params)
+        ).json()
+
+    async def get_profile(self):
+        return await self._get("profile", QUOTA_UNITS["getProfile"])
+
+    async def get_label(self, label_id: str):
+        return await self._get(f"labels/{quote(label_id)}", QUOTA_UNITS["labels.get"])
+
+    async def list_messages(self, query=None, page_token=None, max_results=100):
+        return await self._get(
+            "messages",
+            QUOTA_UNITS["messages.list"],
+            q=query,
+            pageToken=page_token,
+            maxResults=max_results,
+        )
+
+    async def list_history(self, start_history_id, history_types, page_token=None):
+        return await self._get(
+            "history",
+            QUOTA_UNITS["history.list"],
+            startHistoryId=start_history_id,
+            historyTypes=history_types,
+            pageToken=page_token,
+            maxResults=500,
+        )
+
+    async def get_messages(self, message_ids, fmt=None, batch_size=None):
+        """Fetch messages through the batch endpoint, the batches concurrently.
+
+        Calls Gmail throttles inside a batch are retried after a backoff;
+        messages that fail otherwise are skipped.
+        """
+        fmt = fmt or settings.GMAIL_FETCH_FORMAT
+        batch_size = min(batch_size or settings.GMAIL_BATCH_SIZE, GMAIL_MAX_BATCH_SIZE)
+        ids = [msg["id"] for msg in message_ids]
+        fetched = {}
+        pending = ids
+        for attempt in range(settings.GMAIL_MAX_RETRIES + 1):
+            results = await asyncio.gather(
+                *(
+                    self._batch_get(pending[start : start + batch_size], fmt)
+                    for start in range(0, len(pending), batch_size)
+                )
+            )
+            pending = []
+            for got, throttled in results:
+                fetched.update(got)
+                pending.extend(throttled)
+            if not pending or attempt == settings.GMAIL_MAX_RETRIES:
+                break
+            gmail_quota.report_throttled(self.credentials)
+            await asyncio.sleep(gmail_quota.backoff_delay(attempt))
+        if pending:
+            logger.warning("⚠️ Skipping %d messages Gmail kept throttling", len(pending))
+        return [fetched[msg_id] for msg_id in ids if msg_id in fetched]
+
+    async def _batch_get(self, ids, fmt):
+        """`(messages by ID, IDs to retry)` for one batch request."""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        params = {"format": fmt, "fields": FETCH_FIELDS[fmt]}
+        if fmt == "metadata":
+            params["metadataHeaders"] = METADATA_HEADERS
+        query = urlencode(params, doseq=True)
+        body = "".join(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <{quote(msg_id)}>\r\n\r\n"
+            f"GET /{USER_PATH}/messages/{quote(msg_id)}?{query}\r\n\r\n"
+            for msg_id in ids
+        )
+        body += f"--{boundary}--\r\n"
+        response = await self._request(
+            "POST",
+            "batch",
+            QUOTA_UNITS["messages.get"] * len(ids),
+            content=body.encode("utf-8"),
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+        )
+
+        container = BytesParser().parsebytes(
+            f"Content-Type: {response.headers['content-type']}\r\n\r\n".encode()
+            + response.content
+        )
+        fetched, throttled = {}, []
+        for part in container.get_payload():
+            msg_id = unquote(part["Content-ID"].strip("<>").removeprefix("response-"))
+            payload = part.get_payload(decode=True).decode("utf-8")
+            status_line, _, rest = payload.lstrip().partition("\n")
+            status = int(status_line.split(" ", 2)[1])
+            content = rest.replace("\r\n", "\n").split("\n\n", 1)[-1]
+            if gmail_quota.is_retryable(status, content):
+                throttled.append(msg_id)
+                continue
+            if status >= 400:
+                logger.warning("⚠️ Skipping message %s: HTTP %s", msg_id, status)
+                continue
+            fetched[msg_id] = json.loads(content)
+        return fetched, throttled
@@ -0,0 +1,274 @@
+"""Pacing, adaptive concurrency and retries for every Gmail API call.
+
+Gmail charges quota units per method (see QUOTA_UNITS; a batch costs the
+sum of its calls) and enforces a per-user rate and a per-project rate.
+Every call first takes its units from the user's token bucket and from
+this process's bucket, waiting while either is empty, so many users'
+syncs together run at the allowed rate instead of finding it through 429s.
+
+The number of calls a user has in flight is capped by an AIMD limit: a
+call answered within GMAIL_LATENCY_TARGET raises it by 1/limit, a slower
+one trims it and a throttled or failed one halves it. A 429, a rate-limit
+403, a 5xx or a dropped connection is retried up to GMAIL_MAX_RETRIES
+times after a jittered exponential backoff, or after Retry-After when
+Gmail sends one.
+
+A "user" is the Credentials object the calls are made with (one per user,
+see `clients.gmail_credentials`), or the service when it has none.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import httplib2
+import httpx
+from django.conf import settings
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "history.list": 2,
+    "getProfile": 1,
+    "labels.get": 1,
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")  # sent with a 403
+MAX_BACKOFF_SECONDS = 32
+DECREASE_INTERVAL = 1.0  # seconds; one multiplicative decrease per burst of failures
+
+_lock = threading.Lock()
+_users = weakref.WeakKeyDictionary()  # Credentials (or service) -> UserQuota
+_process_bucket = None
+
+
+class TokenBucket:
+    """Quota units refilled at `rate` per second, holding at most `burst`.
+
+    `reserve` takes the units at once and returns how long the caller must
+    wait for them, so a call larger than the burst still goes through and
+    waiters are served in order. A rate of 0 never waits.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= units
+            return max(0.0, -self._tokens / self.rate)
+
+
+class AdaptiveLimit:
+    """Additive-increase / multiplicative-decrease cap on calls in flight.
+
+    Waiters may sit on different event loops (sync workers each run their
+    own), so a freed slot is handed over with `call_soon_threadsafe`.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = float(max(1, min(initial, maximum)))
+        self.maximum = maximum
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (loop, future), first come first served
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]  # resolved once a slot is counted for us
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release(None)
+            raise
+
+    def release(self, outcome: str | None):
+        """Free a slot; `outcome` ("ok", "slow", "throttled") adjusts the limit."""
+        with self._lock:
+            self.in_flight -= 1
+            if outcome is not None:
+                self._adjust(outcome)
+            ready = []
+            while self._waiters and self.in_flight < int(self.limit):
+                loop, future = self._waiters.popleft()
+                self.in_flight += 1
+                ready.append((loop, future))
+        for loop, future in ready:
+            loop.call_soon_threadsafe(self._hand_over, future)
+
+    def _hand_over(self, future):
+        if future.cancelled():
+            self.release(None)  # the waiter gave up after we counted its slot
+        else:
+            future.set_result(None)
+
+    def _adjust(self, outcome: str):
+        if outcome == "ok":
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            return
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        factor = 0.5 if outcome == "throttled" else 0.9
+        self.limit = max(1.0, self.limit * factor)
+
+    def throttled(self):
+        with self._lock:
+            self._adjust("throttled")
+
+
+class UserQuota:
+    def __init__(self):
+        rate = settings.GMAIL_USER_UNITS_PER_SECOND
+        self.bucket = TokenBucket(rate, burst=rate)
+        self.limit = AdaptiveLimit(
+            settings.GMAIL_CONCURRENCY_START, settings.GMAIL_CONCURRENCY_MAX
+        )
+
+
+def user_quota(key) -> UserQuota:
+    with _lock:
+        quota = _users.get(key)
+        if quota is None:
+            quota = _users[key] = UserQuota()
+        return quota
+
+
+def process_bucket() -> TokenBucket:
+    global _process_bucket
+    with _lock:
+        if _process_bucket is None:
+            rate = settings.GMAIL_PROCESS_UNITS_PER_SECOND
+            _process_bucket = TokenBucket(rate, burst=rate)
+        return _process_bucket
+
+
+def service_key(service):
+    """The credentials behind a googleapiclient service (its AuthorizedHttp's)."""
+    return getattr(service._http, "credentials", None) or service
+
+
+def reserve(quota: UserQuota, units: int) -> float:
+    return max(quota.bucket.reserve(units), process_bucket().reserve(units))
+
+
+def is_retryable(status: int, body: str = "") -> bool:
+    if status in RETRY_STATUSES:
+        return True
+    return status == 403 and any(reason in body for reason in RATE_LIMIT_REASONS)
+
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """Full-jitter exponential backoff; Retry-After (seconds) is a lower bound."""
+    ceiling = min(MAX_BACKOFF_SECONDS, settings.GMAIL_RETRY_BASE_SECONDS * 2**attempt)
+    delay = random.uniform(0, ceiling)
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:  # an HTTP date; rare enough to fall back to our own delay
+        return delay
+
+
+def report_throttled(key) -> None:
+    """Calls inside a batch were throttled although the batch itself succeeded."""
+    user_quota(key).limit.throttled()
+
+
+async def acall(key, stage: str, units: int, send):
+    """Await `send()` (an httpx request) paced, capped and retried; returns the response.
+
+    The last response is returned when retries run out, so the caller's
+    error handling still sees it; a connection error is raised.
+    """
+    quota = user_quota(key)
+    for attempt in range(settings.GMAIL_MAX_RETRIES + 1):
+        wait = reserve(quota, units)
+        if wait:
+            await asyncio.sleep(wait)
+        await quota.limit.acquire()
+        start = time.monotonic()
+        try:
+            response = await send()
+        except httpx.TransportError as exc:
+            quota.limit.release("throttled")
+            if attempt == settings.GMAIL_MAX_RETRIES:
+                raise
+            reason, retry_after = repr(exc), None
+        else:
+            status = response.status_code
+            # Only a 403 needs its body read, to tell rate limits from denials
+            if not is_retryable(status, response.text if status == 403 else ""):
+                slow = time.monotonic() - start > settings.GMAIL_LATENCY_TARGET
+                quota.limit.release("slow" if slow else "ok")
+                return response
+            quota.limit.release("throttled")
+            if attempt == settings.GMAIL_MAX_RETRIES:
+                return response
+            reason, retry_after = status, response.headers.get("retry-after")
+        delay = backoff_delay(attempt, retry_after)
+        logger.info(
+            "⏳ %s got %s; retry %d in %.1fs", stage, reason, attempt + 1, delay
+        )
+        await asyncio.sleep(delay)
+
+
+def execute(key, request, units: int, stage: str):
+    """`request.execute()` paced and retried like `acall`, for googleapiclient calls.
+
+    `key` is `service_key(service)`. The sync path makes one call at a time
+    per user, so it is paced but not concurrency-limited.
+    """
+    quota = user_quota(key)
+    for attempt in range(settings.GMAIL_MAX_RETRIES + 1):
+        wait = reserve(quota, units)
+        if wait:
+            time.sleep(wait)
+        try:
+            return request.execute()
+        except HttpError as exc:
+            body = exc.content.decode("utf-8", "replace") if exc.content else ""
+            if (
+                not is_retryable(exc.resp.status, body)
+                or attempt == settings.GMAIL_MAX_RETRIES
+            ):
+                raise
+            reason, retry_after = exc.resp.status, exc.resp.get("retry-after")
+        except (OSError, httplib2.HttpLib2Error) as exc:
+            if attempt == settings.GMAIL_MAX_RETRIES:
+                raise
+            reason, retry_after = repr(exc), None
+        quota.limit.throttled()
+        delay = backoff_delay(attempt, retry_after)
+        logger.info(
+            "⏳ %s got %s; retry %d in %.1fs", stage, reason, attempt + 1, delay
+        )
+        time.sleep(delay)
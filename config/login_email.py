@@ -1,13 +1,15 @@
 import os
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 from django.conf import settings
 from django.shortcuts import redirect
 from django.http import JsonResponse
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from django.conf import settings
-from django.contrib.auth import login
+from django.contrib.auth import alogin
 from django.contrib.auth.models import User
+from .credential_store import save_credentials
+from .gmail_async import AsyncGmail
 
 load_dotenv()
 
@@ -40,8 +42,8 @@ def gmail_login(request):
     return redirect(auth_url)
 
 
-def oauth2callback(request):
-    state = request.session.get("google_auth_state")
+async def oauth2callback(request):
+    state = await sync_to_async(request.session.get)("google_auth_state")
     if not state:
         return JsonResponse({"error": "Missing OAuth state in session"}, status=400)
 
@@ -60,40 +62,27 @@ def oauth2callback(request):
         redirect_uri=settings.REDIRECT_URI,
     )
 
-    flow.fetch_token(authorization_response=request.build_absolute_uri())
+    await sync_to_async(flow.fetch_token, thread_sensitive=False)(
+        authorization_response=request.build_absolute_uri()
+    )
     credentials = flow.credentials
 
     # Fetch user email
-    service = build("gmail", "v1", credentials=credentials)
-    profile = service.users().getProfile(userId="me").execute()
+    profile = await AsyncGmail(credentials).get_profile()
     user_email = profile["emailAddress"]
 
     # 🔐 Create or get Django user based on Gmail address
-    user, created = User.objects.get_or_create(
+    user, created = await User.objects.aget_or_create(
         username=user_email, defaults={"email": user_email}
     )
 
     # 🔐 Log them into Django session
-    login(request, user)
+    await alogin(request, user)
 
-    # ✅ Store Gmail credentials tied to the logged-in user
-    user_id = str(user.id)
-    credentials_by_user = request.session.get("credentials_by_user", {})
-    credentials_by_user[user_id] = credentials_to_dict(credentials)
-    request.session["credentials_by_user"] = credentials_by_user
+    # ✅ Store Gmail credentials tied to the logged-in user (server-side, not in the session)
+    await sync_to_async(save_credentials)(str(user.id), credentials)
     request.session["user_email"] = user_email
     request.session.modified = True
 
     # ✅ Redirect to frontend
     return redirect(settings.FRONTEND_REDIRECT_URL)
-
-
-def credentials_to_dict(credentials):
-    return {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes,
-    }
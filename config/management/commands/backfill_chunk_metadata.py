@@ -0,0 +1,58 @@
+"""Add the filterable metadata fields to chunks stored before they existed.
+
+`from_address` is derived from the `from` metadata every chunk has, and the
+per-label flags from `labels` where a chunk has it, so no message is
+refetched or re-embedded. The oldest chunks have no `labels`, `date` or
+`has_attachment` (and no message ID to refetch them by); date, label and
+attachment filters never match them, and the retriever falls back to an
+unfiltered search when nothing matches.
+"""
+
+from django.core.management.base import BaseCommand
+
+from config.chroma_storage import named_collections
+from config.query_filters import relabelled_metadata, sender_address
+
+PAGE_SIZE = 1000
+
+
+def missing_fields(collection):
+    """`(ids, metadatas)` updates for the chunks without `from_address`."""
+    ids, metadatas = [], []
+    for offset in range(0, collection.count(), PAGE_SIZE):
+        page = collection.get(include=["metadatas"], limit=PAGE_SIZE, offset=offset)
+        for chunk_id, meta in zip(page["ids"], page["metadatas"]):
+            meta = meta or {}
+            if "from_address" in meta:
+                continue
+            labels = [label for label in meta.get("labels", "").split(",") if label]
+            meta = relabelled_metadata(meta, labels)
+            meta["from_address"] = sender_address(meta.get("from", ""))
+            ids.append(chunk_id)
+            metadatas.append(meta)
+    return ids, metadatas
+
+
+class Command(BaseCommand):
+    help = "Derive from_address and label flags for chunks indexed without them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection",
+            action="append",
+            help="Only update this collection (repeatable).",
+        )
+
+    def handle(self, *args, collection=None, **options):
+        total = 0
+        for client, col in named_collections(collection):
+            batch_size = client.get_max_batch_size()
+            ids, metadatas = missing_fields(col)
+            for start in range(0, len(ids), batch_size):
+                col.update(
+                    ids=ids[start : start + batch_size],
+                    metadatas=metadatas[start : start + batch_size],
+                )
+            total += len(ids)
+            self.stdout.write(f"{col.name}: updated {len(ids)} of {col.count()} chunks")
+        self.stdout.write(self.style.SUCCESS(f"Updated {total} chunks"))
@@ -0,0 +1,88 @@
+"""Report how much disk each user's Chroma collection takes, per shard.
+
+Sizes and chunk counts are read from the shard directories; deletes since
+the last compaction and last access come from `ChromaCollection`. `--compact`
+rebuilds the collections with enough deleted chunks (or those given with
+`--user`), skipping users with a sync in progress, and `--vacuum` then
+shrinks each shard's chroma.sqlite3.
+"""
+
+from django.core.management.base import BaseCommand
+
+from config import chroma_storage
+from config.models import ChromaCollection, SyncJob
+
+
+def megabytes(size: int) -> str:
+    return f"{size / 2**20:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = "Report per-user Chroma storage footprint; optionally compact and vacuum."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compact",
+            action="store_true",
+            help="Compact collections past the delete threshold.",
+        )
+        parser.add_argument(
+            "--user",
+            action="append",
+            help="Compact this user's collection regardless (repeatable).",
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="VACUUM each shard's chroma.sqlite3 afterwards.",
+        )
+
+    def handle(self, *args, compact=False, user=None, vacuum=False, **options):
+        if compact or user:
+            self.compact(user)
+        if vacuum:
+            for shard in chroma_storage.shard_paths():
+                freed = chroma_storage.vacuum(shard)
+                self.stdout.write(f"shard {shard}: vacuum freed {megabytes(freed)}")
+
+        report = chroma_storage.footprint()
+        for shard in report["shards"]:
+            self.stdout.write(
+                f"shard {shard['shard']} {shard['path']}: sqlite {megabytes(shard['sqlite_bytes'])}, "
+                f"orphaned indexes {megabytes(shard['orphaned_bytes'])}"
+            )
+        users = sorted(report["users"], key=lambda u: u["index_bytes"], reverse=True)
+        self.stdout.write(
+            f"{'user':>8} {'shard':>5} {'index':>10} {'chunks':>8} {'deleted':>8}  last access"
+        )
+        for entry in users:
+            last = entry["last_accessed_at"]
+            self.stdout.write(
+                f"{entry['user_id']:>8} {entry['shard']:>5} {megabytes(entry['index_bytes']):>10} "
+                f"{entry['chunks']:>8} "
+                f"{entry['deleted_chunks'] if entry['deleted_chunks'] is not None else '?':>8}  "
+                f"{last.isoformat(timespec='seconds') if last else 'never'}"
+            )
+        total = sum(u["index_bytes"] for u in users) + sum(
+            s["sqlite_bytes"] + s["orphaned_bytes"] for s in report["shards"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(users)} collections, {megabytes(total)} total")
+        )
+
+    def compact(self, user_ids):
+        syncing = set(
+            SyncJob.objects.filter(status__in=SyncJob.ACTIVE).values_list(
+                "user_id", flat=True
+            )
+        )
+        entries = ChromaCollection.objects.exclude(user_id__in=syncing)
+        if user_ids:
+            entries = entries.filter(user_id__in=user_ids)
+        for entry in entries:
+            if not user_ids and not chroma_storage.needs_compaction(entry):
+                continue
+            freed = chroma_storage.compact(str(entry.user_id))
+            self.stdout.write(
+                f"user {entry.user_id}: compaction freed {megabytes(freed)}"
+            )
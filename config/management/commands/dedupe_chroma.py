@@ -0,0 +1,92 @@
+"""Remove duplicate chunks from the per-user Chroma collections.
+
+Chunks stored before chunk IDs were derived from the Gmail message ID got
+random IDs, so every retry or lost ID cache stored the same text again.
+A chunk is a duplicate when another chunk of the same message has the same
+text; the copy with a deterministic `<message_id>:<ordinal>` ID is kept.
+Deleted chunks are also removed from the user's full-text index and, for
+chunks listed on their own (no message ID), from the thread index.
+"""
+
+import hashlib
+
+from django.core.management.base import BaseCommand
+
+from config import fulltext, thread_index
+from config.chroma_storage import COLLECTION_PREFIX, named_collections, record_deletes
+from config.registry import invalidate_user
+
+PAGE_SIZE = 1000
+
+
+def is_deterministic(chunk_id: str) -> bool:
+    return ":" in chunk_id
+
+
+def find_duplicates(collection) -> list[str]:
+    kept = {}  # (message, text hash) -> chunk ID
+    duplicates = []
+    for offset in range(0, collection.count(), PAGE_SIZE):
+        page = collection.get(
+            include=["documents", "metadatas"], limit=PAGE_SIZE, offset=offset
+        )
+        for chunk_id, text, meta in zip(
+            page["ids"], page["documents"], page["metadatas"]
+        ):
+            meta = meta or {}
+            message = meta.get("message_id") or meta.get("thread_id", "")
+            key = (message, hashlib.sha256((text or "").encode("utf-8")).hexdigest())
+            first = kept.get(key)
+            if first is None:
+                kept[key] = chunk_id
+            elif is_deterministic(chunk_id) and not is_deterministic(first):
+                duplicates.append(first)
+                kept[key] = chunk_id
+            else:
+                duplicates.append(chunk_id)
+    return duplicates
+
+
+class Command(BaseCommand):
+    help = "Find and delete duplicate chunks in the Chroma collections of every shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report duplicates without deleting them.",
+        )
+        parser.add_argument(
+            "--collection",
+            action="append",
+            help="Only check this collection (repeatable).",
+        )
+
+    def handle(self, *args, dry_run=False, collection=None, **options):
+        total = 0
+        for client, col in named_collections(collection):
+            name = col.name
+            batch_size = client.get_max_batch_size()
+            duplicates = find_duplicates(col)
+            total += len(duplicates)
+            self.stdout.write(
+                f"{name}: {col.count()} chunks, {len(duplicates)} duplicates"
+            )
+            if dry_run or not duplicates:
+                continue
+            user_id = None
+            if name.startswith(COLLECTION_PREFIX):
+                user_id = name.removeprefix(COLLECTION_PREFIX)
+            for start in range(0, len(duplicates), batch_size):
+                batch = duplicates[start : start + batch_size]
+                col.delete(ids=batch)
+                if user_id is not None:
+                    fulltext.remove_chunks(user_id, batch)
+                    # Legacy chunks are listed under their chunk ID, one row each
+                    thread_index.remove_messages(user_id, batch)
+            if user_id is not None:
+                record_deletes(user_id, len(duplicates))
+                invalidate_user(user_id)
+
+        verb = "Found" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} duplicate chunks"))
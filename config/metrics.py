@@ -0,0 +1,132 @@
+"""Timing spans for the ingest and QA stages, exported for Prometheus.
+
+`with span("embed"):` times a block. The duration goes into the
+`email_assistant_stage_duration_seconds` histogram under that stage label
+and, with OTEL_TRACING on, into an OpenTelemetry span of the same name sent
+to the OTLP endpoint (OTEL_EXPORTER_OTLP_ENDPOINT). `start_span` does the
+same for callback code that cannot wrap a block.
+
+`/metrics` serves the histograms in the Prometheus text format. Every
+process keeps its own, so scrape each worker process.
+
+Stages: gmail.<endpoint> (messages, batch, history, profile, labels),
+parse, split, embed, embed.query, embed.batch, chroma.get, chroma.query, chroma.upsert,
+chroma.delete, fulltext.index, fulltext.search, retrieve, llm.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """A Prometheus histogram with one `stage` label."""
+
+    def __init__(self, name: str, help_text: str, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # stage -> [bucket counts..., sum, count]
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {stage: list(values) for stage, values in self._series.items()}
+        for stage, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                lines.append(
+                    f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {values[-1]}'
+            )
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {values[-1]}')
+        return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "email_assistant_stage_duration_seconds", "Time spent in each ingest and QA stage."
+)
+
+_tracer_lock = threading.Lock()
+_tracer = None
+
+
+def tracer():
+    """The OpenTelemetry tracer, set up on first use; None while OTEL_TRACING is off."""
+    global _tracer
+    if not settings.OTEL_TRACING:
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            from opentelemetry import trace
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+                OTLPSpanExporter,
+            )
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": settings.OTEL_SERVICE_NAME})
+            )
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+            _tracer = trace.get_tracer("email_assistant")
+    return _tracer
+
+
+def start_span(stage: str, **attributes):
+    """Start timing `stage`; call the returned function to finish it."""
+    otel = tracer()
+    otel_span = otel.start_span(stage, attributes=attributes) if otel else None
+    start = time.perf_counter()
+
+    def finish(error: BaseException | None = None):
+        STAGE_SECONDS.observe(stage, time.perf_counter() - start)
+        if otel_span is not None:
+            if error is not None:
+                otel_span.record_exception(error)
+            otel_span.end()
+
+    return finish
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time the block as `stage`; nested spans become OpenTelemetry child spans."""
+    otel = tracer()
+    start = time.perf_counter()
+    try:
+        if otel is None:
+            yield
+        else:
+            with otel.start_as_current_span(stage, attributes=attributes):
+                yield
+    finally:
+        STAGE_SECONDS.observe(stage, time.perf_counter() - start)
+
+
+def render() -> str:
+    return STAGE_SECONDS.render()
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("config", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexedMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("message_id", models.CharField(max_length=64)),
+                ("thread_id", models.CharField(max_length=64)),
+                ("internal_date", models.BigIntegerField(default=0)),
+                ("subject", models.TextField(blank=True)),
+                ("sender", models.TextField(blank=True)),
+                ("labels", models.TextField(blank=True)),
+                ("snippet", models.TextField(blank=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="indexed_messages",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "thread_id", "internal_date"],
+                        name="config_inde_user_id_a606ca_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "internal_date"],
+                        name="config_inde_user_id_94c2ed_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "message_id"), name="unique_indexed_message"
+                    )
+                ],
+            },
+        ),
+    ]
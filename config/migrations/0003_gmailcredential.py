@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("config", "0002_indexedmessage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GmailCredential",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="gmail_credential",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("token", models.TextField(blank=True)),
+                ("refresh_token", models.TextField(blank=True)),
+                ("token_uri", models.CharField(max_length=255)),
+                ("client_id", models.CharField(max_length=255)),
+                ("scopes", models.JSONField(blank=True, default=list)),
+                ("expiry", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name="syncjob",
+            name="credentials",
+        ),
+    ]
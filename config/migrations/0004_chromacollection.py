@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("config", "0003_gmailcredential"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChromaCollection",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="chroma_collection",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField(default=0)),
+                ("chunks", models.PositiveIntegerField(default=0)),
+                ("deleted_chunks", models.PositiveIntegerField(default=0)),
+                ("last_accessed_at", models.DateTimeField(blank=True, null=True)),
+                ("compacted_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("config", "0004_chromacollection"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncjob",
+            name="tokens_saved",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
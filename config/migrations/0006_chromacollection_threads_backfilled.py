@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("config", "0005_syncjob_tokens_saved"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chromacollection",
+            name="threads_backfilled",
+            field=models.BooleanField(default=False),
+        ),
+    ]
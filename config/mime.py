@@ -0,0 +1,198 @@
+"""Local parsing of Gmail message resources into headers and body text.
+
+Messages are requested with a `fields` mask, so Gmail only sends what the
+sync reads. `format=full` returns the JSON part tree; `format=raw` returns
+the RFC 2822 message as one base64url string, parsed here with the standard
+library. Either way HTML-only mail is converted to text instead of being
+dropped, and every part is decoded with its declared charset.
+"""
+
+import base64
+import re
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from html.parser import HTMLParser
+from typing import NamedTuple
+
+# Partial-response masks: only the fields `message_to_document` reads.
+# Syncs use "full" or "raw"; "metadata" has no body and is for header-only calls.
+MESSAGE_FIELDS = "id,threadId,labelIds,snippet,internalDate"
+FETCH_FIELDS = {
+    "raw": f"{MESSAGE_FIELDS},raw",
+    "full": f"{MESSAGE_FIELDS},payload(mimeType,filename,headers,body/data,parts)",
+    "metadata": f"{MESSAGE_FIELDS},payload/headers",
+}
+METADATA_HEADERS = ["From", "To", "Cc", "Subject", "Date", "In-Reply-To"]
+
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre",
+    "section", "table", "tr", "ul",
+}  # fmt: skip
+SKIPPED_TAGS = {"head", "script", "style", "title", "template"}
+
+_parser = BytesParser()
+
+
+class ParsedMessage(NamedTuple):
+    headers: dict
+    body: str
+    attachments: list  # file names
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.buffers = [[]]  # one per open <blockquote>
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag == "br":
+            self.buffers[-1].append("\n")
+        elif tag == "blockquote":
+            self.buffers.append([])
+        elif tag in BLOCK_TAGS:
+            self.buffers[-1].append("\n\n")
+        elif tag == "td":
+            self.buffers[-1].append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag == "blockquote" and len(self.buffers) > 1:
+            # Mark quoted text the way plain-text mail does, so it is stripped like it
+            quoted = _tidy("".join(self.buffers.pop()))
+            self.buffers[-1].append(
+                "\n\n" + "\n".join(f"> {line}" for line in quoted.split("\n"))
+            )
+            self.buffers[-1].append("\n\n")
+        elif tag in BLOCK_TAGS:
+            self.buffers[-1].append("\n\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.buffers[-1].append(re.sub(r"\s+", " ", data))
+
+    def text(self):
+        while len(self.buffers) > 1:  # unclosed <blockquote>
+            self.handle_endtag("blockquote")
+        return _tidy("".join(self.buffers[0]))
+
+
+def _tidy(text: str) -> str:
+    lines = [line.strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def html_to_text(markup: str) -> str:
+    """Readable text from an HTML body: block elements become line breaks."""
+    extractor = _TextExtractor()
+    extractor.feed(markup)
+    extractor.close()
+    return extractor.text()
+
+
+def decode_bytes(data: bytes, charset: str | None) -> str:
+    try:
+        return data.decode(charset or "utf-8", errors="replace")
+    except LookupError:  # unknown charset name
+        return data.decode("utf-8", errors="replace")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _decode_header(value) -> str:
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeDecodeError, ValueError):  # bad charset or encoded-word
+        return str(value)
+
+
+def _find_mime_part(message, content_type: str):
+    for part in message.walk():
+        if part.get_content_type() == content_type and not part.get_filename():
+            if part.get_content_disposition() != "attachment":
+                return part
+    return None
+
+
+def parse_raw_message(raw: str) -> ParsedMessage:
+    """Parse a `format=raw` message into headers, body text and attachment names.
+
+    Uses the compat32 parser (the header-registry policy costs several
+    milliseconds per message) and decodes only the headers the sync reads.
+    The plain-text alternative is preferred; an HTML-only message is
+    converted to text. Attachments are never decoded.
+    """
+    message = _parser.parsebytes(_b64decode(raw))
+    headers = {
+        name: _decode_header(message[name])
+        for name in METADATA_HEADERS
+        if name in message
+    }
+    attachments = [
+        _decode_header(part.get_filename())
+        for part in message.walk()
+        if part.get_filename() or part.get_content_disposition() == "attachment"
+    ]
+    part = _find_mime_part(message, "text/plain") or _find_mime_part(
+        message, "text/html"
+    )
+    if part is None:
+        return ParsedMessage(headers, "", attachments)
+    text = decode_bytes(
+        part.get_payload(decode=True) or b"", part.get_content_charset()
+    )
+    if part.get_content_type() == "text/html":
+        text = html_to_text(text)
+    return ParsedMessage(headers, text, attachments)
+
+
+def _header_charset(part) -> str | None:
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = re.search(r'charset="?([\w.:-]+)', header["value"], re.I)
+            return match.group(1) if match else None
+    return None
+
+
+def _find_part(payload, mime_type: str):
+    if payload.get("mimeType") == mime_type and not payload.get("filename"):
+        if payload.get("body", {}).get("data"):
+            return payload
+    for part in payload.get("parts", []):
+        found = _find_part(part, mime_type)
+        if found:
+            return found
+    return None
+
+
+def _attachment_names(payload) -> list[str]:
+    names = [payload["filename"]] if payload.get("filename") else []
+    for part in payload.get("parts", []):
+        names.extend(_attachment_names(part))
+    return names
+
+
+def parse_payload(payload) -> ParsedMessage:
+    """Headers, body and attachment names from a `format=full` or `metadata` JSON tree."""
+    headers = {h["name"]: h["value"] for h in payload.get("headers", [])}
+    attachments = _attachment_names(payload)
+    part = _find_part(payload, "text/plain") or _find_part(payload, "text/html")
+    if part is None:
+        return ParsedMessage(headers, "", attachments)
+    text = decode_bytes(_b64decode(part["body"]["data"]), _header_charset(part))
+    if part["mimeType"] == "text/html":
+        text = html_to_text(text)
+    return ParsedMessage(headers, text, attachments)
+
+
+def parse_message(msg_data) -> ParsedMessage:
+    """Headers, body text and attachment names for a message resource of any format."""
+    if "raw" in msg_data:
+        return parse_raw_message(msg_data["raw"])
+    return parse_payload(msg_data.get("payload", {}))
@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class SyncJob(models.Model):
+    """One Gmail → Chroma sync, run by the worker pool in `sync_jobs`."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+    ACTIVE = (QUEUED, RUNNING)
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sync_jobs"
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    mode = models.CharField(max_length=16, blank=True)  # "full" or "incremental"
+    messages_total = models.PositiveIntegerField(null=True, blank=True)
+    messages_fetched = models.PositiveIntegerField(default=0)
+    documents_stored = models.PositiveIntegerField(default=0)
+    chunks_embedded = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    # quotes, signatures, footers not embedded
+    tokens_saved = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=Q(status__in=["queued", "running"]),
+                name="one_active_sync_job_per_user",
+            )
+        ]
+
+    def __str__(self):
+        return f"SyncJob {self.pk} ({self.status}) for user {self.user_id}"
+
+    def eta_seconds(self):
+        """Seconds left at the average rate so far, or None until there is a rate."""
+        if (
+            self.status != self.RUNNING
+            or not self.messages_total
+            or not self.started_at
+        ):
+            return None
+        if not self.messages_fetched:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        remaining = max(self.messages_total - self.messages_fetched, 0)
+        return round(elapsed / self.messages_fetched * remaining, 1)
+
+    def as_dict(self):
+        return {
+            "id": self.pk,
+            "status": self.status,
+            "mode": self.mode,
+            "messages_total": self.messages_total,
+            "messages_fetched": self.messages_fetched,
+            "documents_stored": self.documents_stored,
+            "chunks_embedded": self.chunks_embedded,
+            "deleted": self.deleted,
+            "tokens_saved": self.tokens_saved,
+            "eta_seconds": self.eta_seconds(),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at and self.started_at.isoformat(),
+            "finished_at": self.finished_at and self.finished_at.isoformat(),
+        }
+
+
+class GmailCredential(models.Model):
+    """A user's Gmail OAuth tokens, kept server-side rather than in the session.
+
+    The OAuth client secret is not stored; `credential_store` adds it from
+    GOOGLE_CLIENT_SECRET.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="gmail_credential",
+    )
+    token = models.TextField(blank=True)
+    refresh_token = models.TextField(blank=True)
+    token_uri = models.CharField(max_length=255)
+    client_id = models.CharField(max_length=255)
+    scopes = models.JSONField(default=list, blank=True)
+    expiry = models.DateTimeField(null=True, blank=True)  # of `token`
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Gmail credentials for user {self.user_id}"
+
+
+class ChromaCollection(models.Model):
+    """Where a user's Chroma collection is stored and how large it is.
+
+    Maintained by `chroma_storage`; `shard` picks the data directory and
+    never changes once assigned.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="chroma_collection",
+    )
+    shard = models.PositiveSmallIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)  # as of the last sync or compaction
+    deleted_chunks = models.PositiveIntegerField(default=0)  # since the last compaction
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
+    compacted_at = models.DateTimeField(null=True, blank=True)
+    # chunks from before the thread index are in it
+    threads_backfilled = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Chroma collection of user {self.user_id} (shard {self.shard})"
+
+
+class IndexedMessage(models.Model):
+    """Listing metadata for a message stored in a user's Chroma collection.
+
+    Lets the inbox be listed and paginated with plain indexed queries instead
+    of a vector search; the chunks themselves stay in Chroma.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="indexed_messages",
+    )
+    message_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64)
+    # Gmail internalDate, ms since epoch
+    internal_date = models.BigIntegerField(default=0)
+    subject = models.TextField(blank=True)
+    sender = models.TextField(blank=True)
+    # comma-joined label IDs, as in Chroma metadata
+    labels = models.TextField(blank=True)
+    snippet = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "message_id"], name="unique_indexed_message"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "thread_id", "internal_date"]),
+            models.Index(fields=["user", "internal_date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.message_id} in thread {self.thread_id}"
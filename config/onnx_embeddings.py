@@ -0,0 +1,101 @@
+"""Local sentence embeddings with onnxruntime on CPU.
+
+Loads a sentence-transformers style export (`model.onnx` plus the Hugging
+Face `tokenizer.json`) and mean-pools the token vectors. Texts are embedded
+in fixed-size batches that run in parallel on a thread pool; each
+onnxruntime call is single-threaded so the pool sets the parallelism.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import onnxruntime
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer
+
+MODEL_FILES = ("onnx/model.onnx", "tokenizer.json")
+
+
+def resolve_model_dir(model: str, model_dir: str | None = None) -> str:
+    """A local directory holding the model files, downloading them from the Hub if needed."""
+    if model_dir and os.path.exists(os.path.join(model_dir, "tokenizer.json")):
+        return model_dir
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(
+        model, allow_patterns=list(MODEL_FILES), local_dir=model_dir
+    )
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain `Embeddings` backed by a local ONNX sentence-embedding model."""
+
+    def __init__(
+        self, model: str, model_dir: str, batch_size=32, threads=4, max_tokens=256
+    ):
+        self.model = f"onnx:{model}"  # recorded on collections and in cache keys
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_tokens)
+        self.tokenizer.no_padding()  # batches are padded to their own longest text
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        onnx_path = os.path.join(model_dir, "onnx", "model.onnx")
+        if not os.path.exists(onnx_path):
+            onnx_path = os.path.join(model_dir, "model.onnx")
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.pool = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="onnx-embed"
+        )
+
+    def _run(self, encodings) -> list[list[float]]:
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(encodings), width), dtype=np.int64)
+        mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, : len(encoding.ids)] = encoding.ids
+            mask[row, : len(encoding.ids)] = 1
+        feeds = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        output = self.session.run(None, feeds)[0]
+
+        if output.ndim == 3:  # token vectors: mean over the real (unpadded) tokens
+            weights = mask[:, :, None].astype(output.dtype)
+            output = (output * weights).sum(axis=1) / np.clip(
+                weights.sum(axis=1), 1e-9, None
+            )
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.clip(norms, 1e-12, None)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch(texts)
+        # Sorting by length keeps the padding inside each batch small
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        batches = [
+            [encodings[i] for i in order[start : start + self.batch_size]]
+            for start in range(0, len(order), self.batch_size)
+        ]
+        vectors = [v for batch in self.pool.map(self._run, batches) for v in batch]
+        result = [None] * len(texts)
+        for position, index in enumerate(order):
+            result[index] = vectors[position]
+        return result
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._run([self.tokenizer.encode(text)])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.to_thread(self.embed_query, text)
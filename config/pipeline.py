@@ -0,0 +1,77 @@
+"""Run generator stages on their own threads, joined by bounded queues.
+
+Each stage takes an iterator of batches and yields batches. Because every
+queue holds at most `queue_size` batches, a slow stage (usually embedding)
+makes the faster ones wait instead of buffering the whole mailbox in memory.
+"""
+
+import queue
+import threading
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+class _Failed:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q, stop):
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.exc
+        yield item
+
+
+def _feed(iterable, q, stop):
+    try:
+        for item in iterable:
+            if not _put(q, item, stop):
+                return
+        _put(q, _DONE, stop)
+    except BaseException as exc:  # surfaced to the consumer
+        _put(q, _Failed(exc), stop)
+
+
+def run_pipeline(source, *stages, queue_size=2):
+    """Yield the output of `stages` applied in order to the `source` iterable.
+
+    `source` is consumed on a worker thread, and so is each stage. An
+    exception in any of them is re-raised in the consumer. Closing the
+    returned generator stops all workers.
+    """
+    stop = threading.Event()
+    q = queue.Queue(maxsize=queue_size)
+    threads = [threading.Thread(target=_feed, args=(source, q, stop), daemon=True)]
+    for stage in stages:
+        q_out = queue.Queue(maxsize=queue_size)
+        threads.append(
+            threading.Thread(
+                target=_feed, args=(stage(_drain(q, stop)), q_out, stop), daemon=True
+            )
+        )
+        q = q_out
+
+    for thread in threads:
+        thread.start()
+    try:
+        yield from _drain(q, stop)
+    finally:
+        stop.set()
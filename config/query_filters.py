@@ -0,0 +1,212 @@
+"""Turn constraints in a question into a Chroma `where` filter.
+
+"emails from my bank last month" names a date range and a sender; the
+retriever applies those as metadata filters before the vector and BM25
+searches, so only matching chunks are ranked. Recognised constraints:
+
+- dates: today, yesterday, this/last/past week|month|year, past N days|
+  weeks|months, in <month> [year], in <year>, since/before <month> [year]
+- sender: "from <word>", matched against the senders in the thread index
+- labels: starred, marked important, unread, sent by me, in my inbox
+- attachments: "with attachments"
+
+Anything not recognised is left to the searches. The fields filtered on
+are written by `message_to_document`; the helpers for them live here too.
+"""
+
+import calendar
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+
+from django.utils import timezone
+
+from .models import IndexedMessage
+
+LABEL_PREFIX = "label_"  # one boolean metadata key per Gmail label ID
+MAX_SENDERS = 50  # candidate addresses for one "from <word>"
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+UNITS = {"day": 1, "week": 7}
+LABEL_PATTERNS = [
+    (re.compile(r"\bstarred\b", re.I), "STARRED"),
+    (
+        re.compile(
+            r"\b(?:marked (?:as )?important|important (?:e-?mails?|mail|messages?))\b",
+            re.I,
+        ),
+        "IMPORTANT",
+    ),
+    (re.compile(r"\bunread\b", re.I), "UNREAD"),
+    (re.compile(r"\b(?:i sent|sent by me|i wrote|my sent)\b", re.I), "SENT"),
+    (re.compile(r"\bin (?:my |the )?inbox\b", re.I), "INBOX"),
+]
+ATTACHMENT = re.compile(
+    r"\b(?:with|has|have|having|containing|includes?)\s+(?:an?\s+|any\s+)?"
+    r"attach(?:ments?|ed files?)\b",
+    re.I,
+)
+SENDER = re.compile(r"\bfrom\s+(?:my\s+|the\s+|our\s+)?([\w.@+'-]+)", re.I)
+NOT_SENDERS = {
+    "last",
+    "this",
+    "past",
+    "today",
+    "yesterday",
+    "since",
+    "before",
+    "in",
+    "me",
+}
+
+
+# ---- Metadata written at ingest -----------------------------------------------
+
+
+def sender_address(sender: str) -> str:
+    return parseaddr(sender)[1].lower()
+
+
+def label_flags(label_ids) -> dict:
+    return {f"{LABEL_PREFIX}{label}": True for label in label_ids}
+
+
+def relabelled_metadata(meta: dict, label_ids) -> dict:
+    """`meta` with its label fields replaced; None removes a key on Chroma update."""
+    stale = {key: None for key in meta if key.startswith(LABEL_PREFIX)}
+    return {
+        **meta,
+        **stale,
+        **label_flags(label_ids),
+        "labels": ",".join(sorted(label_ids)),
+    }
+
+
+# ---- Question parsing ---------------------------------------------------------------
+
+
+@dataclass
+class QueryFilters:
+    where: dict | None = None
+    # readable description of each condition
+    applied: list = field(default_factory=list)
+
+
+def _ms(moment: datetime) -> int:
+    return int(moment.timestamp() * 1000)
+
+
+def _month_start(year: int, month: int, tz) -> datetime:
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=tz)
+
+
+def date_range(question: str, now: datetime):
+    """`(start, end)` datetimes for the first date expression in `question`, or None."""
+    text = question.lower()
+    tz = now.tzinfo
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week = today - timedelta(days=today.weekday())
+    month = _month_start(now.year, now.month, tz)
+
+    if re.search(r"\btoday\b", text):
+        return today, today + timedelta(days=1)
+    if re.search(r"\byesterday\b", text):
+        return today - timedelta(days=1), today
+    if match := re.search(r"\bpast\s+(week|month|year)\b", text):
+        days = {"week": 7, "month": 30, "year": 365}[match.group(1)]
+        return now - timedelta(days=days), now
+    if match := re.search(r"\b(this|last)\s+(week|month|year)\b", text):
+        which, unit = match.groups()
+        if unit == "week":
+            start = week if which == "this" else week - timedelta(days=7)
+            return start, (now if which == "this" else week)
+        if unit == "month":
+            start = (
+                month if which == "this" else _month_start(now.year, now.month - 1, tz)
+            )
+            return start, (now if which == "this" else month)
+        year = now.year if which == "this" else now.year - 1
+        start = datetime(year, 1, 1, tzinfo=tz)
+        return start, (now if which == "this" else datetime(now.year, 1, 1, tzinfo=tz))
+    if match := re.search(r"\b(?:past|last)\s+(\d+)\s+(day|week|month)s?\b", text):
+        count, unit = int(match.group(1)), match.group(2)
+        if unit == "month":
+            return _month_start(now.year, now.month - count, tz), now
+        return today - timedelta(days=count * UNITS[unit]), now
+
+    month_names = "|".join(sorted(MONTHS, key=len, reverse=True))
+    if match := re.search(
+        rf"\b(in|during|since|before)\s+({month_names})\.?(?:\s+(\d{{4}}))?\b", text
+    ):
+        word, name, year = match.groups()
+        number = MONTHS[name]
+        # A month without a year is the most recent one
+        year = (
+            int(year) if year else (now.year if number <= now.month else now.year - 1)
+        )
+        start = _month_start(year, number, tz)
+        if word == "since":
+            return start, now
+        if word == "before":
+            return None, start
+        return start, _month_start(year, number + 1, tz)
+    if match := re.search(r"\b(in|during|since|before)\s+((?:19|20)\d{2})\b", text):
+        word, year = match.group(1), int(match.group(2))
+        start = datetime(year, 1, 1, tzinfo=tz)
+        if word == "since":
+            return start, now
+        if word == "before":
+            return None, start
+        return start, datetime(year + 1, 1, 1, tzinfo=tz)
+    return None
+
+
+def sender_addresses(user_id: str, word: str) -> list[str]:
+    """Addresses of the user's senders whose name or address contains `word`."""
+    senders = (
+        IndexedMessage.objects.filter(user_id=user_id, sender__icontains=word)
+        .values_list("sender", flat=True)
+        .distinct()[: MAX_SENDERS * 4]
+    )
+    addresses = sorted({sender_address(s) for s in senders} - {""})
+    return addresses[:MAX_SENDERS]
+
+
+def parse_query_filters(
+    question: str, user_id: str, now: datetime | None = None
+) -> QueryFilters:
+    now = timezone.localtime(now or timezone.now())
+    conditions, applied = [], []
+
+    dates = date_range(question, now)
+    if dates:
+        start, end = dates
+        if start is not None:
+            conditions.append({"date": {"$gte": _ms(start)}})
+        conditions.append({"date": {"$lt": _ms(end)}})
+        applied.append(f"date {start.date() if start else '…'} to {end.date()}")
+
+    match = SENDER.search(question)
+    if match and match.group(1).lower() not in NOT_SENDERS:
+        word = match.group(1).strip(".'")
+        addresses = sender_addresses(user_id, word)
+        if addresses:  # no known sender matches: leave it to the searches
+            conditions.append({"from_address": {"$in": addresses}})
+            applied.append(f"from {word} ({len(addresses)} addresses)")
+
+    for pattern, label in LABEL_PATTERNS:
+        if pattern.search(question):
+            conditions.append({f"{LABEL_PREFIX}{label}": True})
+            applied.append(f"label {label}")
+
+    if ATTACHMENT.search(question):
+        conditions.append({"has_attachment": True})
+        applied.append("has attachment")
+
+    if not conditions:
+        return QueryFilters()
+    where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    return QueryFilters(where, applied)
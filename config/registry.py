@@ -0,0 +1,77 @@
+"""Per-user QA chains reused across /email/ask/ requests.
+
+Chains are kept in a bounded LRU and dropped after sitting idle. A sync
+that writes to a user's collection bumps that user's collection version
+(a marker file, so other worker processes see it too), and the next
+lookup rebuilds the chain.
+
+A chain reads the user's Chroma shard, which is closed once idle, so
+request handlers take the chain with `hold_qa_chain` and release the
+shard when they are done answering.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import chroma_storage
+from .email_assistant import build_email_qa_chain_from_chroma
+from .email_cache import bump_collection_version, collection_version
+
+_lock = threading.Lock()
+_chains = OrderedDict()  # user_id -> (chain, version, last_used)
+
+
+def get_qa_chain(user_id: str):
+    version = collection_version(user_id)
+    now = time.monotonic()
+    with _lock:
+        _evict_idle(now)
+        entry = _chains.get(user_id)
+        if entry and entry[1] == version:
+            _chains[user_id] = (entry[0], version, now)
+            _chains.move_to_end(user_id)
+            return entry[0]
+
+    chain = build_email_qa_chain_from_chroma(user_id)
+    with _lock:
+        _chains[user_id] = (chain, version, now)
+        _chains.move_to_end(user_id)
+        while len(_chains) > settings.QA_CHAIN_CACHE_SIZE:
+            _chains.popitem(last=False)
+    return chain
+
+
+def hold_qa_chain(user_id: str):
+    """`(chain, release)`: the user's shard stays loaded until `release()` is called."""
+    release = chroma_storage.hold(user_id)
+    try:
+        return get_qa_chain(user_id), release
+    except BaseException:
+        release()
+        raise
+
+
+def invalidate_user(user_id: str) -> None:
+    """Call after writing to the user's collection so cached chains are rebuilt."""
+    bump_collection_version(user_id)
+    with _lock:
+        _chains.pop(user_id, None)
+
+
+def drop_chains(user_ids) -> None:
+    """Forget cached chains without bumping the version (their Chroma client was closed)."""
+    with _lock:
+        for user_id in user_ids:
+            _chains.pop(user_id, None)
+
+
+def _evict_idle(now: float) -> None:
+    cutoff = now - settings.QA_CHAIN_IDLE_SECONDS
+    while _chains:
+        user_id, (_, _, last_used) = next(iter(_chains.items()))
+        if last_used >= cutoff:
+            return
+        del _chains[user_id]
@@ -0,0 +1,112 @@
+"""Hybrid retrieval: vector similarity and BM25 fused by reciprocal rank.
+
+Each ranking contributes 1 / (RRF_K + rank) for every chunk it returns, so
+a chunk that both the embedding search and the full-text index rank highly
+comes first, and an exact-term match the embeddings miss still makes the
+top k. Dates, senders and labels named in the question are applied as a
+metadata filter to both rankings first (see `query_filters`). Chunks
+stored before those fields existed never match it, so when nothing does
+the question is answered from the unfiltered rankings instead.
+"""
+
+import logging
+
+from typing import Any
+
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from . import fulltext
+from .metrics import span
+from .query_filters import parse_query_filters
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60  # damping from the original RRF paper; higher flattens the rank weights
+# extra BM25 candidates when a filter will drop most of them
+FILTERED_LEXICAL_FACTOR = 10
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> dict:
+    """Fused score per ID over several best-first lists of IDs."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+
+def _documents(found, nested=False):
+    ids, texts, metas = found["ids"], found["documents"], found["metadatas"]
+    if nested:  # query() results are per query embedding
+        ids, texts, metas = ids[0], texts[0], metas[0]
+    return {
+        i: Document(page_content=t or "", metadata=m or {})
+        for i, t, m in zip(ids, texts, metas)
+    }
+
+
+class HybridRetriever(BaseRetriever):
+    """Top `k` chunks of one user's collection by fused vector + BM25 rank."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    user_id: str
+    k: int = 5
+    fetch_k: int = 20  # candidates taken from each ranking
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager=None
+    ) -> list[Document]:
+        collection = self.vectorstore._collection
+        count = collection.count()
+        if not count:
+            return []
+        where = parse_query_filters(query, self.user_id).where
+        with span("embed.query"):
+            embedding = self.vectorstore.embeddings.embed_query(query)
+        docs, vector_ids, lexical_ids = self._rankings(query, embedding, where, count)
+        if where and not vector_ids and not lexical_ids:
+            logger.debug("No chunks match %s; searching without the filter", where)
+            docs, vector_ids, lexical_ids = self._rankings(
+                query, embedding, None, count
+            )
+
+        scores = reciprocal_rank_fusion([vector_ids, lexical_ids])
+        top = sorted(scores, key=scores.get, reverse=True)[: self.k]
+        missing = [chunk_id for chunk_id in top if chunk_id not in docs]
+        if missing:
+            with span("chroma.get"):
+                found = collection.get(ids=missing, include=["documents", "metadatas"])
+            docs.update(_documents(found))
+        # A chunk deleted from Chroma but still in the full-text index is skipped
+        return [docs[chunk_id] for chunk_id in top if chunk_id in docs]
+
+    def _rankings(self, query: str, embedding, where, count: int):
+        """`(documents by ID, vector ranking, BM25 ranking)` over chunks passing `where`."""
+        collection = self.vectorstore._collection
+        with span("chroma.query"):
+            found = collection.query(
+                query_embeddings=[embedding],
+                n_results=min(self.fetch_k, count),
+                where=where,
+                include=["documents", "metadatas"],
+            )
+        docs = _documents(found, nested=True)
+        vector_ids = found["ids"][0]
+        lexical_limit = self.fetch_k * (FILTERED_LEXICAL_FACTOR if where else 1)
+        with span("fulltext.search"):
+            lexical_ids = fulltext.search(self.user_id, query, lexical_limit)
+        if where and lexical_ids:
+            # The full-text index has no metadata; keep the matches that pass the filter
+            with span("chroma.get"):
+                found = collection.get(
+                    ids=lexical_ids, where=where, include=["documents", "metadatas"]
+                )
+            matching = _documents(found)
+            docs.update(matching)
+            lexical_ids = [chunk_id for chunk_id in lexical_ids if chunk_id in matching]
+            lexical_ids = lexical_ids[: self.fetch_k]
+        return docs, vector_ids, lexical_ids
@@ -14,6 +14,8 @@ from pathlib import Path
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Set DJANGO_ENV to 'production' on Render, and default to 'development' locally
 ENVIRONMENT = os.getenv("DJANGO_ENV", "development")
 
@@ -59,6 +61,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "corsheaders",
+    "config",
 ]
 
 MIDDLEWARE = [
@@ -173,9 +176,141 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # settings.py
 
-SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"  # Optional, default for simplicity
+# Gmail tokens live in GmailCredential
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 SESSION_COOKIE_SAMESITE = "None"
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SAMESITE = "None"
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_DOMAIN = ".onrender.com"
+
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
+
+# Chroma storage (see config/chroma_storage.py)
+# data directories new users are spread over
+CHROMA_SHARDS = int(os.getenv("CHROMA_SHARDS", "1"))
+# close a shard unused this long
+CHROMA_IDLE_UNLOAD_SECONDS = int(os.getenv("CHROMA_IDLE_UNLOAD_SECONDS", "900"))
+# compact once this many chunks are deleted...
+CHROMA_COMPACT_MIN_DELETED = int(os.getenv("CHROMA_COMPACT_MIN_DELETED", "1000"))
+# ...and they are this share of the live ones
+CHROMA_COMPACT_DELETED_RATIO = float(os.getenv("CHROMA_COMPACT_DELETED_RATIO", "0.25"))
+
+# OpenAI / QA chains
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+# users kept warm per process
+QA_CHAIN_CACHE_SIZE = int(os.getenv("QA_CHAIN_CACHE_SIZE", "64"))
+QA_CHAIN_IDLE_SECONDS = int(os.getenv("QA_CHAIN_IDLE_SECONDS", "900"))
+EMAIL_QA_STRATEGY = os.getenv("EMAIL_QA_STRATEGY", "packed")  # "packed" or "map_reduce"
+# prompt tokens for "packed"
+EMAIL_QA_TOKEN_BUDGET = int(os.getenv("EMAIL_QA_TOKEN_BUDGET", "3000"))
+# "hybrid" (vector + BM25) or "mmr" (vector only)
+QA_RETRIEVER = os.getenv("QA_RETRIEVER", "hybrid")
+QA_RETRIEVAL_K = int(os.getenv("QA_RETRIEVAL_K", "5"))  # chunks given to the QA chain
+# per ranking, before fusion
+QA_RETRIEVAL_CANDIDATES = int(os.getenv("QA_RETRIEVAL_CANDIDATES", "20"))
+
+# Gmail API
+GMAIL_API_ROOT = os.getenv("GMAIL_API_ROOT", "https://gmail.googleapis.com/")
+# async pool per process
+GMAIL_MAX_CONNECTIONS = int(os.getenv("GMAIL_MAX_CONNECTIONS", "50"))
+# users' credentials/services kept per process
+GMAIL_CLIENT_CACHE_SIZE = int(os.getenv("GMAIL_CLIENT_CACHE_SIZE", "256"))
+# refresh this many seconds before expiry
+GMAIL_TOKEN_REFRESH_MARGIN = int(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", "300"))
+# messages.get calls per batch request
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+GMAIL_SYNC_MODE = os.getenv("GMAIL_SYNC_MODE", "history")  # "history" or "list"
+# messages per list page / ingest batch
+GMAIL_PAGE_SIZE = int(os.getenv("GMAIL_PAGE_SIZE", "100"))
+# "full" or "raw" (whole MIME message, parsed locally)
+GMAIL_FETCH_FORMAT = os.getenv("GMAIL_FETCH_FORMAT", "full")
+if GMAIL_FETCH_FORMAT not in ("full", "raw"):
+    # "metadata" has no body: every message would be stored as empty and never refetched
+    raise ImproperlyConfigured(
+        f"GMAIL_FETCH_FORMAT must be 'full' or 'raw', not {GMAIL_FETCH_FORMAT!r}"
+    )
+# batches buffered between ingest stages
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))
+
+# Gmail quota (see config/gmail_quota.py); a rate of 0 turns pacing off
+# Gmail's per-user limit
+GMAIL_USER_UNITS_PER_SECOND = float(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "250"))
+# this process's share of the project's 1.2M/min
+GMAIL_PROCESS_UNITS_PER_SECOND = float(
+    os.getenv("GMAIL_PROCESS_UNITS_PER_SECOND", "20000")
+)
+# calls in flight per user before adapting
+GMAIL_CONCURRENCY_START = int(os.getenv("GMAIL_CONCURRENCY_START", "4"))
+GMAIL_CONCURRENCY_MAX = int(os.getenv("GMAIL_CONCURRENCY_MAX", "16"))
+# seconds; slower calls shrink the concurrency limit
+GMAIL_LATENCY_TARGET = float(os.getenv("GMAIL_LATENCY_TARGET", "2.0"))
+# retries for 429, rate-limit 403, 5xx, dropped connections
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "5"))
+# backoff doubles per retry, jittered
+GMAIL_RETRY_BASE_SECONDS = float(os.getenv("GMAIL_RETRY_BASE_SECONDS", "0.5"))
+
+# Background sync jobs
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "2"))  # worker threads per process
+SYNC_JOB_POLL_SECONDS = float(os.getenv("SYNC_JOB_POLL_SECONDS", "2"))
+# requeue after no heartbeat
+SYNC_JOB_STALE_SECONDS = int(os.getenv("SYNC_JOB_STALE_SECONDS", "300"))
+SYNC_JOB_MAX_ATTEMPTS = int(os.getenv("SYNC_JOB_MAX_ATTEMPTS", "3"))
+# reuse a sync that finished this recently
+SYNC_FRESH_SECONDS = int(os.getenv("SYNC_FRESH_SECONDS", "30"))
+
+# Sync state (processed message IDs, history checkpoints, resume cursors)
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "email_cache/sync_state.sqlite3")
+
+# Full-text index (per-user SQLite FTS5 tables used by the hybrid retriever)
+FULLTEXT_INDEX_PATH = os.getenv("FULLTEXT_INDEX_PATH", "email_cache/fulltext.sqlite3")
+
+# Embeddings
+# "openai" or "onnx" (local CPU model)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+ONNX_EMBEDDING_MODEL = os.getenv(
+    "ONNX_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+# local model files; downloaded from the Hub if empty
+ONNX_EMBEDDING_DIR = os.getenv("ONNX_EMBEDDING_DIR", "")
+# texts per inference call
+ONNX_EMBEDDING_BATCH_SIZE = int(os.getenv("ONNX_EMBEDDING_BATCH_SIZE", "32"))
+ONNX_EMBEDDING_THREADS = int(
+    os.getenv("ONNX_EMBEDDING_THREADS", str(min(4, os.cpu_count() or 1)))
+)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", "email_cache/embeddings.sqlite3"
+)
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+# one queue for all users
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "true").lower() == "true"
+# LangChain's OpenAI chunk size
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "1000"))
+# OpenAI allows 300k per request
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "250000"))
+# flush a partial batch after this
+EMBEDDING_BATCH_WAIT_MS = int(os.getenv("EMBEDDING_BATCH_WAIT_MS", "20"))
+# batches in flight
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+
+# Logging (per-request debug output only when LOG_LEVEL=DEBUG; development defaults to it)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO" if ENVIRONMENT == "production" else "DEBUG")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"}
+    },
+    "handlers": {"console": {"class": "logging.StreamHandler", "formatter": "plain"}},
+    "loggers": {
+        "config": {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False}
+    },
+}
+
+# Metrics and tracing
+# stage histograms on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# spans over OTLP (OTEL_EXPORTER_OTLP_ENDPOINT)
+OTEL_TRACING = os.getenv("OTEL_TRACING", "false").lower() == "true"
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "email-assistant")
@@ -0,0 +1,208 @@
+"""Background Gmail sync jobs stored in the Django database.
+
+`enqueue_sync` records a job; a small pool of worker threads in each web
+process claims queued jobs from the table and runs the async mailbox sync on
+its own event loop. No broker is needed: the claim is a conditional UPDATE,
+so several processes can share one queue. A job whose worker stopped sending
+heartbeats is requeued, and the sync resumes from its saved page cursor.
+
+Syncs are single-flight per user: a request while a job is queued or running
+gets that job (a partial unique index makes this hold across processes), and
+one within SYNC_FRESH_SECONDS of a finished sync gets the finished job
+without touching Gmail. The run itself holds the user's `mailbox_lock`, so a
+requeued job never overlaps a worker that is still syncing the mailbox.
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import chroma_storage
+from .credential_store import load_credentials
+from .email_cache import mailbox_lock
+from .fetch_email_async import async_sync_mailbox
+from .gmail_async import AsyncGmail
+from .models import SyncJob
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_ATTEMPTS = 3
+
+_lock = threading.Lock()
+_workers = []
+_stop = threading.Event()
+
+
+class JobProgress:
+    """Records `sync_mailbox` progress on the job row (and doubles as a heartbeat)."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def heartbeat(self):
+        SyncJob.objects.filter(pk=self.job_id).update(heartbeat_at=timezone.now())
+
+    def expect(self, total: int):
+        SyncJob.objects.filter(pk=self.job_id).update(
+            messages_total=total, heartbeat_at=timezone.now()
+        )
+
+    def update(self, stats: dict):
+        SyncJob.objects.filter(pk=self.job_id).update(
+            messages_fetched=stats["messages"],
+            documents_stored=stats["documents"],
+            chunks_embedded=stats["chunks"],
+            tokens_saved=stats["tokens_saved"],
+            heartbeat_at=timezone.now(),
+        )
+
+
+def active_job(user):
+    return SyncJob.objects.filter(user=user, status__in=SyncJob.ACTIVE).first()
+
+
+def fresh_job(user):
+    """The user's last successful sync if it finished within SYNC_FRESH_SECONDS."""
+    if settings.SYNC_FRESH_SECONDS <= 0:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=settings.SYNC_FRESH_SECONDS)
+    return (
+        SyncJob.objects.filter(
+            user=user, status=SyncJob.SUCCEEDED, finished_at__gte=cutoff
+        )
+        .order_by("-finished_at")
+        .first()
+    )
+
+
+def enqueue_sync(user):
+    """Queue a sync for `user` unless one is active or fresh; returns `(job, created)`."""
+    for attempt in range(ENQUEUE_ATTEMPTS):
+        job = active_job(user) or fresh_job(user)
+        if job:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = SyncJob.objects.create(user=user)
+        except IntegrityError:
+            # Another request queued one between our check and insert; it may
+            # have finished (or failed) by now, so look again
+            if attempt == ENQUEUE_ATTEMPTS - 1:
+                raise
+            continue
+        ensure_workers()
+        return job, True
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker stopped heartbeating; fail them after too many tries."""
+    cutoff = timezone.now() - timedelta(seconds=settings.SYNC_JOB_STALE_SECONDS)
+    stale = Q(status=SyncJob.RUNNING) & (
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    SyncJob.objects.filter(stale, attempts__gte=settings.SYNC_JOB_MAX_ATTEMPTS).update(
+        status=SyncJob.FAILED,
+        error="Worker stopped responding",
+        finished_at=timezone.now(),
+    )
+    SyncJob.objects.filter(stale).update(status=SyncJob.QUEUED)
+
+
+def claim_next_job():
+    requeue_stale_jobs()
+    queued = SyncJob.objects.filter(status=SyncJob.QUEUED).order_by("created_at")
+    for job_id in queued.values_list("pk", flat=True)[:10]:
+        now = timezone.now()
+        claimed = SyncJob.objects.filter(pk=job_id, status=SyncJob.QUEUED).update(
+            status=SyncJob.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+            messages_total=None,
+            messages_fetched=0,
+            documents_stored=0,
+            chunks_embedded=0,
+            tokens_saved=0,
+        )
+        if claimed:
+            return SyncJob.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job, loop):
+    user_id = str(job.user_id)
+    logger.info("🔄 Sync job %s started for user %s", job.pk, user_id)
+    try:
+        credentials = load_credentials(user_id, reload=True)
+        if credentials is None:
+            raise RuntimeError("No Gmail credentials; log in with Google again")
+        gmail = AsyncGmail(credentials)
+        progress = JobProgress(job.pk)
+        with mailbox_lock(user_id, on_wait=progress.heartbeat), chroma_storage.in_use(
+            user_id
+        ):
+            mode, stats, removed_ids = loop.run_until_complete(
+                async_sync_mailbox(gmail, user_id, progress=progress)
+            )
+            try:
+                chroma_storage.update_stats(user_id)  # compacts after enough deletes
+            except Exception:
+                logger.exception("Could not update Chroma stats for user %s", user_id)
+    except Exception as exc:
+        logger.exception("Sync job %s failed", job.pk)
+        SyncJob.objects.filter(pk=job.pk).update(
+            status=SyncJob.FAILED,
+            error=str(exc)[:1000],
+            finished_at=timezone.now(),
+        )
+        return
+    SyncJob.objects.filter(pk=job.pk).update(
+        status=SyncJob.SUCCEEDED,
+        mode=mode,
+        messages_fetched=stats["messages"],
+        documents_stored=stats["documents"],
+        chunks_embedded=stats["chunks"],
+        tokens_saved=stats["tokens_saved"],
+        deleted=len(removed_ids),
+        finished_at=timezone.now(),
+    )
+    logger.info("✅ Sync job %s finished: %s %s", job.pk, mode, stats)
+
+
+def worker():
+    loop = asyncio.new_event_loop()
+    try:
+        while not _stop.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job()
+            except Exception:
+                logger.exception("Could not claim a sync job")
+                job = None
+            if job is None:
+                chroma_storage.unload_idle()
+                _stop.wait(settings.SYNC_JOB_POLL_SECONDS)
+                continue
+            run_job(job, loop)
+    finally:
+        loop.close()
+        close_old_connections()
+
+
+def ensure_workers():
+    """Start this process's worker threads on first use."""
+    with _lock:
+        if _workers:
+            return
+        for i in range(settings.SYNC_WORKERS):
+            thread = threading.Thread(
+                target=worker, name=f"sync-worker-{i}", daemon=True
+            )
+            thread.start()
+            _workers.append(thread)
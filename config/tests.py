@@ -0,0 +1,53 @@
+import contextlib
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+
+from . import sync_jobs
+from .models import SyncJob
+
+
+@mock.patch.object(sync_jobs, "ensure_workers")
+class EnqueueSyncRaceTests(TestCase):
+    """Another request's job wins the insert and finishes before we look again."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="race@example.com")
+
+    @contextlib.contextmanager
+    def lose_insert_to(self, status):
+        """Fail our insert; the winner's job shows up, already `status`, after it."""
+        create, active_job = SyncJob.objects.create, sync_jobs.active_job
+        lost = []
+
+        def competing_create(**kwargs):
+            if not lost:
+                lost.append(True)
+                raise IntegrityError("one_active_sync_job_per_user")
+            return create(**kwargs)
+
+        def competing_active_job(user):
+            if lost and not SyncJob.objects.filter(user=user).exists():
+                create(user=user, status=status, finished_at=timezone.now())
+            return active_job(user)
+
+        with mock.patch.object(sync_jobs, "active_job", competing_active_job):
+            with mock.patch.object(SyncJob.objects, "create", competing_create):
+                yield
+
+    def test_returns_the_competing_job_once_it_succeeded(self, ensure_workers):
+        with self.lose_insert_to(SyncJob.SUCCEEDED):
+            job, created = sync_jobs.enqueue_sync(self.user)
+        self.assertFalse(created)
+        self.assertEqual(job.status, SyncJob.SUCCEEDED)
+        ensure_workers.assert_not_called()
+
+    def test_queues_a_new_job_once_the_competing_one_failed(self, ensure_workers):
+        with self.lose_insert_to(SyncJob.FAILED):
+            job, created = sync_jobs.enqueue_sync(self.user)
+        self.assertTrue(created)
+        self.assertEqual(job.status, SyncJob.QUEUED)
+        ensure_workers.assert_called_once()
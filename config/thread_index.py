@@ -0,0 +1,243 @@
+"""Thread listing for a user's synced mail.
+
+Ingest records an `IndexedMessage` row for every stored message, so listing
+the inbox is an indexed query ordered by date: no query embedding and no
+vector search. Full bodies are read back from Chroma per thread with a
+metadata filter.
+"""
+
+import base64
+import json
+import logging
+
+from django.db.models import Max, Q
+from django.utils.html import escape
+
+from .chroma_storage import in_use, user_collection
+from .models import ChromaCollection, IndexedMessage
+
+logger = logging.getLogger(__name__)
+
+THREADS_PER_PAGE = 50
+MAX_THREADS_PER_PAGE = 200
+SNIPPET_CHARS = 300
+INDEX_FIELDS = ["thread_id", "internal_date", "subject", "sender", "labels", "snippet"]
+
+_backfilled = set()  # users whose backfill is recorded; listings skip the lookup
+
+
+def index_entry(document, snippet: str = "") -> dict:
+    """Index fields for a message Document built by `message_to_document`."""
+    meta = document.metadata
+    return {
+        "message_id": meta["message_id"],
+        "thread_id": meta.get("thread_id", ""),
+        "internal_date": meta.get("date", 0),
+        "subject": meta.get("subject", ""),
+        "sender": meta.get("from", ""),
+        "labels": meta.get("labels", ""),
+        "snippet": (snippet or document.page_content)[:SNIPPET_CHARS],
+    }
+
+
+def index_messages(user_id: str, entries) -> None:
+    rows = [IndexedMessage(user_id=user_id, **entry) for entry in entries]
+    if rows:
+        IndexedMessage.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["user", "message_id"],
+            update_fields=INDEX_FIELDS,
+        )
+
+
+def remove_messages(user_id: str, message_ids) -> None:
+    IndexedMessage.objects.filter(
+        user_id=user_id, message_id__in=list(message_ids)
+    ).delete()
+
+
+def update_labels(user_id: str, labels_by_id) -> None:
+    rows = list(
+        IndexedMessage.objects.filter(
+            user_id=user_id, message_id__in=list(labels_by_id)
+        )
+    )
+    for row in rows:
+        row.labels = ",".join(sorted(labels_by_id[row.message_id]))
+    IndexedMessage.objects.bulk_update(rows, ["labels"])
+
+
+def encode_cursor(latest: int, thread_id: str) -> str:
+    raw = json.dumps([latest, thread_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of `encode_cursor`; raises ValueError for anything else."""
+    try:
+        latest, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+    return int(latest), str(thread_id)
+
+
+def list_threads(
+    user_id: str, cursor: str | None = None, limit: int = THREADS_PER_PAGE
+):
+    """One page of threads, newest activity first.
+
+    Returns `{"threads", "next_cursor", "stored"}`; pass `next_cursor` back
+    to get the following page. Raises ValueError for a bad cursor.
+    """
+    limit = max(1, min(limit, MAX_THREADS_PER_PAGE))
+    messages = IndexedMessage.objects.filter(user_id=user_id)
+    threads = (
+        messages.values("thread_id")
+        .annotate(latest=Max("internal_date"))
+        .order_by("-latest", "-thread_id")
+    )
+    if cursor:
+        latest, thread_id = decode_cursor(cursor)
+        threads = threads.filter(
+            Q(latest__lt=latest) | Q(latest=latest, thread_id__lt=thread_id)
+        )
+    page = list(threads[: limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1]["latest"], page[-1]["thread_id"])
+
+    emails_by_thread = {row["thread_id"]: [] for row in page}
+    for msg in messages.filter(thread_id__in=list(emails_by_thread)).order_by(
+        "internal_date"
+    ):
+        emails_by_thread[msg.thread_id].append(
+            {
+                "message_id": msg.message_id,
+                "subject": msg.subject,
+                "from": msg.sender,
+                "date": msg.internal_date,
+                "labels": msg.labels.split(",") if msg.labels else [],
+                "snippet": escape(msg.snippet).replace("\n", "<br>"),
+            }
+        )
+    return {
+        "threads": [
+            {
+                "thread_id": row["thread_id"],
+                "latest": row["latest"],
+                "emails": emails_by_thread[row["thread_id"]],
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor,
+        "stored": messages.count(),
+    }
+
+
+def _rebuild_bodies(found):
+    """Reassemble each message's text from its (overlapping) chunks.
+
+    Chunks stored before message IDs were recorded cannot be grouped, so
+    each one stands alone under its chunk ID, as the old listing showed them.
+    """
+    chunks_by_message = {}
+    for chunk_id, text, meta in zip(
+        found["ids"], found["documents"], found["metadatas"]
+    ):
+        key = meta.get("message_id") or chunk_id
+        chunks_by_message.setdefault(key, []).append((meta, text))
+    bodies = {}
+    for message_id, chunks in chunks_by_message.items():
+        chunks.sort(key=lambda chunk: chunk[0].get("start_index", 0))
+        body = ""
+        for meta, text in chunks:
+            start = meta.get("start_index")
+            if start is None:
+                body += text
+                continue
+            # The splitter strips the separator between chunks; restore it
+            gap = start - len(body)
+            if gap > 0:
+                body += "\n\n" if gap > 1 else " "
+            else:
+                body = body[:start]
+            body += text
+        bodies[message_id] = (chunks[0][0], body)
+    return bodies
+
+
+def thread_messages(user_id: str, thread_id: str):
+    """Every stored message in `thread_id` with its full body, oldest first."""
+    with in_use(user_id):
+        collection = user_collection(user_id)
+        if collection is None:
+            return []
+        found = collection.get(
+            where={"thread_id": thread_id}, include=["documents", "metadatas"]
+        )
+    emails = [
+        {
+            "message_id": message_id,
+            "subject": meta.get("subject", ""),
+            "from": meta.get("from", ""),
+            "date": meta.get("date", 0),
+            "full_body": escape(body).replace("\n", "<br>"),
+        }
+        for message_id, (meta, body) in _rebuild_bodies(found).items()
+    ]
+    return sorted(emails, key=lambda email: email["date"])
+
+
+def backfill_from_chroma(user_id: str, page_size: int = 1000) -> int:
+    """Index messages stored before the index existed; runs once per user."""
+    if user_id in _backfilled:
+        return 0
+    with in_use(user_id):  # records the user's ChromaCollection row
+        done = ChromaCollection.objects.filter(
+            user_id=user_id, threads_backfilled=True
+        ).exists()
+        indexed = 0 if done else _backfill(user_id, user_collection(user_id), page_size)
+    if not done:
+        ChromaCollection.objects.filter(user_id=user_id).update(threads_backfilled=True)
+    _backfilled.add(user_id)
+    if indexed:
+        logger.info(
+            "🗂️ Backfilled %d messages into the thread index for user %s",
+            indexed,
+            user_id,
+        )
+    return indexed
+
+
+def _backfill(user_id: str, collection, page_size: int) -> int:
+    if collection is None or not collection.count():
+        return 0
+
+    indexed = 0
+    for offset in range(0, collection.count(), page_size):
+        found = collection.get(
+            include=["documents", "metadatas"], limit=page_size, offset=offset
+        )
+        entries = []
+        for message_id, (meta, body) in _rebuild_bodies(found).items():
+            if not meta.get("thread_id"):
+                continue  # the old listing skipped these too
+            # Older chunks start with the "From: / Subject:" header we prepend
+            snippet = body.split("\n\n", 1)[-1] if body.startswith("From: ") else body
+            entries.append(
+                {
+                    "message_id": message_id,
+                    "thread_id": meta.get("thread_id", ""),
+                    "internal_date": meta.get("date", 0),
+                    "subject": meta.get("subject", ""),
+                    "sender": meta.get("from", ""),
+                    "labels": meta.get("labels", ""),
+                    "snippet": snippet[:SNIPPET_CHARS],
+                }
+            )
+        # A message split across pages is upserted twice; the later row wins
+        index_messages(user_id, entries)
+        indexed += len(entries)
+    return indexed
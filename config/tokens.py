@@ -0,0 +1,21 @@
+import functools
+
+import tiktoken
+
+CHARS_PER_TOKEN = 4  # rough average for English text
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:  # unknown model, or the BPE file cannot be downloaded
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count tokens locally, falling back to an estimate when tiktoken is unavailable."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
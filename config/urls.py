@@ -15,18 +15,29 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import logging
+
 from django.contrib import admin
 from django.urls import path
 from .login_email import gmail_login, oauth2callback
-from .fetch_email import load_gmail_threads_to_chroma
-from .views import EmailAssistantView, user_profile
+from .fetch_email_async import aload_gmail_threads_to_chroma, sync_job_status
 from django.http import HttpResponse
-from .views import EmailAssistantView, user_profile, gmail_logout
+from .views import (
+    AsyncEmailAssistantView,
+    metrics,
+    user_profile,
+    thread_list,
+    thread_detail,
+    gmail_logout,
+    email_ask_stream,
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 def home(request):
-    print("Session keys:", list(request.session.keys()))
-    print("Session ID:", request.COOKIES.get("sessionid"))
+    logger.debug("Session keys: %s", list(request.session.keys()))
     return HttpResponse("Welcome to Email Assistant!")
 
 
@@ -35,8 +46,13 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("gmail/login/", gmail_login, name="gmail_login"),
     path("oauth2callback/", oauth2callback, name="oauth2callback"),
-    path("gmail/fetch/", load_gmail_threads_to_chroma, name="fetch_gmail"),
-    path("email/ask/", EmailAssistantView.as_view(), name="email_assistant"),
+    path("gmail/fetch/", aload_gmail_threads_to_chroma, name="fetch_gmail"),
+    path("gmail/sync/<int:job_id>/", sync_job_status, name="sync_job_status"),
+    path("gmail/threads/", thread_list, name="thread_list"),
+    path("gmail/threads/<str:thread_id>/", thread_detail, name="thread_detail"),
+    path("email/ask/", AsyncEmailAssistantView.as_view(), name="email_assistant"),
+    path("email/ask/stream/", email_ask_stream, name="email_assistant_stream"),
     path("user/profile/", user_profile, name="user_profile"),
     path("gmail/logout/", gmail_logout, name="gmail_logout"),
+    path("metrics", metrics, name="metrics"),
 ]
@@ -1,29 +1,37 @@
+import json
 import logging
-from django.http import JsonResponse, HttpRequest
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpRequest, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .email_assistant import build_email_qa_chain_from_chroma
+from .email_assistant import QA_STRATEGIES
+from .credential_store import delete_credentials
+from .fetch_email import get_credentials, list_existing_threads
+from .metrics import CONTENT_TYPE, render
+from .thread_index import THREADS_PER_PAGE, thread_messages
+from .registry import hold_qa_chain
 from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect
-from google.oauth2.credentials import Credentials
 
-# # Set up logger
-# logger = logging.getLogger(__name__)
+logger = logging.getLogger(__name__)
 
 
 def oauth2callback(request):
     return redirect(settings.FRONTEND_REDIRECT_URL)
 
 
-def get_credentials(request):
-    user_id = str(request.user.id)
-    credentials_by_user = request.session.get("credentials_by_user")
-
-    if not credentials_by_user:
-        return None
-
-    credentials_data = credentials_by_user.get(user_id)
-    return Credentials(**credentials_data) if credentials_data else None
+def serialize_sources(source_docs):
+    return [
+        {
+            "subject": doc.metadata.get("subject", ""),
+            "from": doc.metadata.get("from", ""),
+            "preview": doc.page_content[:300],
+        }
+        for doc in source_docs
+    ]
 
 
 class EmailAssistantView(APIView):
@@ -33,6 +41,13 @@ class EmailAssistantView(APIView):
         if not question:
             return Response({"error": "Please provide a question."}, status=400)
 
+        strategy = request.data.get("strategy")
+        if strategy and strategy not in QA_STRATEGIES:
+            return Response(
+                {"error": f"'strategy' must be one of {', '.join(QA_STRATEGIES)}."},
+                status=400,
+            )
+
             # # 1️⃣  Make sure the caller is logged in to **your** app
         if not request.user.is_authenticated:
             return JsonResponse({"error": "Unauthenticated"}, status=401)
@@ -45,48 +60,31 @@ class EmailAssistantView(APIView):
             return JsonResponse({"error": "No Gmail credentials found"}, status=401)
 
         try:
-            qa_chain = build_email_qa_chain_from_chroma(user_id)
-            answer_obj = qa_chain.invoke({"query": question})
-            # ✅ Extract answer + retrieved documents
-            if isinstance(answer_obj, dict):
-                answer = (
-                    answer_obj.get("result") or answer_obj.get("answer") or "No answer."
-                )
-                source_docs = answer_obj.get("source_documents", [])
-            else:
-                print(f"runnign line 58")
-                answer = answer_obj
-                source_docs = []
-
-            # ✅ Optional: Print to console for debugging
-            print("\n🔍 Retrieved Documents:")
-            print(f"\n🔍 Source: ${source_docs}")
-            for i, doc in enumerate(source_docs):
-                print(
-                    f"[{i+1}] {doc.metadata.get('subject', 'No Subject')} - {doc.metadata.get('from', '')}"
-                )
-                print(doc.page_content[:300])
-                print("---")
+            qa, release = hold_qa_chain(user_id)
+            try:
+                result = qa.answer(question, strategy=strategy)
+            finally:
+                release()
+            source_docs = result["source_documents"]
+
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, doc in enumerate(source_docs):
+                    logger.debug(
+                        "🔍 Source [%d] %s - %s\n%s",
+                        i + 1,
+                        doc.metadata.get("subject", "No Subject"),
+                        doc.metadata.get("from", ""),
+                        doc.page_content[:300],
+                    )
 
             return Response(
                 {
-                    "answer": answer,
-                    "sources": [
-                        {
-                            "subject": doc.metadata.get("subject", ""),
-                            "from": doc.metadata.get("from", ""),
-                            "preview": doc.page_content[:300],
-                        }
-                        for doc in source_docs
-                    ],
+                    "answer": result["answer"],
+                    "strategy": result["strategy"],
+                    "llm_calls": result["llm_calls"],
+                    "sources": serialize_sources(source_docs),
                 }
             )
-            # answer = (
-            #     answer_obj["result"]
-            #     if isinstance(answer_obj, dict) and "result" in answer_obj
-            #     else answer_obj
-            # )
-            # return Response({"answer": answer})
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
@@ -94,6 +92,180 @@ class EmailAssistantView(APIView):
         return Response({"message": "POST a JSON body with a 'question' field."})
 
 
+async def _parse_question(request):
+    """Validate an async ask request; returns `(question, strategy, user_id, error)`."""
+    try:
+        body = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return (
+            None,
+            None,
+            None,
+            JsonResponse({"error": "Request body must be JSON."}, status=400),
+        )
+
+    question = body.get("question")
+    if not question:
+        return (
+            None,
+            None,
+            None,
+            JsonResponse({"error": "Please provide a question."}, status=400),
+        )
+    strategy = body.get("strategy")
+    if strategy and strategy not in QA_STRATEGIES:
+        return (
+            None,
+            None,
+            None,
+            JsonResponse(
+                {"error": f"'strategy' must be one of {', '.join(QA_STRATEGIES)}."},
+                status=400,
+            ),
+        )
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, None, None, JsonResponse({"error": "Unauthenticated"}, status=401)
+    if not await sync_to_async(get_credentials)(request):
+        return (
+            None,
+            None,
+            None,
+            JsonResponse({"error": "No Gmail credentials found"}, status=401),
+        )
+    return question, strategy, str(user.id), None
+
+
+class AsyncEmailAssistantView(View):
+    """Async version of EmailAssistantView for ASGI deployments.
+
+    Retrieval and the LLM calls are awaited, so a worker keeps serving other
+    requests while this one waits on OpenAI.
+    """
+
+    async def post(self, request):
+        question, strategy, user_id, error = await _parse_question(request)
+        if error:
+            return error
+
+        try:
+            qa, release = await sync_to_async(hold_qa_chain)(user_id)
+            try:
+                result = await qa.aanswer(question, strategy=strategy)
+            finally:
+                release()
+            return JsonResponse(
+                {
+                    "answer": result["answer"],
+                    "strategy": result["strategy"],
+                    "llm_calls": result["llm_calls"],
+                    "sources": serialize_sources(result["source_documents"]),
+                }
+            )
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+    async def get(self, request):
+        return JsonResponse({"message": "POST a JSON body with a 'question' field."})
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _ReleasingStream:
+    """Streaming content that calls `release` when the response is closed.
+
+    Django closes the response even if the client left before the body was
+    iterated, which an async generator's `finally` would not see.
+    """
+
+    def __init__(self, events, release):
+        self.events = events
+        self.release = release
+
+    def __aiter__(self):
+        return self.events.__aiter__()
+
+    def close(self):
+        self.release()
+
+
+@require_POST
+async def email_ask_stream(request):
+    """Server-Sent Events version of /email/ask/.
+
+    Emits a `sources` event as soon as retrieval finishes, `token` events as
+    the model writes the answer, then `done` (or `error`).
+    """
+    question, strategy, user_id, error = await _parse_question(request)
+    if error:
+        return error
+
+    try:
+        qa, release = await sync_to_async(hold_qa_chain)(user_id)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    async def events():
+        try:
+            async for kind, payload in qa.astream_answer(question, strategy=strategy):
+                if kind == "sources":
+                    yield _sse("sources", serialize_sources(payload))
+                elif kind == "token":
+                    yield _sse("token", {"text": payload})
+                else:
+                    yield _sse("done", payload)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    response = StreamingHttpResponse(
+        _ReleasingStream(events(), release), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # keep proxies from buffering the stream
+    return response
+
+
+@require_GET
+async def thread_list(request):
+    """Page through the user's threads, newest first: `?cursor=<next_cursor>&limit=50`."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Unauthenticated"}, status=401)
+
+    try:
+        limit = int(request.GET.get("limit", THREADS_PER_PAGE))
+        page = await sync_to_async(list_existing_threads)(
+            str(user.id), request.GET.get("cursor"), limit
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'cursor' or 'limit'."}, status=400)
+    return JsonResponse(page)
+
+
+@require_GET
+async def thread_detail(request, thread_id):
+    """Every stored message in one thread, with full bodies."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Unauthenticated"}, status=401)
+
+    emails = await sync_to_async(thread_messages)(str(user.id), thread_id)
+    if not emails:
+        return JsonResponse({"error": "Thread not found"}, status=404)
+    return JsonResponse({"thread_id": thread_id, "emails": emails})
+
+
+@require_GET
+def metrics(request):
+    """Stage latency histograms in the Prometheus text format."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
 def user_profile(request):
     # ✅ Check if Django user is logged in
     if not request.user.is_authenticated:
@@ -108,5 +280,7 @@ def user_profile(request):
 
 
 def gmail_logout(request):
+    if request.user.is_authenticated:
+        delete_credentials(str(request.user.id))
     request.session.flush()
     return JsonResponse({"message": "Logged out successfully."})